@@ -16,20 +16,51 @@ Uses the rich module for text formatting
 Theodor Holmberg aka @egeltorp 2025
 '''
 
+from __future__ import annotations
+
 # --- STANDARD LIBRARY ---
+import copy
+import hashlib
+import io
+import math
+import os
 import random
+import select
+import struct
 import sys
+import threading
 import time
+from array import array
+from bisect import bisect_left
 from collections import deque
+from collections.abc import Sequence
+from contextlib import contextmanager
+from functools import partial
+from queue import Empty, Full, Queue
 
 # --- RICH --- 
-from rich.console import Console
-from rich.table import Table
-from rich.text import Text
-from rich import box
-from rich.panel import Panel
-from rich.columns import Columns
-from rich.align import Align
+# Imported on first use by load_rich(), so importing WumpusGame for headless play never loads rich
+RICH_NAMES = ("Console", "Table", "Text", "box", "Panel", "Columns", "Align", "Segment", "Segments")
+
+def load_rich():
+    global Console, Table, Text, box, Panel, Columns, Align, Segment, Segments
+    if "Segments" in globals():
+        return
+    from rich.console import Console
+    from rich.table import Table
+    from rich.text import Text
+    from rich import box
+    from rich.panel import Panel
+    from rich.columns import Columns
+    from rich.align import Align
+    from rich.segment import Segment, Segments
+
+# Wumpus.Panel etc. from outside the module load rich when first accessed
+def __getattr__(name: str):
+    if name in RICH_NAMES:
+        load_rich()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # -- TITLE --
 import title_print as Splash
@@ -44,13 +75,27 @@ import title_print as Splash
 # PARAMETERS
 SEED = random.randrange(1, 1000)
 
+# Derives a new 64-bit seed from a seed and labels, e.g. derive_seed(SEED, round_number)
+# Same inputs give the same seed on every machine and Python version
+def derive_seed(seed: int, *labels) -> int:
+    text = ":".join(str(part) for part in (seed, *labels))
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "big")
+
+# Game parameters for each difficulty, keyed by menu letter [E/N/H]
+DIFFICULTIES = {
+    "E": {"num_rooms": 15, "pit_rate": 0.1, "bat_rate": 0.2, "starting_arrows": 6, "wumpus_chases": False, "wumpuses": 1},
+    "N": {"num_rooms": 20, "pit_rate": 0.2, "bat_rate": 0.3, "starting_arrows": 5, "wumpus_chases": False, "wumpuses": 1},
+    "H": {"num_rooms": 30, "pit_rate": 0.25, "bat_rate": 0.35, "starting_arrows": 3, "wumpus_chases": True, "wumpuses": 1},
+}
+
+# Every difficulty with a horde of wumpuses instead of one Wumpus (--wumpuses), same keys as DIFFICULTIES
+def horde_difficulties(wumpuses: int) -> dict:
+    return {label: dict(params, wumpuses = wumpuses) for label, params in DIFFICULTIES.items()}
+
 def run_game(ui, game):
-    # SETUP
-    game.random_seed()
-    game.generate_rooms()
-    game.connect_rooms()
-    game.place_hazards()
-    game.place_player()
+    # SETUP, unless the game comes set up from a CavePool
+    if not game.rooms:
+        game.setup()
 
     # RUN GAME TURNS UNTIL END
     while not game.is_over(ui):
@@ -63,34 +108,420 @@ def run_game(ui, game):
     if game.check_game_state(ui) == "lose":
         ui.show_result("lose")
 
+# Plays rounds until the player declines another one or input ends (EOF), returns the rounds played
+# recorder: optional ReplayWriter, caves: optional CavePool, wumpuses: optional horde size for every difficulty
+def play_session(ui, seed: int = SEED, recorder = None, caves = None, wumpuses: int = None) -> int:
+    round_number = 0
+    try:
+        # Show Welcome and Intro-text
+        ui.show_welcome()
+
+        while True:
+            # Choose difficulty, returns a dict with chosen parameters
+            params = ui.choose_difficulty()
+            if wumpuses is not None:
+                params = dict(params, wumpuses = wumpuses)
+
+            # Create a new instance of the WumpusGame, every round gets its own cave
+            if caves is not None:
+                game = caves.get(params, seed = derive_seed(seed, round_number))
+            else:
+                game = WumpusGame(**params, seed = derive_seed(seed, round_number))
+            game.recorder = recorder
+            game.metrics = ui.metrics
+            round_number += 1
+
+            # Run the full game loop
+            run_game(ui, game)
+
+            # Check if the user wants to play again, if YES: restart loop and run again
+            answer = ui.input("[bold white]Play again? [[green]Y[/green]/[red]N[/red]]: [/bold white]\n", "again").strip().upper()
+            if answer != "Y":
+                break
+    except EOFError:
+        pass
+    if recorder is not None:
+        recorder.finish()
+    ui.print("[bold red]Goodbye![/bold red]\n")
+    ui.timeline.play()
+    return round_number
+
 # Main function initializing the program
-def main():
-    Splash.main()
+# speed: animation speed factor, see animation_speed()
+# record: optional replay file, every round is appended to it (see R E P L A Y S)
+# pool: caves kept ready per difficulty by a background CavePool, 0 sets up every cave when the round starts
+# script: optional command stream (a file or stdin), every prompt is answered from it, see ScriptedTextUI
+# wumpuses: optional horde size for every difficulty (horde mode), each difficulty's own count by default
+def main(speed: float = 1.0, record: str = None, metrics: str = None, pool: int = 4, script = None, seed: int = SEED,
+         wumpuses: int = None):
+    if script is not None:
+        # The title's ENTER comes from the script too, and nothing clears the screen
+        ui = ScriptedTextUI(script)
+        Splash.main(read = partial(ui.input, kind = "title"), clear = False)
+    else:
+        # Load rich in the background while the title screen waits for ENTER
+        threading.Thread(target=load_rich, daemon=True).start()
+        Splash.main()
+        ui = TextUI(speed = speed)
 
     # Print version number
     print("\nVersion: B-grade | Rich | One-file | Nov 3rd 2025\n")
 
-    # Initialize the TextUI interface
-    ui = TextUI()
+    if metrics:
+        ui.metrics = Metrics()
+
+    recorder = ReplayWriter(open(record, "ab")) if record else None
+    difficulties = DIFFICULTIES if wumpuses is None else horde_difficulties(wumpuses)
+    caves = CavePool(difficulties, size = pool, seed = seed).start() if pool else None
+    try:
+        play_session(ui, seed, recorder, caves, wumpuses)
+    finally:
+        if recorder is not None:
+            recorder.finish()
+            recorder.file.close()
+
+    if caves is not None:
+        caves.close()
+    if metrics:
+        if caves is not None:
+            ui.metrics.merge(caves.metrics)
+        ui.metrics.export(metrics)
+
+# ==============================================================
+#                      A N I M A T I O N
+# ==============================================================
+# Output is queued as frames on a Timeline and played before the next prompt,
+# so game logic never waits on a pause
+# WUMPUS_ANIMATIONS=off|fast|<speed factor> or --no-anim / --fast / --anim-speed
+# ==============================================================
+
+FAST_ANIMATIONS = 4.0
+
+# Resolves the animation speed factor: the CLI value if given, else $WUMPUS_ANIMATIONS, else 1
+# 0 disables all pauses, 2 plays them twice as fast
+def animation_speed(value: float = None) -> float:
+    if value is not None:
+        return max(0.0, float(value))
+    setting = os.environ.get("WUMPUS_ANIMATIONS", "").strip().lower()
+    if setting in ("off", "no", "false", "none"):
+        return 0.0
+    if setting == "fast":
+        return FAST_ANIMATIONS
+    try:
+        return max(0.0, float(setting))
+    except ValueError:
+        return 1.0
+
+# Waits up to timeout seconds for the user to press ENTER (any key on Windows), True if they did
+def wait_for_keypress(timeout: float) -> bool:
+    if not sys.stdin.isatty():
+        time.sleep(timeout)
+        return False
+    if os.name == "nt":
+        import msvcrt
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            if msvcrt.kbhit():
+                msvcrt.getwch()
+                return True
+            time.sleep(0.01)
+        return False
+    readable, _, _ = select.select([sys.stdin], [], [], timeout)
+    if readable:
+        sys.stdin.readline()
+        return True
+    return False
+
+# Class for a queue of output frames, each an action (or None) followed by a pause in seconds
+class Timeline:
+    def __init__(self, speed: float = 1.0):
+        self.speed = speed
+        self.frames = deque()
+
+    def add(self, action, seconds: float = 0.0):
+        self.frames.append((action, seconds))
+
+    def pause(self, seconds: float):
+        self.frames.append((None, seconds))
+
+    # Seconds to wait for a pause at the current speed
+    def delay(self, seconds: float) -> float:
+        if self.speed <= 0:
+            return 0.0
+        return seconds / self.speed
+
+    # Plays all queued frames in order, a keypress during a pause skips the remaining pauses
+    # Returns True if a keypress skipped them
+    def play(self) -> bool:
+        skipping = False
+        while self.frames:
+            action, seconds = self.frames.popleft()
+            if action is not None:
+                action()
+            delay = 0.0 if skipping else self.delay(seconds)
+            if delay > 0:
+                sys.stdout.flush()
+                skipping = wait_for_keypress(delay)
+        sys.stdout.flush()
+        return skipping
 
-    # Show Welcome and Intro-text
-    ui.show_welcome()
+# ==============================================================
+#                      P R O F I L I N G
+# ==============================================================
+# Named counters and latency histograms per session, exported as JSON
+# or Prometheus text. WumpusGame, TextUI and GameSession time their
+# phases only when their metrics attribute is set, otherwise a turn
+# pays one "is None" check per phase
+#
+# Phases: render (show_state), ask (waiting on the UI for an answer),
+# playback and input_wait (TextUI: queued output, then the user),
+# hazards (pit, bats, Wumpus encounter), chase, state, step (one step())
+# ==============================================================
 
-    while True:
-        # Choose difficulty, returns a dict with chosen parameters
-        params = ui.choose_difficulty()
+# Histogram bucket upper bounds in seconds, 1us to 10s
+METRIC_BUCKETS = tuple(float(f"{scale}e{exponent}") for exponent in range(-6, 1) for scale in (1, 2.5, 5)) + (10.0,)
 
-        # Create a new instance of the WumpusGame
-        game = WumpusGame(**params, seed = SEED)
+# Class for the counters and histograms of one session
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}    # name -> [count per bucket (last one is +Inf), sum of seconds]
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, seconds: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = [[0] * (len(METRIC_BUCKETS) + 1), 0.0]
+        histogram[0][bisect_left(METRIC_BUCKETS, seconds)] += 1
+        histogram[1] += seconds
+
+    # Times a block: with metrics.timer("name"): ...
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    # Adds another session's counts, e.g. into a server-wide total
+    def merge(self, other: "Metrics"):
+        for name, n in other.counters.items():
+            self.count(name, n)
+        for name, (counts, total) in other.histograms.items():
+            histogram = self.histograms.setdefault(name, [[0] * (len(METRIC_BUCKETS) + 1), 0.0])
+            histogram[0] = [a + b for a, b in zip(histogram[0], counts)]
+            histogram[1] += total
+
+    # Upper bound of the bucket holding quantile q (0-1)
+    @staticmethod
+    def quantile(counts: list, q: float) -> float:
+        rank = q * sum(counts)
+        seen = 0
+        for bound, n in zip(METRIC_BUCKETS + (float("inf"),), counts):
+            seen += n
+            if seen >= rank and n:
+                return bound
+        return 0.0
+
+    def to_json(self) -> dict:
+        histograms = {}
+        for name, (counts, total) in self.histograms.items():
+            n = sum(counts)
+            histograms[name] = {
+                "count": n, "sum": total, "mean": total / n if n else 0.0,
+                "p50": self.quantile(counts, 0.50), "p90": self.quantile(counts, 0.90), "p99": self.quantile(counts, 0.99),
+                "buckets": {f"{bound:g}": c for bound, c in zip(METRIC_BUCKETS + (float("inf"),), counts)},
+            }
+        return {"counters": dict(self.counters), "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        lines = []
+        for name, n in sorted(self.counters.items()):
+            lines.append(f"# TYPE wumpus_{name}_total counter")
+            lines.append(f"wumpus_{name}_total {n}")
+        if self.histograms:
+            lines.append("# TYPE wumpus_phase_seconds histogram")
+        for name, (counts, total) in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, n in zip(METRIC_BUCKETS + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f'wumpus_phase_seconds_bucket{{phase="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'wumpus_phase_seconds_sum{{phase="{name}"}} {total}')
+            lines.append(f'wumpus_phase_seconds_count{{phase="{name}"}} {cumulative}')
+        return "\n".join(lines) + "\n"
+
+    # Writes JSON for a .json path, Prometheus text for anything else
+    def export(self, path: str):
+        import json
+        with open(path, "w") as file:
+            if path.endswith(".json"):
+                json.dump(self.to_json(), file, indent=1)
+            else:
+                file.write(self.to_prometheus())
 
-        # Run the full game loop
-        run_game(ui, game)
+# ==============================================================
+#                      R E N D E R I N G
+# ==============================================================
+# Panels are rendered to lines once and cached, the panel row of a turn
+# is redrawn in place (a live region) while it is still on screen, and
+# only the lines that changed are written
+# ==============================================================
 
-        # Check if the user wants to play again, if YES: restart loop and run again
-        answer = ui.console.input("[bold white]Play again? [[green]Y[/green]/[red]N[/red]]: [/bold white]\n").strip().upper()
-        if answer != "Y":
-            ui.console.print("[bold red]Goodbye![/bold red]\n")
-            break
+# Class for a console file that counts the bytes and newlines written through it
+class OutputCounter:
+    def __init__(self, file):
+        self.file = file
+        self.bytes = 0
+        self.lines = 0
+
+    def write(self, text: str) -> int:
+        self.bytes += len(text.encode("utf-8", "replace"))
+        self.lines += text.count("\n")
+        return self.file.write(text)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+# Class for drawing rows of panels side by side from cached rendered lines
+class PanelRenderer:
+    GAP = 1
+    MIN_COLUMN = 36    # narrower columns would wrap the status lines out of the panel
+    CACHE_SIZE = 64
+
+    def __init__(self, console: Console):
+        self.console = console
+        self.cache = {}           # panel -> (console width, column width, rendered lines)
+        self.drawn = None         # ANSI lines of the row on screen
+        self.drawn_width = 0
+        self.drawn_at = 0         # output line count right after the row was drawn
+        self.widths = {}          # panel with expand=False -> its measured width
+
+        # Statistics
+        self.draws = 0
+        self.in_place = 0
+        self.cache_hits = 0
+        self.render_seconds = 0.0
+        self.bytes = 0
+
+    # Lines counted by the console file, None if it isn't counting or isn't a terminal
+    def position(self):
+        if not self.console.is_terminal:
+            return None
+        return getattr(self.console.file, "lines", None)
+
+    # Called when something outside the console moved the cursor, the row can no longer be found
+    def forget(self):
+        self.drawn = None
+
+    # Renders a panel at the given width, a panel object is rendered once per width
+    def render(self, panel, width: int) -> list:
+        cached = self.cache.get(panel)
+        if cached is not None and cached[0] == self.console.width and cached[1] == width:
+            self.cache[panel] = self.cache.pop(panel)    # most recently used last
+            self.cache_hits += 1
+            return cached[2]
+        lines = self.console.render_lines(panel, self.console.options.update_width(width), pad=True)
+        if len(self.cache) >= self.CACHE_SIZE:
+            del self.cache[next(iter(self.cache))]
+        self.cache[panel] = (self.console.width, width, lines)
+        return lines
+
+    # Width of a panel with expand=False, measured once per panel
+    def measure(self, panel) -> int:
+        width = self.widths.get(panel)
+        if width is None:
+            width = self.console.measure(panel).maximum
+            if len(self.widths) >= self.CACHE_SIZE:
+                del self.widths[next(iter(self.widths))]
+            self.widths[panel] = width
+        return width
+
+    # Panels as ANSI lines in one row, or stacked if they don't fit
+    # Panels with expand=False keep their own width, the others share the rest equally
+    def compose(self, panels: list) -> list:
+        console = self.console
+        total = console.width
+        fixed = [None if getattr(panel, "expand", True) else self.measure(panel) for panel in panels]
+        shared = fixed.count(None)
+        free = total - self.GAP * (len(panels) - 1) - sum(width for width in fixed if width is not None)
+        width = free // shared if shared else 0
+        if free < 0 or (shared and width < self.MIN_COLUMN):
+            rows = [[self.render(panel, total)] for panel in panels]
+        else:
+            rows = [[self.render(panel, width if fixed_width is None else fixed_width) for panel, fixed_width in zip(panels, fixed)]]
+
+        segments = []
+        gap = Segment(" " * self.GAP)
+        for blocks in rows:
+            for i in range(max(len(block) for block in blocks)):
+                for column, block in enumerate(blocks):
+                    if column:
+                        segments.append(gap)
+                    if i < len(block):
+                        segments.extend(block[i])
+                segments.append(Segment.line())
+        return self.lines(segments)
+
+    # Segments of rendered rows as ANSI lines
+    def lines(self, segments: list) -> list:
+        with self.console.capture() as capture:
+            self.console.print(Segments(Segment.simplify(segments)), end="")
+        return capture.get().splitlines()
+
+    # Draws the panels below the output, or over the previous row if it is still on screen
+    def draw(self, panels: list):
+        start = time.perf_counter()
+        lines = self.compose(panels)
+        file = self.console.file
+        here = self.position()
+
+        if (here is not None and self.drawn is not None and len(self.drawn) == len(lines)
+                and self.drawn_width == self.console.width and here - self.drawn_at + len(lines) < self.console.height):
+            # Save the cursor, jump to the first line of the row, rewrite the changed lines, restore the cursor
+            up = here - self.drawn_at + len(lines)
+            out = ["\0337", f"\033[{up}F"]
+            skipped = 0
+            for old, new in zip(self.drawn, lines):
+                if old == new:
+                    skipped += 1
+                    continue
+                if skipped:
+                    out.append(f"\033[{skipped}E")
+                    skipped = 0
+                out.append(f"\033[2K{new}\r\033[1E")
+            out.append("\0338")
+            if len(out) > 3:
+                written = "".join(out)
+                file.write(written)
+                self.bytes += len(written.encode("utf-8", "replace"))
+            self.in_place += 1
+        else:
+            written = "\n".join(lines) + "\n"
+            file.write(written)
+            self.bytes += len(written.encode("utf-8", "replace"))
+            here = self.position()
+            self.drawn_at = here if here is not None else 0
+        file.flush()
+
+        self.drawn = lines
+        self.drawn_width = self.console.width
+        self.draws += 1
+        self.render_seconds += time.perf_counter() - start
+
+    # Draws a single full-width renderable from the cache
+    def draw_static(self, panel):
+        start = time.perf_counter()
+        lines = self.render(panel, self.console.width)
+        with self.console.capture() as capture:
+            self.console.print(Segments(Segment.simplify(segment for line in lines for segment in line + [Segment.line()])), end="")
+        written = capture.get()
+        self.console.file.write(written)
+        self.bytes += len(written.encode("utf-8", "replace"))
+        self.render_seconds += time.perf_counter() - start
 
 # ==============================================================
 #                        T E X T   U I
@@ -100,8 +531,17 @@ def main():
 # ==============================================================
 # Class for TextUI interfaces, input/output
 class TextUI:
-    def __init__(self):
-        self.console = Console()
+    def __init__(self, console: Console = None, speed: float = 1.0):
+        load_rich()
+        self.console = console if console is not None else Console(file=OutputCounter(sys.stdout))
+        self.timeline = Timeline(speed)   # all output is queued here and played before the next prompt
+        self.renderer = PanelRenderer(self.console)
+        self.metrics = None    # optional Metrics, output playback and input waits are timed into it
+
+        # Static panels, built once and rendered from the renderer's cache
+        self.actions_panel = None
+        self.difficulties = None
+        self.senses_panels = {}
         
         self.messages = {
             "no_arrows": "You have no arrows left!\n",
@@ -115,20 +555,17 @@ class TextUI:
             "suicide": "[bold red]You killed yourself with the arrow.[/bold red]\n"
         }
     
-    # User chooses difficulty with input letter [E/N/H]
-    def choose_difficulty(self) -> dict:
+    # Builds the panel showing all three difficulties side by side
+    def difficulty_panel(self) -> Panel:
         # Easy difficulty, easier than standard parameters
-        e_dict = {"num_rooms": 15, "pit_rate": 0.1, "bat_rate": 0.2, "starting_arrows": 6, "wumpus_chases": False}
         easy_text = Text.from_markup("Rooms: 15\nPits: 10%\nBats: 20%\nArrows: 6\nWumpus lurks...", justify="center")
         easy_panel = Panel(easy_text, title="[bold green]EASY [E][/bold green]", border_style="green", padding=(1,2))
 
         # Normal difficulty, standard Assignment parameters
-        n_dict = {"num_rooms": 20, "pit_rate": 0.2, "bat_rate": 0.3, "starting_arrows": 5, "wumpus_chases": False}
         normal_text = Text.from_markup("Rooms: 20\nPits: 20%\nBats: 30%\nArrows: 5\nWumpus lurks...", justify="center")
         normal_panel = Panel(normal_text, title="[bold yellow]NORMAL [N][/bold yellow]", border_style="yellow", padding=(1,2))
 
         # Hard difficulty, very difficult, more rooms, less arrows
-        h_dict = {"num_rooms": 30, "pit_rate": 0.25, "bat_rate": 0.35, "starting_arrows": 3, "wumpus_chases": True}
         hard_text = Text.from_markup("Rooms: 30\nPits: 25%\nBats: 35%\nArrows: 3\nWumpus will chase you!", justify="center")
         hard_panel = Panel(hard_text, title="[bold red]HARDOX [H][/bold red]", border_style="red", padding=(1,2))
 
@@ -137,7 +574,43 @@ class TextUI:
 
         # Display columns in one panel
         main_panel = Panel(columns, title="[bold white]DIFFICULTIES[/bold white]", box=box.SIMPLE_HEAD, border_style="white", padding=(1,1))
-        self.console.print(main_panel)
+        return main_panel
+
+    # Queues a console.print call, shown when the timeline plays
+    def print(self, *objects, **kwargs):
+        self.timeline.add(partial(self.console.print, *objects, **kwargs))
+
+    # Plays all queued output and animations, then reads a line from the user
+    # kind names the prompt ("difficulty", "action", "move", ...) for scripted UIs
+    def input(self, prompt, kind: str = "input") -> str:
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        if self.timeline.play():
+            self.renderer.forget()    # the skipping keypress was echoed somewhere on screen
+        if metrics is not None:
+            waiting = time.perf_counter()
+            metrics.observe("playback", waiting - start)
+        answer = self.console.input(prompt)
+        if metrics is not None:
+            metrics.observe("input_wait", time.perf_counter() - waiting)
+
+        # The echoed answer and ENTER moved the cursor down, count it so the panel row can be found
+        file = self.console.file
+        if isinstance(file, OutputCounter):
+            if isinstance(prompt, str):
+                prompt = self.console.render_str(prompt)
+            file.lines += 1 + (prompt.cell_len + len(answer)) // max(1, self.console.width)
+        return answer
+
+    # User chooses difficulty with input letter [E/N/H]
+    def choose_difficulty(self) -> dict:
+        e_dict = dict(DIFFICULTIES["E"])
+        n_dict = dict(DIFFICULTIES["N"])
+        h_dict = dict(DIFFICULTIES["H"])
+        if self.difficulties is None:
+            self.difficulties = self.difficulty_panel()
+        self.timeline.add(partial(self.renderer.draw_static, self.difficulties))
 
         # Ask for difficulty choice
         E = "[bold green]E[/bold green]"
@@ -145,28 +618,37 @@ class TextUI:
         H = "[bold red]H[/bold red]"
         while True:
             choice_text = Text.from_markup(f"Choose a difficulty [{E}/{N}/{H}]: ", style="bold white")
-            choice = self.console.input(choice_text).strip().upper()
+            choice = self.input(choice_text, "difficulty").strip().upper()
             if choice == "E":
                 self.clear_prompt("prompt")
-                self.console.print("You chose [bold green]EASY[/bold green]\n")
+                self.print("You chose [bold green]EASY[/bold green]\n")
                 return e_dict
             if choice == "N":
                 self.clear_prompt("prompt")
-                self.console.print("You chose [bold yellow]NORMAL[/bold yellow]\n")
+                self.print("You chose [bold yellow]NORMAL[/bold yellow]\n")
                 return n_dict
             if choice == "H":
                 self.clear_prompt("prompt")
-                self.console.print("You chose [bold red]HARD[/bold red]\n")
+                self.print("You chose [bold red]HARD[/bold red]\n")
                 return h_dict
             else:
                 self.clear_prompt("prompt")
-                self.console.print("[italic red]Not a valid difficulty![/italic red]\n")
+                self.print("[italic red]Not a valid difficulty![/italic red]\n")
 
     # General method for displaying a text message
     def show_message(self, key: str):
         text = self.messages.get(key)
         text_formatted = Text.from_markup(text)
-        self.console.print(f"{text}")
+        self.print(f"{text}")
+
+    # Displays an event emitted by the game engine (see WumpusGame.emit)
+    def show_event(self, key: str, value=None):
+        if key in ("move", "bat"):
+            self.show_move_transition(value, key)
+        elif key == "arrow":
+            self.shooting_text(value)
+        else:
+            self.show_message(key)
 
     # Displays "senses" based on sense_environment() in WumpusGame
     def display_senses(self, sense_dict: dict) -> Panel:
@@ -180,9 +662,12 @@ class TextUI:
 
         if lines == []:
             lines.append("Nothing special...")
-        if lines:
-            panel = Panel("\n".join(lines), title="[bold yellow]SENSES[/bold yellow]", border_style="yellow", height=6)
-            return panel
+
+        # One panel per combination of senses, so the renderer can reuse its lines
+        key = tuple(lines)
+        if key not in self.senses_panels:
+            self.senses_panels[key] = Panel("\n".join(lines), title="[bold yellow]SENSES[/bold yellow]", border_style="yellow", height=6)
+        return self.senses_panels[key]
     
     # Displays status of player: current room, no. of arrows, nearby rooms
     def display_status(self, current_room_id: int, arrows: int, nearby_rooms: list) -> Panel:
@@ -199,70 +684,69 @@ class TextUI:
         status_panel = Panel("\n".join(lines), title="[bold magenta]STATUS[/bold magenta]", border_style="magenta", height=6)
         return status_panel
     
-        # Takes senses_panel and status_panel with actions_panel and arranges them into three columns 
+    # Takes senses_panel and status_panel with actions_panel and arranges them into three columns 
     def show_panels(self, senses_panel: Panel, status_panel: Panel):
-        # Actions panel
-        actions_panel_content = (
-            "[bold white]What do you want to do?[/bold white]\n"
-            "\n"
-            "[bold magenta][M][/bold magenta] Move\n"
-            "[bold red][S][/bold red] Shoot an arrow"
-        )
-        actions_panel = Panel(actions_panel_content, expand=False, title="[bold white]ACTION[/bold white]", border_style="white", height=6)
+        # Actions panel, the same every turn
+        if self.actions_panel is None:
+            actions_panel_content = (
+                "[bold white]What do you want to do?[/bold white]\n"
+                "\n"
+                "[bold magenta][M][/bold magenta] Move\n"
+                "[bold red][S][/bold red] Shoot an arrow"
+            )
+            self.actions_panel = Panel(actions_panel_content, expand=False, title="[bold white]ACTION[/bold white]", border_style="white", height=6)
 
-        # Print all three panels in three columns
-        self.console.print(Columns([actions_panel, status_panel, senses_panel], equal=True))
+        # Draw all three panels in three columns, over last turn's row while it is on screen
+        self.timeline.add(partial(self.renderer.draw, [self.actions_panel, status_panel, senses_panel]))
 
 
     # Asks user for desired action [M]ove or [S]hoot, returns str
     def ask_action(self) -> str:
         input_text = Text.from_markup("> Move or Shoot ([magenta]M[/magenta]/[red]S[/red]): ", style="bold white")
-        action = self.console.input(input_text).strip().upper()
+        action = self.input(input_text, "action").strip().upper()
         self.clear_prompt("prompt")    
         return action
 
     # Asks user for desired direction for movement, returns str
     def ask_move_direction(self, room_id: int) -> str:
-        self.console.print(f"You are currently in room [bold magenta]{room_id}[/bold magenta].")
+        self.print(f"You are currently in room [bold magenta]{room_id}[/bold magenta].")
         directions = f"[bold magenta][N/E/S/W][/bold magenta]"
         input_text = Text.from_markup(f"> {directions} Direction: ", style="bold white")
-        input = str(self.console.input(input_text).upper().strip())
+        input = str(self.input(input_text, "move").upper().strip())
         return input
     
     # Shows a "moving transition" in the terminal based on movement type
     def show_move_transition(self, new_room_id: int, move_or_bat: str):
         # If it's a bat transport: print bat grab message
         if move_or_bat == "bat":
-            self.console.print("A [red]bat[/red] grabs you!", end="", style="bold italic white")
-            print()
+            self.print("A [red]bat[/red] grabs you!", style="bold italic white")
 
         # Print dots for "movement"
         for _ in range(3):
-            time.sleep(0.3)
-            print(".", end="")
-            print()
-        time.sleep(0.3)
-        self.console.print(f"You are now in room [bold magenta]{new_room_id}[/bold magenta]\n", style="bold white")
-        time.sleep(0.5)
+            self.timeline.pause(0.3)
+            self.print(".")
+        self.timeline.pause(0.3)
+        self.print(f"You are now in room [bold magenta]{new_room_id}[/bold magenta]\n", style="bold white")
+        self.timeline.pause(0.5)
 
     # Asks user for a desired direction for shooting/steering arrow, returns str
     def ask_shoot_direction(self, iteration: int) -> str:
         directions = f"[bold red][N/E/S/W][/bold red]"
         room_order = ["* First shot", "* Curve the shot!", "* Curve it again!"]
-        self.console.print(f"{room_order[iteration]}")
+        self.print(f"{room_order[iteration]}")
         input_text = Text.from_markup(f"> {directions} Direction: ", style="bold white")
-        input = str(self.console.input(input_text).upper().strip())
+        input = str(self.input(input_text, "shoot").upper().strip())
         return input
     
     # Display text for arrow movement
     def shooting_text(self, room_number: int):
         arrow = "[bold red]arrow[/bold red]"
         if room_number == 1:
-            self.console.print(f"The {arrow} enters the first room.\n")
+            self.print(f"The {arrow} enters the first room.\n")
         if room_number == 2:
-            self.console.print(f"The {arrow} enters the second room.\n")
+            self.print(f"The {arrow} enters the second room.\n")
         if room_number == 3:
-            self.console.print(f"The {arrow} enters the third room.\n")
+            self.print(f"The {arrow} enters the third room.\n")
     
     # Shows intro text (if desired by user)
     def show_welcome(self):
@@ -271,14 +755,14 @@ class TextUI:
         no = "[bold red]N[/bold red]"
         prompt = Text.from_markup(f"> SKIP INTRO? [{yes}/{no}]: ", style="bold white")
         while True:
-            skip = self.console.input(prompt).strip().upper()
+            skip = self.input(prompt, "welcome").strip().upper()
             if skip == "Y":
                 self.clear_prompt("prompt")
                 return
             if skip == "N":
                 break
             else:
-                self.console.print(Text.from_markup(f"[bold red]X[/bold red] Input must be {yes} or {no}\n", style="white"))
+                self.print(Text.from_markup(f"[bold red]X[/bold red] Input must be {yes} or {no}\n", style="white"))
 
         # Intro text lines
         lines = [
@@ -306,32 +790,28 @@ class TextUI:
             "> Qapla' and good luck!"
         ]
 
-        # "Animates" each letter during the intro
+        # "Animates" each letter during the intro, a keypress skips to the end
+        write = self.console.file.write
         for line in lines:
             for char in line:
-                print(char, end="")
-                sys.stdout.flush()
-                time.sleep(0.03)
-            print()
-            time.sleep(0.5)
+                self.timeline.add(partial(write, char), 0.03)
+            self.timeline.add(partial(write, "\n"), 0.5)
+        self.timeline.play()
 
     # Displays the result of the game after game is over
     def show_result(self, result: str):
         # Show win result
         if result == "win":
-            time.sleep(1)
-            print(".")
-            time.sleep(1)
-            print(".")
-            time.sleep(1)
-            print(".")
+            for _ in range(3):
+                self.timeline.pause(1)
+                self.print(".")
             win_text = Text.from_markup("[bold green]Huzzah! The ol' Wumpus has been executed by a swift arrow! You win![/bold green]")
-            self.console.print(Panel(win_text, expand=False, border_style="green"))
+            self.print(Panel(win_text, expand=False, border_style="green"))
         
         # Show loss result
         elif result == "lose":
-            time.sleep(1)
-            self.console.print("[bold red]Ouch! You met a grim and quite frankly embarassing fate. Better luck next time bozo![/bold red]")
+            self.timeline.pause(1)
+            self.print("[bold red]Ouch! You met a grim and quite frankly embarassing fate. Better luck next time bozo![/bold red]")
 
     # General method for clearing a user prompt question, makes terminal cleaner
     def clear_prompt(self, to_clear: str):
@@ -339,6 +819,521 @@ class TextUI:
             sys.stdout.write("\033[F")
             sys.stdout.write("\033[K")
             sys.stdout.flush()
+            if isinstance(self.console.file, OutputCounter):
+                self.console.file.lines -= 1
+
+# ==============================================================
+#                     S C R I P T E D   U I
+# ==============================================================
+# The full TextUI, rich rendering included, driven by a command stream
+# instead of the keyboard: python Wumpus.py --script commands.txt (- for stdin)
+# One answer per line, in prompt order: the title's ENTER (an empty line),
+# skip intro Y/N, difficulty, then M/S and directions, Y/N to play again.
+# Lines starting with "#" are comments.
+#
+# Output is plain text at a fixed width, with no animations, colors or
+# cursor escapes. Every prompt is written as one "@kind answer" line and
+# every round ends with an "@result" line, so a transcript splits into
+# prompts and turns with a line match:
+#   @title
+#   @welcome Y
+#   @difficulty H
+#   @action M
+#   @move N
+#   @result lose
+#   @again N
+# The end of the stream is written as "@eof kind" and ends the session.
+# ==============================================================
+
+# Class for a TextUI answering its prompts from a command stream
+# script: a file, a pipe or any iterable of lines, or a callable taking the prompt kind (like ScriptedUI)
+class ScriptedTextUI(TextUI):
+    WIDTH = 120
+
+    def __init__(self, script, file = None):
+        load_rich()
+        console = Console(file=file if file is not None else sys.stdout, width=self.WIDTH,
+                          color_system=None, force_terminal=False, force_interactive=False)
+        super().__init__(console, speed = 0)
+        if callable(script):
+            self.policy = script
+        else:
+            lines = iter(script)
+            self.policy = lambda kind: next(lines)
+        self.prompts = 0
+
+    # Next answer from the script, EOFError at its end like input()
+    def answer(self, kind: str) -> str:
+        try:
+            line = self.policy(kind)
+            while line.startswith("#"):
+                line = self.policy(kind)
+        except StopIteration:
+            self.console.file.write(f"@eof {kind}\n")
+            raise EOFError(f"script ran out of answers at {kind} prompt") from None
+        line = line.rstrip("\r\n")
+        self.console.file.write(f"@{kind} {line}".rstrip() + "\n")
+        self.prompts += 1
+        return line
+
+    # Plays the queued output (no pauses at speed 0), then reads the next answer
+    def input(self, prompt, kind: str = "input") -> str:
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        self.timeline.play()
+        if metrics is not None:
+            waiting = time.perf_counter()
+            metrics.observe("playback", waiting - start)
+        answer = self.answer(kind)
+        if metrics is not None:
+            metrics.observe("input_wait", time.perf_counter() - waiting)
+        return answer
+
+    def show_result(self, result: str):
+        super().show_result(result)
+        self.timeline.add(partial(self.console.file.write, f"@result {result}\n"))
+
+    # No cursor tricks in a transcript
+    def clear_prompt(self, to_clear: str):
+        pass
+
+# ==============================================================
+#                    H E A D L E S S   U I
+# ==============================================================
+# Drop-in replacements for TextUI without console or sleeps
+# Used for simulations, regression tests and benchmarks
+# ==============================================================
+
+# Class for a silent UI, every output method does nothing
+class NullUI:
+    def __init__(self):
+        self.console = None
+
+    def choose_difficulty(self) -> dict:
+        return dict(DIFFICULTIES["N"])
+
+    def show_message(self, key: str):
+        pass
+
+    def show_event(self, key: str, value=None):
+        pass
+
+    def display_senses(self, sense_dict: dict):
+        return None
+
+    def display_status(self, current_room_id: int, arrows: int, nearby_rooms: list):
+        return None
+
+    def show_panels(self, senses_panel, status_panel):
+        pass
+
+    def show_move_transition(self, new_room_id: int, move_or_bat: str):
+        pass
+
+    def shooting_text(self, room_number: int):
+        pass
+
+    def show_welcome(self):
+        pass
+
+    def show_result(self, result: str):
+        pass
+
+    def clear_prompt(self, to_clear: str):
+        pass
+
+    # A silent UI has nobody to ask, behaves like input() at end of file
+    def answer(self, kind: str) -> str:
+        raise EOFError(f"no answer for {kind} prompt")
+
+    def ask_action(self) -> str:
+        return self.answer("action")
+
+    def ask_move_direction(self, room_id: int) -> str:
+        return self.answer("move")
+
+    def ask_shoot_direction(self, iteration: int) -> str:
+        return self.answer("shoot")
+
+# Class for a silent UI answering prompts from a script
+# answers: iterable of strings ("M", "N", ...) or a callable taking the prompt kind
+class ScriptedUI(NullUI):
+    def __init__(self, answers):
+        super().__init__()
+        if callable(answers):
+            self.policy = answers
+        else:
+            script = iter(answers)
+            self.policy = lambda kind: next(script)
+
+    def answer(self, kind: str) -> str:
+        try:
+            return self.policy(kind)
+        except StopIteration:
+            raise EOFError(f"script ran out of answers at {kind} prompt") from None
+
+# Returns a policy for ScriptedUI that answers every prompt at random
+def random_policy(seed: int = None):
+    rng = random.Random(seed)
+    def policy(kind: str) -> str:
+        if kind == "action":
+            return rng.choice("MS")
+        return rng.choice("NESW")
+    return policy
+
+# Plays one full game without console, returns the finished WumpusGame
+# policy: callable(game) returning answers for ScriptedUI, random answers by default
+def play_headless(params: dict, seed: int, policy = None):
+    game = WumpusGame(**params, seed = seed)
+    if policy is None:
+        answers = random_policy(derive_seed(seed, "policy"))
+    else:
+        answers = policy(game)
+    run_game(ScriptedUI(answers), game)
+    return game
+
+# Plays many headless games concurrently on a thread pool, one game per seed
+# Every game owns its random generator, so results match a serial run in the order of seeds
+def play_many(params: dict, seeds: list, policy = None, workers: int = 8) -> list:
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        return list(pool.map(lambda seed: play_headless(params, seed, policy), seeds))
+
+# ==============================================================
+#                          S O L V E R
+# ==============================================================
+# Belief-state player: combines the senses of every visited room into
+# bitsets indexed by room_id (bit r is room r) and picks the move or shot
+# with the best odds. It sees only what a player sees: the current room
+# and its tunnels, the senses, the arrows left and the turn's events
+# Used as a hint engine and as the reference policy for simulations
+# ==============================================================
+
+# Number of rooms in a bitset, int.bit_count() needs Python 3.10
+popcount = getattr(int, "bit_count", None) or (lambda mask: bin(mask).count("1"))
+
+# Every arrow steering, "NNN" to "WWW"
+ARROW_SHOTS = [a + b + c for a in "NESW" for b in "NESW" for c in "NESW"]
+
+# Class for the belief over hazard locations in one WumpusGame
+class Solver:
+    SHOOT_ODDS = 0.5    # shoot when the arrow hits the Wumpus with at least this probability
+    BAT_RISK = 0.1      # bats don't kill, but waste a turn and may drop the player anywhere
+    CHASE_ODDS = 0.05   # with arrows to spare, shoot at a chasing Wumpus still on its way with this probability
+    TURN_BACK = 0.25    # chance that an arrow steered blindly out of a neighbor flies back into the player's room
+
+    def __init__(self, game):
+        self.game = game
+        n = game.num_rooms
+        self.all_rooms = (1 << n) - 1
+        self.pit_count = int(n * game.pit_rate)
+        self.bat_count = int(n * game.bat_rate)
+
+        self.tunnels = {}                   # room -> its four neighbors, for rooms the player has stood in
+        self.no_pit = 0                     # rooms known to be free of a hazard
+        self.no_bats = 0
+        self.no_wumpus = 0
+        self.pits = 0                       # rooms known to hold a hazard
+        self.bats = 0
+        self.pit_clues = []                 # masks of neighbors around a breeze, one of them has a pit
+        self.bat_clues = []
+        self.wumpus_mask = self.all_rooms   # the Wumpus is in one of these rooms, in a horde: rooms that may hold one
+        self.wumpus_clues = []              # in a horde, masks around a smell: one of these rooms holds a Wumpus
+        self.wumpuses = game.wumpuses       # Wumpuses left, each hit shows as a wumpus_hit event
+        self.smelled = False
+        self.nearby = 0                     # neighbors of the current room
+        self.shots = {}                     # room -> shot_masks(room)
+        self.last_shot = []
+        self.observed_turn = -1
+
+        self.decisions = 0
+        self.odds = 1.0                     # survival chance of the last move, or hit chance of the last shot
+
+    # Reads the current turn into the belief, once per turn
+    def observe(self):
+        game = self.game
+        if game.turns == self.observed_turn:
+            return
+        self.observed_turn = game.turns
+
+        # Events of the last step
+        entered = None
+        for key, value in game.events:
+            if key == "move":
+                entered = value
+            elif key == "bat" and entered is not None:
+                self.bats |= 1 << entered
+            elif key == "arrow_miss" and not game.wumpus_chases:
+                for room in self.last_shot:
+                    self.no_wumpus |= 1 << room
+            elif key == "wumpus_hit":
+                self.wumpuses -= 1
+                self.wumpus_clues = []      # the smells may have come from the Wumpus just shot
+
+        # Standing here alive and not carried off: no pit, bats or Wumpus
+        room = game.player.current_room.room_id
+        here = 1 << room
+        neighbors = tuple(nearby.room_id for nearby in game.player.current_room.connected_rooms)
+        self.tunnels[room] = neighbors
+        self.no_pit |= here
+        self.no_bats |= here
+        self.no_wumpus |= here
+
+        # Senses, a sense points at one of the neighbors, no sense clears them all
+        nearby = 0
+        for neighbor in neighbors:
+            nearby |= 1 << neighbor
+        self.nearby = nearby
+        senses = game.sense_environment()
+        if senses["pit"]:
+            self.pit_clues.append(nearby)
+        else:
+            self.no_pit |= nearby
+        if senses["bats"]:
+            self.bat_clues.append(nearby)
+        else:
+            self.no_bats |= nearby
+        # With more than one Wumpus left a smell only says that one of them is next door
+        self.smelled = senses["wumpus"]
+        horde = self.wumpuses > 1
+        if game.wumpus_chases:
+            # A chasing Wumpus moves every turn, only this turn's smell counts
+            self.no_wumpus = here
+            self.wumpus_clues = []
+            if not self.smelled:
+                self.wumpus_mask = self.all_rooms & ~nearby
+            else:
+                self.wumpus_mask = self.all_rooms if horde else nearby
+        elif self.smelled:
+            if not horde:
+                self.wumpus_mask &= nearby
+        else:
+            self.no_wumpus |= nearby
+        self.wumpus_mask &= ~self.no_wumpus
+        if horde and self.smelled and nearby not in self.wumpus_clues:
+            self.wumpus_clues.append(nearby)
+        self.wumpus_clues = [clue & self.wumpus_mask for clue in self.wumpus_clues if clue & self.wumpus_mask]
+
+        self.pits, self.pit_clues = self.resolve(self.pits, self.no_pit, self.pit_clues)
+        self.bats, self.bat_clues = self.resolve(self.bats, self.no_bats, self.bat_clues)
+
+    # Drops clues already explained by a known hazard, a clue left with one room marks that room
+    @staticmethod
+    def resolve(known: int, free: int, clues: list) -> tuple:
+        changed = True
+        while changed:
+            changed = False
+            remaining = []
+            for clue in clues:
+                clue &= ~free
+                if clue & known:
+                    continue
+                if popcount(clue) == 1:
+                    known |= clue
+                    changed = True
+                    continue
+                remaining.append(clue)
+            clues = remaining
+        return known, clues
+
+    # Chance that a room holds a hazard: the hazards still unplaced spread over the unknown rooms,
+    # raised to 1/k for a room among k candidates of a clue
+    def hazard_chance(self, room: int, count: int, known: int, free: int, clues: list) -> float:
+        bit = 1 << room
+        if free & bit:
+            return 0.0
+        if known & bit:
+            return 1.0
+        unknown = popcount(self.all_rooms & ~(free | known))
+        chance = max(0, count - popcount(known)) / max(1, unknown)
+        for clue in clues:
+            if clue & bit:
+                chance = max(chance, 1 / popcount(clue))
+        return min(1.0, chance)
+
+    def pit_chance(self, room: int) -> float:
+        return self.hazard_chance(room, self.pit_count, self.pits, self.no_pit, self.pit_clues)
+
+    def bat_chance(self, room: int) -> float:
+        return self.hazard_chance(room, self.bat_count, self.bats, self.no_bats, self.bat_clues)
+
+    def wumpus_chance(self, room: int) -> float:
+        if not (self.wumpus_mask >> room) & 1:
+            return 0.0
+        chance = min(1.0, self.wumpuses / popcount(self.wumpus_mask))
+        for clue in self.wumpus_clues:
+            if (clue >> room) & 1:
+                chance = max(chance, 1 / popcount(clue))
+        return chance
+
+    # Chance of meeting the Wumpus after moving into room: in it, or next to it when it chases
+    def wumpus_risk(self, room: int) -> float:
+        risk = self.wumpus_chance(room)
+        if self.game.wumpus_chases:
+            around = set(self.tunnels.get(room, ()))
+            around.update(other for other, tunnels in self.tunnels.items() if room in tunnels)
+            risk += sum(self.wumpus_chance(other) for other in around)
+        return min(1.0, risk)
+
+    # Chance of dying (or losing the way, for bats) when moving into room
+    def move_risk(self, room: int) -> float:
+        pit = self.pit_chance(room)
+        return pit + (1 - pit) * (self.wumpus_risk(room) + self.BAT_RISK * self.bat_chance(room))
+
+    # Room an arrow in arrow_room enters next, as WumpusGame.fire_arrow steers it
+    # None if the player hasn't seen the tunnels of arrow_room
+    def arrow_step(self, arrow_room: int, direction: int):
+        tunnels = self.tunnels.get(arrow_room)
+        return None if tunnels is None else tunnels[direction]
+
+    # Rooms the arrow flies through for a steering, as far as the player knows the tunnels
+    def arrow_path(self, room: int, directions: str) -> list:
+        path = []
+        arrow_room = room
+        for direction in directions:
+            arrow_room = self.arrow_step(arrow_room, DIRECTIONS[direction])
+            if arrow_room is None:
+                break
+            path.append(arrow_room)
+        return path
+
+    # {mask of the known rooms an arrow passes: (steering, chance it flies back into room)} for the shots
+    # from room, cached once the tunnels of every room on the way are known. Past a room with unknown
+    # tunnels the arrow is steered blindly, which can only turn it back from a neighbor of room
+    def shot_masks(self, room: int) -> dict:
+        masks = self.shots.get(room)
+        if masks is not None:
+            return masks
+        masks = {}
+        complete = True
+        here = 1 << room
+        around = self.tunnels[room]
+        step = self.arrow_step
+        for first in range(4):
+            one = step(room, first)
+            for second in range(4):
+                two = step(one, second)
+                if two is None:
+                    complete = False
+                    masks.setdefault(1 << one, ("NESW"[first] + "NN", self.TURN_BACK))
+                    break
+                for third in range(4):
+                    three = step(two, third)
+                    if three is None:
+                        complete = False
+                        mask = (1 << one) | (1 << two)
+                        if not mask & here:
+                            masks.setdefault(mask, ("NESW"[first] + "NESW"[second] + "N", self.TURN_BACK if two in around else 0.0))
+                        break
+                    mask = (1 << one) | (1 << two) | (1 << three)
+                    if not mask & here:
+                        masks.setdefault(mask, ("NESW"[first] + "NESW"[second] + "NESW"[third], 0.0))
+        if complete:
+            self.shots[room] = masks
+        return masks
+
+    # Steering from room with the best chance to hit the Wumpus, less the chance of a miss turning
+    # back into the player, and the chance to hit
+    def best_shot(self, room: int) -> tuple:
+        wumpus = self.wumpus_mask
+        candidates = max(1, popcount(wumpus))
+        left = max(1, self.wumpuses)
+        clues = [(clue, popcount(clue)) for clue in self.wumpus_clues]
+        best, best_odds, best_value = None, 0.0, 0.0
+        for mask, (directions, risk) in self.shot_masks(room).items():
+            odds = min(1.0, left * popcount(mask & wumpus) / candidates)
+            for clue, size in clues:
+                odds = max(odds, popcount(mask & clue) / size)
+            value = odds - (1 - odds) * risk
+            if value > best_value:
+                best, best_odds, best_value = directions, odds, value
+        return best, best_odds
+
+    # Breadth-first search through visited rooms, returns {room: first direction on the way there}
+    def routes(self, room: int) -> dict:
+        first = {room: None}
+        queue = deque([room])
+        while queue:
+            current = queue.popleft()
+            for direction, nearby in enumerate(self.tunnels[current]):
+                if nearby not in first:
+                    first[nearby] = direction if current == room else first[current]
+                    if nearby in self.tunnels:
+                        queue.append(nearby)
+        return first
+
+    # Picks this turn's action, returns ("M", direction) or ("S", three directions)
+    def decide(self) -> tuple:
+        self.decisions += 1
+        game = self.game
+        room = game.player.current_room.room_id
+        arrows = game.player.arrows
+
+        # Shoot when the odds are good, when a chasing Wumpus is already next door, or with arrows to spare
+        # at a chasing Wumpus still on its way. An arrow passes at most 3 rooms, with more candidates than
+        # 3 / SHOOT_ODDS the odds for a Wumpus that stays put can't be good
+        smelled = game.wumpus_chases and self.smelled
+        shot, odds = None, 0.0
+        if arrows > 0 and (game.wumpus_chases or popcount(self.wumpus_mask) * self.SHOOT_ODDS <= 3):
+            shot, odds = self.best_shot(room)
+            if shot is not None and (odds >= self.SHOOT_ODDS or (smelled and odds > 0)
+                                     or (game.wumpus_chases and arrows > 1 and odds >= self.CHASE_ODDS)):
+                return self.shoot(room, shot, odds)
+
+        # Explore the least risky unvisited room, rooms known to hold pits or bats teach nothing new
+        routes = self.routes(room)
+        hazards = self.pits | self.bats
+        target = None
+        for nearby, direction in routes.items():
+            if nearby not in self.tunnels and not (hazards >> nearby) & 1:
+                risk = self.move_risk(nearby)
+                if target is None or risk < target[1]:
+                    target = (direction, risk)
+
+        # A risky step is worth an arrow guess first
+        if target is not None and target[1] <= self.SHOOT_ODDS:
+            return self.move(room, target[0])
+        if shot is None and arrows > 0:
+            shot, odds = self.best_shot(room)
+        if target is not None and (shot is None or odds == 0 or arrows < 2):
+            return self.move(room, target[0])
+        if shot is not None and odds > 0:
+            return self.shoot(room, shot, odds)
+
+        # Nothing left to explore: walk to the closest room with a shot at the Wumpus, else shoot blind
+        for nearby, direction in routes.items():
+            if nearby in self.tunnels and direction is not None and self.best_shot(nearby)[1] > 0:
+                return self.move(room, direction)
+        blind = min(self.shot_masks(room).values(), key=lambda shot: shot[1], default=("NNN", 0.0))[0]
+        return self.shoot(room, blind, 0.0)
+
+    def move(self, room: int, direction: int) -> tuple:
+        self.odds = 1 - self.move_risk(self.tunnels[room][direction])
+        return "M", "NESW"[direction]
+
+    def shoot(self, room: int, shot: str, odds: float) -> tuple:
+        self.last_shot = self.arrow_path(room, shot)
+        self.odds = odds
+        return "S", shot
+
+    # Suggested action for the current turn, for a player asking for help
+    def hint(self) -> tuple:
+        self.observe()
+        return self.decide()
+
+# Answers for ScriptedUI from a Solver playing the game
+def solver_policy(game):
+    solver = Solver(game)
+    plan = deque()
+    def policy(kind: str) -> str:
+        if kind == "action":
+            action, directions = solver.hint()
+            plan.clear()
+            plan.extend(directions)
+            return action
+        return plan.popleft() if plan else "N"
+    return policy
 
 # ==============================================================
 #                         G A M E   L O G I C
@@ -347,6 +1342,456 @@ class TextUI:
 # Manages rooms, hazards, movement, encounters, and turns
 # ==============================================================
 
+# Maps a direction letter to its index in Room.connected_rooms
+DIRECTIONS = {"N": 0, "E": 1, "S": 2, "W": 3}
+
+# Hazard bits, one byte per room in CompactWumpusGame.hazards and WumpusGame.senses
+PIT = 1
+BATS = 2
+WUMPUS = 4
+
+# Passes directions through one at a time, appending each one taken to taken
+def recorded(directions, taken: list):
+    for direction in directions:
+        taken.append(direction)
+        yield direction
+
+# Every ordering of a room's four tunnels, used to shuffle directions in regular_cave()
+TUNNEL_ORDERS = [(a, b, c, d) for a in range(4) for b in range(4) for c in range(4) for d in range(4)
+                 if len({a, b, c, d}) == 4]
+
+# Inverse of a permutation of range(n) in one pass: inverse[room] is the room's place in order
+def inverse_permutation(order: list) -> list:
+    inverse = [0] * len(order)
+    for i, room in enumerate(order):
+        inverse[room] = i
+    return inverse
+
+# Builds a random connected 4-regular cave in O(n), returns a flat adjacency array
+# adjacency[4 * room_id + direction] is the neighbor in direction N/E/S/W
+# The cave is the union of two random Hamiltonian cycles that share no tunnel:
+# the first cycle makes it connected, the second is repaired by swaps until it avoids the first
+def regular_cave(num_rooms: int, rng = random) -> array:
+    n = num_rooms
+    if n < 5:
+        raise ValueError(f"a cave where every room has 4 tunnels needs at least 5 rooms, got {n}")
+
+    # First cycle, pos1[room] is the room's place in it (inverse permutation)
+    cycle1 = list(range(n))
+    rng.shuffle(cycle1)
+    pos1 = inverse_permutation(cycle1)
+
+    # True if rooms a and b are neighbors on the first cycle
+    def in_cycle1(a: int, b: int) -> bool:
+        gap = abs(pos1[a] - pos1[b])
+        return gap == 1 or gap == n - 1
+
+    # Second cycle, swap rooms around every tunnel that duplicates one of the first cycle
+    # Each tunnel clashes with probability ~2/n, so only a handful of swaps are expected
+    cycle2 = list(range(n))
+    rng.shuffle(cycle2)
+    clashes = [i for i, (a, b) in enumerate(zip(cycle2, cycle2[1:] + cycle2[:1]))
+               if abs(pos1[a] - pos1[b]) in (1, n - 1)]
+    while clashes:
+        i = clashes.pop()
+        if not in_cycle1(cycle2[i], cycle2[(i + 1) % n]):
+            continue
+        j = rng.randrange(n)
+        k = (i + 1) % n
+        cycle2[k], cycle2[j] = cycle2[j], cycle2[k]
+        # Re-check every tunnel touching the two swapped places
+        for p in {(k - 1) % n, k, (j - 1) % n, j}:
+            if in_cycle1(cycle2[p], cycle2[(p + 1) % n]) and p not in clashes:
+                clashes.append(p)
+    pos2 = inverse_permutation(cycle2)
+
+    # Next and previous room on both cycles, for every room
+    tunnels = []
+    for cycle, pos in ((cycle1, pos1), (cycle2, pos2)):
+        following = cycle[1:] + cycle[:1]
+        previous = cycle[-1:] + cycle[:-1]
+        tunnels.append([following[p] for p in pos])
+        tunnels.append([previous[p] for p in pos])
+
+    # Four tunnels per room in a random direction order
+    orders = rng.choices(TUNNEL_ORDERS, k=n)
+    return array("i", [room[d] for room, order in zip(zip(*tunnels), orders) for d in order])
+
+# Tunnels of the classic Hunt the Wumpus cave, a dodecahedron, 0-based
+DODECAHEDRON = ((1, 4, 7), (0, 2, 9), (1, 3, 11), (2, 4, 13), (0, 3, 5), (4, 6, 14), (5, 7, 16), (0, 6, 8),
+                (7, 9, 17), (1, 8, 10), (9, 11, 18), (2, 10, 12), (11, 13, 19), (3, 12, 14), (5, 13, 15),
+                (14, 16, 19), (6, 15, 17), (8, 16, 18), (10, 17, 19), (12, 15, 18))
+
+# Builds the classic 20 room dodecahedron cave with shuffled room numbers
+# Every room here has 4 tunnels, so the fourth one goes through the middle to the opposite room
+def dodecahedron_cave(num_rooms: int, rng = random) -> array:
+    if num_rooms != 20:
+        raise ValueError(f"the dodecahedron cave has 20 rooms, got {num_rooms}")
+    tunnels = []
+    for room, nearby in enumerate(DODECAHEDRON):
+        # The opposite room is the only one 5 tunnels away
+        seen = {room}
+        frontier = [room]
+        for _ in range(5):
+            frontier = [other for current in frontier for other in DODECAHEDRON[current] if other not in seen]
+            seen.update(frontier)
+        tunnels.append(nearby + (frontier[0],))
+
+    label = list(range(20))
+    rng.shuffle(label)
+    orders = rng.choices(TUNNEL_ORDERS, k=20)
+    adjacency = array("i", [0]) * 80
+    for room, nearby in enumerate(tunnels):
+        base = label[room] * 4
+        for d, index in enumerate(orders[room]):
+            adjacency[base + d] = label[nearby[index]]
+    return adjacency
+
+# Width and height of the squarest grid of num_rooms rooms with both sides at least 3, None if there is none
+def grid_shape(num_rooms: int) -> tuple:
+    for height in range(math.isqrt(num_rooms), 2, -1):
+        if num_rooms % height == 0:
+            return num_rooms // height, height
+    return None
+
+# Builds a grid cave whose edges wrap around (a torus), N/E/S/W are the real compass directions
+# Rooms are numbered row by row; both sides need 3 rooms so that no two tunnels join the same rooms
+def torus_cave(num_rooms: int, rng = random) -> array:
+    shape = grid_shape(num_rooms)
+    if shape is None:
+        raise ValueError(f"a torus cave needs a width and height of at least 3, {num_rooms} rooms have none")
+    width, height = shape
+    adjacency = array("i", [0]) * (num_rooms * 4)
+    for room in range(num_rooms):
+        y, x = divmod(room, width)
+        base = room * 4
+        adjacency[base] = (y - 1) % height * width + x
+        adjacency[base + 1] = y * width + (x + 1) % width
+        adjacency[base + 2] = (y + 1) % height * width + x
+        adjacency[base + 3] = y * width + (x - 1) % width
+    return adjacency
+
+# Points room's tunnel to old at new instead
+def relink(adjacency: array, room: int, old: int, new: int):
+    base = room * 4
+    adjacency[base + adjacency[base:base + 4].index(old)] = new
+
+# Pairs the tunnel ends of n rooms within about reach rooms and swaps away bad tunnels
+# Returns the adjacency array, or None if the swaps found no way out after MAX_REPAIR_MISSES tries per room
+MAX_REPAIR_MISSES = 32
+
+def paired_cave(n: int, rng, reach: int):
+    random_float = rng.random
+    keys = [end // 4 + random_float() * reach for end in range(4 * n)]
+    ends = sorted(range(4 * n), key=keys.__getitem__)
+    del keys
+
+    # Pair the ends in order, adjacency[end] is the room at the other end of the tunnel
+    adjacency = array("i", [0]) * (4 * n)
+    for i in range(0, 4 * n, 2):
+        a, b = ends[i], ends[i + 1]
+        adjacency[a] = b // 4
+        adjacency[b] = a // 4
+    del ends
+
+    # Swap the far ends of every bad tunnel a-b (b may be a) with those of a random nearby tunnel c-d: a-c and b-d
+    def bad(room: int) -> bool:
+        nearby = adjacency[room * 4:room * 4 + 4]
+        return room in nearby or len(set(nearby)) < 4
+    repairs = [room for room in range(n) if bad(room)]
+    misses = MAX_REPAIR_MISSES * n
+    while repairs:
+        a = repairs.pop()
+        if not bad(a):
+            continue
+        nearby = adjacency[a * 4:a * 4 + 4]
+        b = next(other for i, other in enumerate(nearby) if other == a or other in nearby[:i])
+        c = (a + rng.randint(-4 * reach, 4 * reach)) % n
+        d = adjacency[c * 4 + rng.randrange(4)]
+        if c in (a, b) or d in (a, b) or c == d:
+            misses -= 1
+            if misses <= 0:
+                return None
+            repairs.append(a)
+            continue
+        relink(adjacency, a, b, c)
+        relink(adjacency, b, a, d)
+        relink(adjacency, c, d, a)
+        relink(adjacency, d, c, b)
+        repairs.extend((a, b, c, d))
+    return adjacency
+
+# Builds a large winding cave: tunnels join rooms that are close in a random layout, so distances
+# grow with the cave instead of staying a few tunnels as in regular_cave(). Every room has 4 tunnels.
+# Tunnel ends are paired at random within about reach rooms, then tunnels back into the same room or
+# twice to the same room are swapped away, and the pieces found by cave_components() are joined
+def procedural_cave(num_rooms: int, rng = random, reach: int = 16) -> array:
+    n = num_rooms
+    if n < 5:
+        raise ValueError(f"a cave where every room has 4 tunnels needs at least 5 rooms, got {n}")
+    if reach < 2:
+        raise ValueError(f"tunnels must reach at least 2 rooms to join different rooms, got {reach}")
+    if n == 5:
+        # The only such cave: every room joins the other four
+        adjacency = array("i", [other for room in range(n) for other in range(n) if other != room])
+    else:
+        # A draw whose repairs stall is thrown away and the ends are paired again
+        adjacency = paired_cave(n, rng, reach)
+        while adjacency is None:
+            adjacency = paired_cave(n, rng, reach)
+
+    # Join every other piece to the first: all degrees are even, so no tunnel is a bridge and
+    # swapping a tunnel of each piece connects both without disconnecting either
+    count, roots = cave_components(adjacency)
+    if count > 1:
+        first = {}
+        for room in range(n):
+            first.setdefault(roots[room], room)
+        main = roots[0]
+        for root, a in first.items():
+            if root != main:
+                b = adjacency[a * 4]
+                c = rng.randrange(n)
+                while roots[c] != main:
+                    c = rng.randrange(n)
+                d = adjacency[c * 4]
+                relink(adjacency, a, b, c)
+                relink(adjacency, b, a, d)
+                relink(adjacency, c, d, a)
+                relink(adjacency, d, c, b)
+
+    # Four tunnels per room in a random direction order
+    orders = rng.choices(TUNNEL_ORDERS, k=n)
+    return array("i", [adjacency[room * 4 + d] for room, order in zip(range(n), orders) for d in order])
+
+# Cave generators by name, each one (num_rooms, rng) -> adjacency array with 4 tunnels per room
+TOPOLOGIES = {
+    "random": regular_cave,
+    "dodecahedron": dodecahedron_cave,
+    "torus": torus_cave,
+    "procedural": procedural_cave,
+}
+
+# Labels the connected pieces of a cave with union-find (union by size, path halving)
+# Returns (number of pieces, root room of every room), near-linear in the number of tunnels
+def cave_components(adjacency: array) -> tuple:
+    n = len(adjacency) // 4
+    parent = array("i", range(n))
+    size = array("i", [1]) * n
+    count = n
+    # Each tunnel is listed from both ends, joining from the lower room id is enough
+    for end, nearby in enumerate(adjacency):
+        room = end >> 2
+        if nearby > room:
+            a = room
+            while parent[a] != a:
+                parent[a] = a = parent[parent[a]]
+            b = nearby
+            while parent[b] != b:
+                parent[b] = b = parent[parent[b]]
+            if a != b:
+                if size[a] < size[b]:
+                    a, b = b, a
+                parent[b] = a
+                size[a] += size[b]
+                count -= 1
+    for room in range(n):
+        root = room
+        while parent[root] != root:
+            root = parent[root]
+        parent[room] = root
+    return count, parent
+
+# Raises ValueError unless every tunnel leads to another room and back, and every room can reach every other
+def validate_cave(adjacency: array):
+    n = len(adjacency) // 4
+    for end, nearby in enumerate(adjacency):
+        room = end >> 2
+        if nearby < 0:
+            continue
+        if nearby >= n or nearby == room:
+            raise ValueError(f"room {room} has a tunnel to room {nearby}")
+        if room not in adjacency[nearby * 4:nearby * 4 + 4]:
+            raise ValueError(f"the tunnel from room {room} to room {nearby} has no way back")
+    count, _ = cave_components(adjacency)
+    if count > 1:
+        raise ValueError(f"the cave is split into {count} unconnected parts")
+
+# Builds a cave of the named topology and validates it, see TOPOLOGIES
+def build_cave(topology: str, num_rooms: int, rng = random) -> array:
+    if topology not in TOPOLOGIES:
+        raise ValueError(f"unknown topology {topology!r}, expected one of {', '.join(TOPOLOGIES)}")
+    adjacency = TOPOLOGIES[topology](num_rooms, rng)
+    validate_cave(adjacency)
+    return adjacency
+
+# Class for a breadth-first distance field rooted at one room (the player's)
+# next_hop[room] is the neighbor one step closer to the root, dist[room] the number of steps
+# The search is lazy: hop() only expands the frontier until the asked room is reached,
+# and refresh() starts a new generation instead of clearing the arrays
+class ChaseField:
+    def __init__(self, adjacency: array):
+        num_rooms = len(adjacency) // 4
+        self.adjacency = adjacency
+        self.dist = array("i", [0]) * num_rooms
+        self.next_hop = array("i", [0]) * num_rooms
+        self.seen = array("I", [0]) * num_rooms   # generation that last reached each room
+        self.generation = 0
+        self.queue = deque()
+        self.root = -1
+
+    # Restarts the field from a new root room
+    def refresh(self, root: int):
+        self.generation += 1
+        self.seen[root] = self.generation
+        self.dist[root] = 0
+        self.next_hop[root] = root
+        self.queue = deque([root])
+        self.root = root
+
+    # Expands the search until room is reached or the cave is exhausted, True if reached
+    def _reach(self, room: int) -> bool:
+        adjacency = self.adjacency
+        dist = self.dist
+        next_hop = self.next_hop
+        seen = self.seen
+        generation = self.generation
+        queue = self.queue
+        while seen[room] != generation and queue:
+            current = queue.popleft()
+            step = dist[current] + 1
+            for nearby in adjacency[current * 4:current * 4 + 4]:
+                if nearby >= 0 and seen[nearby] != generation:
+                    seen[nearby] = generation
+                    dist[nearby] = step
+                    next_hop[nearby] = current
+                    queue.append(nearby)
+        return seen[room] == generation
+
+    # Returns the neighbor of room one step closer to the root, -1 if the root can't be reached
+    def hop(self, room: int) -> int:
+        if self._reach(room):
+            return self.next_hop[room]
+        return -1
+
+    # Returns the number of steps from room to the root, -1 if the root can't be reached
+    def distance(self, room: int) -> int:
+        if self._reach(room):
+            return self.dist[room]
+        return -1
+
+# Class for a set of rooms with O(1) add, discard, membership and uniform random choice
+# Rooms are kept in a dense array of room ids, pos[room_id] is the room's index in it (-1 if absent)
+# Works as a Sequence, so random.choice(room_set) picks a uniform random member
+class RoomSet(Sequence):
+    def __init__(self, rooms, members = ()):
+        self.rooms = rooms
+        self.ids = array("i")
+        self.pos = array("i", [-1]) * len(rooms)
+        self.journal = None     # list of changes while a WumpusGame checkpoint is open, see undo()
+        for room in members:
+            self.add(room)
+
+    # Copy with its own arrays, over rooms (default: the same rooms)
+    def copy(self, rooms = None) -> RoomSet:
+        other = RoomSet(self.rooms if rooms is None else rooms)
+        other.ids = self.ids[:]
+        other.pos = self.pos[:]
+        return other
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index: int):
+        return self.rooms[self.ids[index]]
+
+    def __contains__(self, room) -> bool:
+        return self.pos[room.room_id] >= 0
+
+    def __iter__(self):
+        rooms = self.rooms
+        return (rooms[room_id] for room_id in self.ids)
+
+    def add(self, room):
+        room_id = room.room_id
+        if self.pos[room_id] < 0:
+            self.pos[room_id] = len(self.ids)
+            self.ids.append(room_id)
+            if self.journal is not None:
+                self.journal.append((room_id, -1))
+
+    # Removes room if present, moving the last member into its place
+    def discard(self, room):
+        room_id = room.room_id
+        index = self.pos[room_id]
+        if index < 0:
+            return
+        last = self.ids.pop()
+        if last != room_id:
+            self.ids[index] = last
+            self.pos[last] = index
+        self.pos[room_id] = -1
+        if self.journal is not None:
+            self.journal.append((room_id, index))
+
+    # Reverts the journaled changes after the first mark entries, members end up in their old order
+    def undo(self, mark: int):
+        journal = self.journal
+        ids = self.ids
+        pos = self.pos
+        while len(journal) > mark:
+            room_id, index = journal.pop()
+            if index < 0:
+                ids.pop()
+                pos[room_id] = -1
+            else:
+                if index < len(ids):
+                    last = ids[index]
+                    ids.append(last)
+                    pos[last] = len(ids) - 1
+                    ids[index] = room_id
+                else:
+                    ids.append(room_id)
+                pos[room_id] = index
+
+# Per-room OR of the hazard bits of its neighbors, what a player standing there senses
+# One pass over the adjacency array per direction, the rooms are ORed as one big integer
+def sense_table(adjacency, hazards) -> bytearray:
+    n = len(hazards)
+    padded = bytes(hazards) + b"\0"    # a missing tunnel (-1) reads the padding byte
+    senses = 0
+    for direction in range(4):
+        senses |= int.from_bytes(bytes(map(padded.__getitem__, adjacency[direction::4])), "little")
+    return bytearray(senses.to_bytes(n, "little"))
+
+# Outcome of one arrow steering, see arrow_outcomes()
+ARROW_MISS = 0
+ARROW_HIT = 1         # the arrow enters a Wumpus room
+ARROW_SUICIDE = 2     # the arrow flies back into the shooter's room
+
+# Every room the arrows shot from room enter, all 64 steerings in one pass over the adjacency array
+# Returns three levels of 4, 16 and 64 room ids: steering t = 16a + 4b + c (ARROW_SHOTS[t]) enters
+# levels[0][a], then levels[1][4a + b], then levels[2][t]. Every step leaves through the arrow's own room
+def arrow_flights(adjacency, room: int) -> tuple:
+    levels = []
+    level = [room]
+    for _ in range(3):
+        entered = []
+        for arrow_room in level:
+            entered += adjacency[arrow_room * 4:arrow_room * 4 + 4] if arrow_room >= 0 else (-1, -1, -1, -1)
+        levels.append(entered)
+        level = entered
+    return tuple(levels)
+
+# ARROW_MISS/HIT/SUICIDE of all 64 steerings from room, as bytes indexed like ARROW_SHOTS
+# targets: room ids holding a Wumpus. The arrow stops at its first hit, checked before a suicide as in fire_arrow
+def arrow_outcomes(adjacency, room: int, targets) -> bytes:
+    outcomes = [ARROW_MISS]
+    for level in arrow_flights(adjacency, room):
+        outcomes = [ended or (ARROW_HIT if arrow_room in targets else ARROW_SUICIDE if arrow_room == room else ARROW_MISS)
+                    for ended, arrow_room in zip([ended for ended in outcomes for _ in range(4)], level)]
+    return bytes(outcomes)
+
 # Class for each Room object in the game
 class Room:
     def __init__(self, room_id: int):
@@ -371,50 +1816,73 @@ class WumpusGame:
                  bat_rate: float = 0.3,
                  starting_arrows: int = 5,
                  wumpus_chases: bool = False,
-                 seed: int = 1701):
+                 seed: int = 1701,
+                 topology: str = "random",
+                 wumpuses: int = 1):
         self.num_rooms = num_rooms
         self.pit_rate = pit_rate
         self.bat_rate = bat_rate
         self.starting_arrows = starting_arrows
         self.wumpus_chases = wumpus_chases
         self.seed = seed
+        self.topology = topology        # cave generator, a key of TOPOLOGIES
+        self.wumpuses = wumpuses        # Wumpuses placed, more than one is horde mode
+        self.rng = random.Random(seed)
         self.rooms = []
-        self.safe_rooms = []
+        self.adjacency: array = None    # flat N x 4 tunnel array, see TOPOLOGIES
+        self.chase_field = None         # ChaseField rooted at the player, used by wumpus_chase()
+        self.safe_rooms = []            # RoomSet of rooms without pit, bats or Wumpus
+        self.senses: bytearray = None   # per-room hazard bits sensed there, see sense_table()
+        self.wumpus_alive = True
+        self.state = "running"
+        self.wumpus_rooms = []          # rooms of the living Wumpuses, never two in one room
+        self.turns = 0
+        self.cause = None       # event key that ended the game, e.g. "pit_fall" or "wumpus_hit"
+        self.events = []        # (key, value) events emitted during the current turn
+        self.listener = None    # optional callable(key, value), e.g. TextUI.show_event
+        self.recorder = None    # optional ReplayWriter, every turn is written to it
+        self.metrics = None     # optional Metrics, the phases of every turn are timed into it
+        self.rng_slots = []     # rng states saved for the open checkpoints, see checkpoint()
+
+    # Builds a fresh cave with hazards and a player, ready for the first turn
+    def setup(self):
+        self.random_seed()
+        self.generate_rooms()
+        self.connect_rooms()
+        self.place_hazards()
+        self.place_player()
+        self.turns = 0
+        self.cause = None
         self.state = "running"
-        self.wumpus_room: Room = None
 
-    # Assigns a seed for the random module for reproducability
+    # Records an event for this turn and forwards it to the listener (if any)
+    def emit(self, key: str, value=None):
+        self.events.append((key, value))
+        if self.metrics is not None:
+            self.metrics.count("event_" + key)
+        if self.listener is not None:
+            self.listener(key, value)
+
+    # Assigns a seed to the game's own random generator for reproducability
+    # Every random draw of the game goes through self.rng, never the global random module
     def random_seed(self):
-        random.seed(self.seed)
+        self.rng = random.Random(self.seed)
+
+    # Returns an independent random generator for a named part of this game (e.g. "policy")
+    def substream(self, label: str) -> random.Random:
+        return random.Random(derive_seed(self.seed, label))
 
     # Generates a list of rooms based on self.num_rooms
     def generate_rooms(self):
         self.rooms = [Room(i) for i in range(self.num_rooms)]
 
-    # Connects all rooms to each other in both ways
+    # Connects all rooms to each other in both ways, in the shape of self.topology
+    # Every room gets exactly 4 tunnels and every room can reach every other room
     def connect_rooms(self):
-        number_of_connections = 4   # each room needs 4 connections
-        safety_limit = 500          # loop safety limit to stop infinite looping
-
-        # Run this code for each room in self.rooms
+        self.adjacency = build_cave(self.topology, self.num_rooms, self.rng)
         for room in self.rooms:
-            attempts = 0
-
-            # While the room needs further connections and attempts < safety limit
-            while len(room.connected_rooms) < number_of_connections and attempts < safety_limit:
-                attempts += 1
-                target_room = random.choice(self.rooms)
-
-                # Check if the target room can be connected
-                if (
-                    target_room != room 
-                    and target_room not in room.connected_rooms 
-                    and len(target_room.connected_rooms) < number_of_connections
-                    ):
-                    
-                    # Create a two-way connection
-                    room.connected_rooms.append(target_room)
-                    target_room.connected_rooms.append(room)
+            base = room.room_id * 4
+            room.connected_rooms = [self.rooms[r] for r in self.adjacency[base:base + 4]]
 
     # Places hazards in the appropriate number of rooms
     def place_hazards(self):
@@ -423,187 +1891,278 @@ class WumpusGame:
         number_of_bats = int(self.num_rooms * self.bat_rate)
 
         # Place pits in pit rooms using preselected rooms
-        pit_rooms = random.sample(self.rooms, number_of_pits)
+        pit_rooms = self.rng.sample(self.rooms, number_of_pits)
         for room in pit_rooms:
             room.has_pit = True
 
         # Place bats in bat rooms making sure pit rooms are ignored
         empty_rooms = [room for room in self.rooms if not room.has_pit]
-        bat_rooms = random.sample(empty_rooms, number_of_bats)
+        bat_rooms = self.rng.sample(empty_rooms, number_of_bats)
         for room in bat_rooms:
             room.has_bats = True
 
-        # Place Wumpus in a random empty room
+        # Place the Wumpuses in random empty rooms, one per room
         empty_room = [room for room in self.rooms if not room.has_pit and not room.has_bats]
-        self.wumpus_room = random.choice(empty_room)
-        self.wumpus_room.has_wumpus = True
+        self.wumpus_rooms = self.rng.sample(empty_room, self.wumpuses)
+        for room in self.wumpus_rooms:
+            room.has_wumpus = True
 
         # Store safe rooms
-        self.safe_rooms = [room for room in self.rooms if not room.has_pit and not room.has_bats and not room.has_wumpus]
-
-    # Wumpus movement logic, uses helper method for pathfinding and moves Wumpus closer to player
-    def wumpus_chase(self, ui: TextUI):
+        self.wumpus_alive = True
+        self.safe_rooms = RoomSet(self.rooms, (room for room in self.rooms if not room.has_pit and not room.has_bats and not room.has_wumpus))
+        self.senses = sense_table(self.adjacency, [self.hazard_bits(room_id) for room_id in range(self.num_rooms)])
+
+    # PIT | BATS | WUMPUS bits of one room
+    def hazard_bits(self, room_id: int) -> int:
+        room = self.rooms[room_id]
+        return PIT * room.has_pit | BATS * room.has_bats | WUMPUS * room.has_wumpus
+
+    # Recomputes the senses of the rooms next to the given rooms after their hazards changed
+    # Tunnels go both ways, so the rooms sensing a room are its neighbors
+    def update_senses(self, *room_ids: int):
+        adjacency = self.adjacency
+        senses = self.senses
+        for room_id in room_ids:
+            for nearby in adjacency[room_id * 4:room_id * 4 + 4]:
+                if nearby >= 0:
+                    bits = 0
+                    for other in adjacency[nearby * 4:nearby * 4 + 4]:
+                        if other >= 0:
+                            bits |= self.hazard_bits(other)
+                    senses[nearby] = bits
+
+    # Wumpus movement logic, uses the chase field rooted at the player and moves every Wumpus closer to player
+    # The field is one breadth-first search from the player, shared by all Wumpuses of the turn
+    def wumpus_chase(self):
         # If wumpus_chases is true: get closeer to player each turn
-        if self.wumpus_chases == True:
-            self.wumpus_room.has_wumpus = False # Remove old has_wumpus flag
-            start = self.wumpus_room
-            goal = self.player.current_room
-
-            # If the Wumpus is already in the same room: return
-            if start == goal:
-                self.wumpus_room.has_wumpus = True
-                return
-            
-            # Find the shortest path to the player from start --> goal, using helper method
-            path = self.find_path(start, goal)
-
-            # Move Wumpus one step closer to player
-            if len(path) > 1:
-                self.wumpus_room = path[1]
-                ui.show_message("wumpus_move")
-                # DEBUG: print(f"Wumpus MOVED to ROOM {self.wumpus_room.room_id}")
-            else:
-                # If no path exists, just move randomly
-                self.wumpus_room = random.choice(self.safe_rooms)
-                ui.show_message("wumpus_move")
-                # DEBUG: print(f"Wumpus MOVED (randomly) to ROOM {self.wumpus_room.room_id}")
-
-            # Set new flag for room with Wumpus
-            self.wumpus_room.has_wumpus = True
-
-            # Update list of safe rooms
-            self.safe_rooms = [room for room in self.rooms if not room.has_pit and not room.has_bats and not room.has_wumpus]
+        if self.wumpus_chases == True and self.wumpus_alive:
+            goal = self.player.current_room.room_id
+
+            # Distance field towards the player, rebuilt only when the player has moved
+            if self.chase_field is None or self.chase_field.adjacency is not self.adjacency:
+                self.chase_field = ChaseField(self.adjacency)
+            field = self.chase_field
+            if field.root != goal:
+                field.refresh(goal)
+
+            # Nearest Wumpus first, so that one waiting behind another in a tunnel is not blocked by it
+            wumpus_rooms = self.wumpus_rooms
+            order = range(len(wumpus_rooms))
+            if len(wumpus_rooms) > 1:
+                order = sorted(order, key=lambda i: (field.distance(wumpus_rooms[i].room_id), wumpus_rooms[i].room_id))
+            moved = False
+            for i in order:
+                old_room = wumpus_rooms[i]
+                start = old_room.room_id
+
+                # If the Wumpus is already in the same room: stay
+                if start == goal:
+                    continue
+
+                # Move Wumpus one step closer to player, unless another Wumpus is there
+                step = field.hop(start)
+                if step >= 0:
+                    new_room = self.rooms[step]
+                    if new_room.has_wumpus:
+                        continue
+                else:
+                    # If the player can't be reached, just move randomly
+                    self.save_rng()
+                    new_room = self.rng.choice(self.safe_rooms)
+                # DEBUG: print(f"Wumpus MOVED to ROOM {new_room.room_id}")
+
+                # Move the room flags (the room -> Wumpus index) and the senses around both rooms
+                old_room.has_wumpus = False
+                new_room.has_wumpus = True
+                wumpus_rooms[i] = new_room
+                self.update_senses(start, new_room.room_id)
+                moved = True
+
+                # Update set of safe rooms: the room left behind is safe again unless it has a hazard
+                self.safe_rooms.discard(new_room)
+                if not old_room.has_pit and not old_room.has_bats and not old_room.has_wumpus:
+                    self.safe_rooms.add(old_room)
+            if moved:
+                self.emit("wumpus_move")
 
     # Helper method for pathfinding through the lists, returns a path: list
+    # Returns None if the goal can't be reached from start
     def find_path(self, start: Room, goal: Room) -> list:
-        # Each element in the queue is a path (list of rooms)
-        queue = deque([[start]])
-        visited = {start}
+        # Each visited room remembers the room it was reached from
+        queue = deque([start])
+        parent = {start: None}
 
         while queue:
-            path = queue.popleft()
-            room = path[-1]
+            room = queue.popleft()
 
-            # If target room reached --> return path
+            # If target room reached --> walk the parents back to start
             if room == goal:
+                path = []
+                while room is not None:
+                    path.append(room)
+                    room = parent[room]
+                path.reverse()
                 return path
             
             # Explore all unvisited nearby rooms
             for nearby in room.connected_rooms:
-                if nearby not in visited:
-                    visited.add(nearby)
-                    queue.append(path + [nearby])
+                if nearby not in parent:
+                    parent[nearby] = room
+                    queue.append(nearby)
+        return None
 
     # Places the player in a safe room and creates a Player instance in WumpusGame class
     def place_player(self):
-        spawn_room = random.choice(self.safe_rooms)
+        spawn_room = self.rng.choice(self.safe_rooms)
         self.player = Player(spawn_room, self.starting_arrows)
 
-    # Creates a dictionary based on hazards in Player's nearby rooms
-    def sense_environment(self) -> dict:
-        # Dictionary for storing sensed hazards
-        sense_dict = {"pit": False, "bats": False, "wumpus": False}
-
-        # Checking nearby rooms for hazards
-        for nearby_room in self.player.current_room.connected_rooms:
-            if nearby_room.has_pit:
-                sense_dict["pit"] = True
-            if nearby_room.has_bats:
-                sense_dict["bats"] = True
-            if nearby_room.has_wumpus:
-                sense_dict["wumpus"] = True
-
-        return sense_dict
+    # Creates a dictionary based on hazards in Player's nearby rooms (or room_id's)
+    # One lookup in the sense table, kept up to date as the Wumpus moves or dies
+    def sense_environment(self, room_id: int = None) -> dict:
+        bits = self.senses[self.player.current_room.room_id if room_id is None else room_id]
+        return {"pit": bool(bits & PIT), "bats": bool(bits & BATS), "wumpus": bool(bits & WUMPUS)}
     
     # Logic for moving the player, using ui.ask_move_direction for desired direction
+    # Plays the move as a full engine step (hazards and Wumpus included)
     def move_player(self, ui: TextUI):
-        direction_to_index = {"N": 0, "E": 1, "S": 2, "W": 3} # dict for dir -> int
-        connected_rooms = self.player.current_room.connected_rooms
-
         while True:
+            if self.metrics is not None:
+                start = time.perf_counter()
             direction = ui.ask_move_direction(self.player.current_room.room_id) # returns N,E,S,W string
-            if direction in direction_to_index:
-                target_room_obj = connected_rooms[direction_to_index[direction]]
-                self.player.current_room = target_room_obj
-                ui.show_move_transition(self.player.current_room.room_id, "move") # show moving animation
+            if self.metrics is not None:
+                self.metrics.observe("ask", time.perf_counter() - start)
+            if direction in DIRECTIONS:
+                self.step("M", direction)
                 return
             else:
                 ui.show_message("invalid_direction")
 
+    # Moves the player through the tunnel in direction N/E/S/W
+    def move(self, direction: str):
+        connected_rooms = self.player.current_room.connected_rooms
+        self.player.current_room = connected_rooms[DIRECTIONS[direction]]
+        self.emit("move", self.player.current_room.room_id)
+
     # Checks if player has entered a room with a pit
-    def check_pit_kill(self, ui: TextUI):
+    def check_pit_kill(self):
         if self.player.current_room.has_pit:
-            ui.show_message("pit_fall")
+            self.emit("pit_fall")
+            self.cause = "pit_fall"
             self.player.is_alive = False
 
     # Checks if player has entered a room with bats, transports player
-    def check_bats_transport(self, ui) -> bool:
+    def check_bats_transport(self) -> bool:
         if self.player.current_room.has_bats:
-            possible_rooms = [room for room in self.safe_rooms if room != self.player.current_room]
-            self.player.current_room = random.choice(possible_rooms)
-            ui.show_move_transition(self.player.current_room.room_id, "bat")
+            # A bat room is never in safe_rooms, the check only guards hand-built caves
+            self.save_rng()
+            destination = self.rng.choice(self.safe_rooms)
+            while destination == self.player.current_room and len(self.safe_rooms) > 1:
+                destination = self.rng.choice(self.safe_rooms)
+            self.player.current_room = destination
+            self.emit("bat", self.player.current_room.room_id)
+            return True
+        return False
     
     # Checks for player encounter with Wumpus, changes alive-status of Player instance
-    def check_wumpus_encounter(self, ui: TextUI):
+    def check_wumpus_encounter(self):
         if self.player.current_room.has_wumpus:
-            ui.show_message("wumpus_attack")
+            self.emit("wumpus_attack")
+            self.cause = "wumpus_attack"
             self.player.is_alive = False
 
-    # Logic fo shooting and steering arrows
+    # Logic fo shooting and steering arrows, using ui.ask_shoot_direction for each room
+    # Plays the shot as a full engine step (hazards and Wumpus included)
     def shoot_arrow(self, ui: TextUI):
-        direction_to_index = {"N": 0, "E": 1, "S": 2, "W": 3} # dict for dir -> int
+        self.step("S", self.ask_arrow_directions(ui))
+
+    # Yields valid arrow directions from the UI, asked one room at a time
+    def ask_arrow_directions(self, ui: TextUI):
+        for i in range(0, 3):
+            while True:
+                if self.metrics is not None:
+                    start = time.perf_counter()
+                direction = ui.ask_shoot_direction(i) # returns N,E,S,W string
+                if self.metrics is not None:
+                    self.metrics.observe("ask", time.perf_counter() - start)
+                if direction in DIRECTIONS:
+                    break
+                else:
+                    ui.show_message("invalid_direction")
+            yield direction
 
+    # Fires an arrow through up to three rooms
+    # directions: iterable of N/E/S/W, consumed lazily so steering can stop early on a hit
+    def fire_arrow(self, directions):
         # Early escape if no more arrows
         if self.player.arrows <= 0:
-            ui.show_message("no_arrows")
+            self.emit("no_arrows")
             return
-        
+
         # Decrement no. of arrows available
         self.player.arrows -= 1
 
         # Run this code three times, once for each direction choice / steering
+        # The arrow leaves through the tunnels of the room it is in, as in arrow_flights()
+        directions = iter(directions)
+        adjacency = self.adjacency
+        arrow_room = self.player.current_room.room_id
         for i in range(0, 3):
-            current_arrow_room = self.player.current_room
-            while True:
-                connected_rooms = self.player.current_room.connected_rooms
-                direction = ui.ask_shoot_direction(i) # returns N,E,S,W string
-                if direction in direction_to_index:
-                    current_arrow_room = connected_rooms[direction_to_index[direction]]
-                    break
-                else:
-                    ui.show_message("invalid_direction")
-            ui.shooting_text(i + 1)
-
-            # If arrow "hits" Wumpus
+            direction = next(directions, None)
+            if direction not in DIRECTIONS:
+                raise ValueError(f"invalid arrow direction {direction!r}")
+            arrow_room = adjacency[arrow_room * 4 + DIRECTIONS[direction]]
+            current_arrow_room = self.rooms[arrow_room]
+            self.emit("arrow", i + 1)
+
+            # If arrow "hits" a Wumpus, the player wins once none are left
             if current_arrow_room.has_wumpus:
                 current_arrow_room.has_wumpus = False
+                self.wumpus_rooms.remove(current_arrow_room)
+                self.wumpus_alive = bool(self.wumpus_rooms)
+                self.update_senses(current_arrow_room.room_id)
+                if not current_arrow_room.has_pit and not current_arrow_room.has_bats:
+                    self.safe_rooms.add(current_arrow_room)
+                self.emit("wumpus_hit")
+                if not self.wumpus_alive:
+                    self.cause = "wumpus_hit"
                 return
             
             # If arrow "hits" player
             if current_arrow_room.room_id == self.player.current_room.room_id:
-                ui.show_message("suicide")
+                self.emit("suicide")
+                self.cause = "suicide"
                 self.player.is_alive = False
                 return
-        ui.show_message("arrow_miss")
+        self.emit("arrow_miss")
+
+    # ARROW_MISS/HIT/SUICIDE of every steering from the player's room, indexed like ARROW_SHOTS
+    # Knows where the Wumpus is, for agents and analysis rather than hints to the player
+    def shot_outcomes(self) -> bytes:
+        targets = tuple(room.room_id for room in self.wumpus_rooms)
+        return arrow_outcomes(self.adjacency, self.player.current_room.room_id, targets)
 
     # Checks game status based on Wumpus existance or Player alive/arrows status
-    def check_game_state(self, ui: TextUI) -> str:
-        # If player is dead or has no arrows left, they lose
+    # A query: step() sets the cause when the state changes
+    def check_game_state(self, ui: TextUI = None) -> str:
+        # If player is dead, they lose
         if not self.player.is_alive:
             return "lose"
-        elif self.player.arrows <= 0:
-            ui.show_message("no_arrows")
-            return "lose"
-        
-        # If Wumpus is dead, player wins
-        if not any(room.has_wumpus for room in self.rooms):
+
+        # If Wumpus is dead, player wins (also with the last arrow)
+        if not self.wumpus_alive:
             return "win"
+
+        # If player has no arrows left, they lose
+        if self.player.arrows <= 0:
+            if ui is not None:
+                ui.show_message("no_arrows")
+            return "lose"
         
         # Otherwise, game continues
         return "running"
     
     # Method for ending game in run_game() function
-    def is_over(self, ui) -> bool:
+    def is_over(self, ui = None) -> bool:
         state = self.check_game_state(ui)
         if state == "lose":
             return True
@@ -612,36 +2171,1503 @@ class WumpusGame:
         elif state == "running":
             return False
 
-    # Main method for playing a full turn of the game
-    def play_turn(self, ui: TextUI):
+    # Resolves hazards after the player's action: pits, bats, chasing and Wumpus encounter
+    def resolve_turn(self):
+        if self.metrics is not None:
+            return self.resolve_turn_timed()
+        self.check_pit_kill()
+        if self.player.is_alive == False:
+            return
+        self.check_bats_transport()
+        self.wumpus_chase()
+        self.check_wumpus_encounter()
+
+    # resolve_turn() with the hazard checks and the chase timed separately
+    def resolve_turn_timed(self):
+        start = time.perf_counter()
+        self.check_pit_kill()
+        if self.player.is_alive == False:
+            self.metrics.observe("hazards", time.perf_counter() - start)
+            return
+        self.check_bats_transport()
+        hazards = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.wumpus_chase()
+        self.metrics.observe("chase", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        self.check_wumpus_encounter()
+        self.metrics.observe("hazards", hazards + time.perf_counter() - start)
+
+    # Headless engine API: applies one action and returns (state, events) for the turn
+    # action: "M" or "S", directions: "N" for a move, three letters ("NES") for a shot
+    # A shot may also take a lazy iterable of letters (the TextUI asks for each one), it stops being read on a hit
+    # Invalid input raises ValueError before anything in the game changes
+    def step(self, action: str, directions) -> tuple:
+        if action not in ("M", "S"):
+            raise ValueError(f"invalid action {action!r}")
+        if action == "M" and directions not in DIRECTIONS:
+            raise ValueError(f"invalid direction {directions!r}")
+        if action == "S" and isinstance(directions, str) and (len(directions) != 3
+                                                              or any(d not in DIRECTIONS for d in directions)):
+            raise ValueError(f"invalid arrow directions {directions!r}, a shot takes three of N, E, S, W")
+        metrics = self.metrics
+        if metrics is not None:
+            started = time.perf_counter()
+        self.events = []
+        if action == "M":
+            self.move(directions)
+        if action == "S":
+            if self.recorder is not None:
+                shot = []
+                directions = recorded(directions, shot)
+            self.fire_arrow(directions)
+        self.resolve_turn()
+        self.turns += 1
+        if metrics is None:
+            self.state = self.check_game_state()
+        else:
+            start = time.perf_counter()
+            self.state = self.check_game_state()
+            end = time.perf_counter()
+            metrics.observe("state", end - start)
+            metrics.observe("step", end - started)
+        if self.state == "lose" and self.player.is_alive:
+            self.cause = "no_arrows"
+        if self.recorder is not None:
+            self.recorder.turn(self, action, directions if action == "M" else "".join(shot))
+        return self.state, self.events
+
+    # Shows the senses and status panels at the start of a turn
+    def show_state(self, ui: TextUI):
         senses = ui.display_senses(self.sense_environment())
         status = ui.display_status(self.player.current_room.room_id, 
                                      self.player.arrows, 
                                      self.player.current_room.connected_rooms) 
         ui.show_panels(senses, status)
 
+    # Main method for playing a full turn of the game
+    def play_turn(self, ui: TextUI):
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        self.show_state(ui)
+        if metrics is not None:
+            metrics.observe("render", time.perf_counter() - start)
+
         # Loop for choosing a player action
         while True:
+            if metrics is not None:
+                start = time.perf_counter()
             action = ui.ask_action()
+            if metrics is not None:
+                metrics.observe("ask", time.perf_counter() - start)
             if action in ("M", "S"):
                 break
             else:
                 ui.show_message("invalid_action")
 
-        # Move or Shoot
-        if action == "M":
-            self.move_player(ui)
+        # Move or Shoot, engine events are shown by the UI as they happen
+        self.listener = ui.show_event
+        try:
+            if action == "M":
+                self.move_player(ui)
+            if action == "S":
+                self.shoot_arrow(ui)
+        finally:
+            self.listener = None
+
+    # Undo point for planners: the few values a turn changes, the cave itself is never copied
+    # Safe room changes are journaled and the rng state is saved only when a turn draws from it
+    def checkpoint(self) -> tuple:
+        if self.safe_rooms.journal is None:
+            self.safe_rooms.journal = []
+        slot = [None]
+        self.rng_slots.append(slot)
+        player = self.player
+        return (player.current_room, player.arrows, player.is_alive, [room.room_id for room in self.wumpus_rooms],
+                self.turns, self.state, self.cause, len(self.safe_rooms.journal), slot, len(self.rng_slots))
+
+    # Saves the rng state for the checkpoints taken since its last draw, called before every draw after setup
+    def save_rng(self):
+        slots = self.rng_slots
+        if slots and slots[-1][0] is None:
+            state = self.rng.getstate()
+            for slot in reversed(slots):
+                if slot[0] is not None:
+                    break
+                slot[0] = state
+
+    # Puts the game back to a checkpoint, which stays valid for more restores
+    # Checkpoints taken after it are dropped
+    def restore(self, checkpoint: tuple):
+        room, arrows, is_alive, wumpus_ids, turns, state, cause, mark, slot, depth = checkpoint
+        del self.rng_slots[depth:]
+        if slot[0] is not None:
+            self.rng.setstate(slot[0])
+
+        # The Wumpus flags go back before the safe rooms, whose journal restores their exact order
+        current_ids = [room.room_id for room in self.wumpus_rooms]
+        if current_ids != wumpus_ids:
+            for wumpus_room in self.wumpus_rooms:
+                wumpus_room.has_wumpus = False
+            self.wumpus_rooms = [self.rooms[wumpus_id] for wumpus_id in wumpus_ids]
+            for wumpus_room in self.wumpus_rooms:
+                wumpus_room.has_wumpus = True
+            self.wumpus_alive = bool(wumpus_ids)
+            self.update_senses(*current_ids, *wumpus_ids)
+        self.safe_rooms.undo(mark)
+
+        player = self.player
+        player.current_room = room
+        player.arrows = arrows
+        player.is_alive = is_alive
+        self.turns = turns
+        self.state = state
+        self.cause = cause
+        self.events = []
+
+    # Closes every checkpoint, normal play stops journaling
+    def forget_checkpoints(self):
+        self.rng_slots = []
+        self.safe_rooms.journal = None
+
+    # Independent copy of the game, sharing the cave topology (adjacency) and the chase field cache
+    # Only the player, the rng and the per-room hazard state are copied
+    def fork(self) -> WumpusGame:
+        fork = copy.copy(self)
+        fork.player = copy.copy(self.player)
+        fork.rng = random.Random()
+        fork.rng.setstate(self.rng.getstate())
+        fork.events = []
+        fork.rng_slots = []
+        fork.recorder = None
+        fork.listener = None
+        self.fork_cave(fork)
+        return fork
+
+    # Gives fork its own rooms with the hazard flags of this game
+    def fork_cave(self, fork: WumpusGame):
+        rooms = fork.rooms = [Room(i) for i in range(self.num_rooms)]
+        for room, original in zip(rooms, self.rooms):
+            room.connected_rooms = [rooms[nearby.room_id] for nearby in original.connected_rooms]
+            room.has_pit = original.has_pit
+            room.has_bats = original.has_bats
+            room.has_wumpus = original.has_wumpus
+        fork.safe_rooms = self.safe_rooms.copy(rooms)
+        fork.safe_rooms.journal = None
+        fork.senses = bytearray(self.senses)
+        fork.wumpus_rooms = [rooms[room.room_id] for room in self.wumpus_rooms]
+        fork.player.current_room = rooms[self.player.current_room.room_id]
+
+# ==============================================================
+#                     C O M P A C T   C A V E
+# ==============================================================
+# Optional array-backed cave for very large maps
+# Rooms live in flat arrays, Room-like views are created on demand
+# ==============================================================
+
+# Class for a lightweight view of one room in a CompactWumpusGame
+# Behaves like Room (room_id, connected_rooms, has_pit/has_bats/has_wumpus) without storing anything
+class CaveRoom:
+    __slots__ = ("game", "room_id")
+
+    def __init__(self, game, room_id: int):
+        self.game = game
+        self.room_id = room_id
+
+    def __eq__(self, other):
+        return isinstance(other, CaveRoom) and other.room_id == self.room_id and other.game is self.game
+
+    def __hash__(self):
+        return self.room_id
+
+    def __repr__(self):
+        return f"CaveRoom({self.room_id})"
+
+    @property
+    def connected_rooms(self) -> list:
+        adjacency = self.game.adjacency
+        base = self.room_id * 4
+        return [CaveRoom(self.game, r) for r in adjacency[base:base + 4] if r >= 0]
+
+    def _get(self, bit: int) -> bool:
+        return bool(self.game.hazards[self.room_id] & bit)
+
+    def _set(self, bit: int, value: bool):
+        if value:
+            self.game.hazards[self.room_id] |= bit
+        else:
+            self.game.hazards[self.room_id] &= ~bit
+
+    has_pit = property(lambda self: self._get(PIT), lambda self, v: self._set(PIT, v))
+    has_bats = property(lambda self: self._get(BATS), lambda self, v: self._set(BATS, v))
+    has_wumpus = property(lambda self: self._get(WUMPUS), lambda self, v: self._set(WUMPUS, v))
+
+# Class for the list of rooms in a CompactWumpusGame, a read-only sequence of CaveRoom views
+class CaveRooms(Sequence):
+    def __init__(self, game):
+        self.game = game
+
+    def __len__(self):
+        return self.game.num_rooms
+
+    def __getitem__(self, room_id: int) -> CaveRoom:
+        if not 0 <= room_id < self.game.num_rooms:
+            raise IndexError(room_id)
+        return CaveRoom(self.game, room_id)
+
+# Class for a WumpusGame stored as an N x 4 adjacency array and a hazard bitmask per room
+# adjacency[4 * room_id + direction] is the neighbor room id, -1 if the tunnel is missing
+class CompactWumpusGame(WumpusGame):
+    # Allocates the flat room arrays based on self.num_rooms
+    def generate_rooms(self):
+        self.adjacency = array("i", [-1]) * (self.num_rooms * 4)
+        self.hazards = bytearray(self.num_rooms)
+        self.rooms = CaveRooms(self)
+
+    # Connects all rooms to each other in both ways, same cave as WumpusGame.connect_rooms
+    def connect_rooms(self):
+        self.adjacency = build_cave(self.topology, self.num_rooms, self.rng)
+
+    # Places hazards in the appropriate number of rooms, same rules as WumpusGame.place_hazards
+    def place_hazards(self):
+        n = self.num_rooms
+        hazards = self.hazards
+        number_of_pits = int(n * self.pit_rate)
+        number_of_bats = int(n * self.bat_rate)
+
+        for room in self.rng.sample(range(n), number_of_pits):
+            hazards[room] = PIT
+
+        empty_rooms = [room for room in range(n) if not hazards[room]]
+        for room in self.rng.sample(empty_rooms, number_of_bats):
+            hazards[room] = BATS
+
+        empty_room = [room for room in range(n) if not hazards[room]]
+        self.wumpus_rooms = []
+        for wumpus in self.rng.sample(empty_room, self.wumpuses):
+            hazards[wumpus] = WUMPUS
+            self.wumpus_rooms.append(self.rooms[wumpus])
+
+        self.wumpus_alive = True
+        self.safe_rooms = RoomSet(self.rooms, (self.rooms[room] for room in range(n) if not hazards[room]))
+        self.senses = sense_table(self.adjacency, hazards)
+
+    def hazard_bits(self, room_id: int) -> int:
+        return self.hazards[room_id]
+
+    # Gives fork its own hazard and sense bytes, two memcpys of one byte per room
+    def fork_cave(self, fork: WumpusGame):
+        fork.hazards = bytearray(self.hazards)
+        fork.senses = bytearray(self.senses)
+        fork.rooms = CaveRooms(fork)
+        fork.safe_rooms = self.safe_rooms.copy(fork.rooms)
+        fork.safe_rooms.journal = None
+        fork.wumpus_rooms = [fork.rooms[room.room_id] for room in self.wumpus_rooms]
+        fork.player.current_room = fork.rooms[self.player.current_room.room_id]
+
+    # Breadth-first search over room ids with a parent array, returns a list of CaveRoom or None
+    def find_path(self, start: CaveRoom, goal: CaveRoom) -> list:
+        adjacency = self.adjacency
+        goal_id = goal.room_id
+        parent = array("i", [-1]) * self.num_rooms
+        parent[start.room_id] = start.room_id
+        queue = deque([start.room_id])
+
+        while queue:
+            room = queue.popleft()
+            if room == goal_id:
+                path = [room]
+                while room != start.room_id:
+                    room = parent[room]
+                    path.append(room)
+                return [self.rooms[r] for r in reversed(path)]
+
+            for nearby in adjacency[room * 4:room * 4 + 4]:
+                if nearby >= 0 and parent[nearby] < 0:
+                    parent[nearby] = room
+                    queue.append(nearby)
+        return None
+
+    # Moves the player through the tunnel in direction N/E/S/W
+    def move(self, direction: str):
+        target = self.adjacency[self.player.current_room.room_id * 4 + DIRECTIONS[direction]]
+        if target < 0:
+            raise IndexError(f"room {self.player.current_room.room_id} has no tunnel {direction}")
+        self.player.current_room = self.rooms[target]
+        self.emit("move", target)
+
+# ==============================================================
+#                         R E P L A Y S
+# ==============================================================
+# Binary replay log: every game is its seed, its difficulty parameters
+# and one byte per turn, enough to re-simulate it exactly without a UI
+#
+# File:    REPLAY_MAGIC, then records back to back
+# Record:  REPLAY_HEADER (seed, rooms, pit rate, bat rate, arrows, flags)
+#          flags: bit 0 the Wumpus chases, bits 1-3 the index in TOPOLOGY_NAMES,
+#          bits 4-7 the number of Wumpuses - 1
+#          one action byte per turn: 0b000000dd move, 0b10aabbcc shot
+#          REPLAY_END, then REPLAY_OUTCOME (state, cause, final room)
+# A game left before it ended (quit, end of input) is closed with a "running" outcome
+# A record without REPLAY_END is a game cut off by a crash, the reader stops at it
+# ==============================================================
+
+REPLAY_MAGIC = b"WUMPUSR1"
+REPLAY_HEADER = struct.Struct("<QIddBB")
+TOPOLOGY_NAMES = tuple(TOPOLOGIES)     # "random" is 0, so older replays read as random caves
+REPLAY_OUTCOME = struct.Struct("<BBI")
+REPLAY_END = 0xFF
+REPLAY_STATES = ("running", "win", "lose")
+REPLAY_CAUSES = (None, "pit_fall", "wumpus_attack", "suicide", "wumpus_hit", "no_arrows")
+
+# Action byte <-> (action, directions)
+REPLAY_ACTIONS = {index: ("M", direction) for direction, index in DIRECTIONS.items()}
+REPLAY_ACTIONS.update({0x80 | DIRECTIONS[shot[0]] << 4 | DIRECTIONS[shot[1]] << 2 | DIRECTIONS[shot[2]]: ("S", shot)
+                       for shot in ARROW_SHOTS})
+REPLAY_CODES = {action: code for code, action in REPLAY_ACTIONS.items()}
+REPLAY_VALID = bytes(sorted(REPLAY_ACTIONS))    # every action byte, for bytes.translate(None, REPLAY_VALID)
+
+# Class for appending games to a replay file as they are played
+# Set game.recorder to a ReplayWriter, WumpusGame.step() writes every turn as it happens
+class ReplayWriter:
+    def __init__(self, file):
+        self.file = file
+        self.game = None
+        if file.tell() == 0:
+            file.write(REPLAY_MAGIC)
+
+    # Writes the header the first time a game plays a turn, then one byte per turn
+    def turn(self, game, action: str, directions: str):
+        if game is not self.game:
+            self.finish()
+            self.game = game
+            if not 1 <= game.wumpuses <= 16:
+                raise ValueError(f"replays record 1 to 16 Wumpuses, got {game.wumpuses}")
+            self.file.write(REPLAY_HEADER.pack(game.seed, game.num_rooms, game.pit_rate, game.bat_rate,
+                                               game.starting_arrows,
+                                               bool(game.wumpus_chases) | TOPOLOGY_NAMES.index(game.topology) << 1
+                                               | game.wumpuses - 1 << 4))
         if action == "S":
-            self.shoot_arrow(ui)
+            directions = (directions + "NNN")[:3]    # an arrow that was never fired used no directions
+        self.file.write(bytes((REPLAY_CODES[action, directions],)))
+        if game.state != "running":
+            self.end(game)
+
+    def end(self, game):
+        self.file.write(bytes((REPLAY_END,)))
+        self.file.write(REPLAY_OUTCOME.pack(REPLAY_STATES.index(game.state), REPLAY_CAUSES.index(game.cause),
+                                            game.player.current_room.room_id))
+        self.file.flush()
+        self.game = None
+
+    # Closes the record of a game that was left before it ended, so more games can be appended after it
+    def finish(self):
+        if self.game is not None:
+            self.end(self.game)
+
+# Splits the contents of a replay file into records
+# Yields (params, seed, action bytes, outcome), outcome is (state, cause, room) or None for an unfinished game
+def read_replays(data: bytes):
+    if not data.startswith(REPLAY_MAGIC):
+        raise ValueError("not a Wumpus replay file")
+    position = len(REPLAY_MAGIC)
+    while position + REPLAY_HEADER.size <= len(data):
+        seed, num_rooms, pit_rate, bat_rate, arrows, flags = REPLAY_HEADER.unpack_from(data, position)
+        params = {"num_rooms": num_rooms, "pit_rate": pit_rate, "bat_rate": bat_rate,
+                  "starting_arrows": arrows, "wumpus_chases": bool(flags & 1), "wumpuses": (flags >> 4) + 1}
+        if flags >> 1 & 7:
+            params["topology"] = TOPOLOGY_NAMES[flags >> 1 & 7]
+        position += REPLAY_HEADER.size
+        end = data.find(REPLAY_END, position)
+        actions = data[position:end] if end >= 0 else data[position:]
+        if actions.translate(None, REPLAY_VALID):
+            return    # a cut off record ran into the next one, nothing after it can be found
+        if end < 0:
+            yield params, seed, actions, None
+            return
+        if end + 1 + REPLAY_OUTCOME.size > len(data):
+            return    # truncated tail
+        state, cause, room = REPLAY_OUTCOME.unpack_from(data, end + 1)
+        if state >= len(REPLAY_STATES) or cause >= len(REPLAY_CAUSES):
+            return
+        if state == 0:
+            yield params, seed, actions, None
+        else:
+            yield params, seed, actions, (REPLAY_STATES[state], REPLAY_CAUSES[cause], room)
+        position = end + 1 + REPLAY_OUTCOME.size
+
+# Re-simulates a recorded game without UI, returns the game after its last recorded turn
+def replay_game(params: dict, seed: int, actions: bytes, backend = None):
+    game = (backend or WumpusGame)(**params, seed = seed)
+    game.setup()
+    step = game.step
+    decode = REPLAY_ACTIONS
+    for code in actions:
+        action, directions = decode[code]
+        step(action, directions)
+    return game
+
+# True if re-simulating gives the recorded outcome (still running for an unfinished game)
+def verify_replay(params: dict, seed: int, actions: bytes, outcome, backend = None) -> bool:
+    game = replay_game(params, seed, actions, backend)
+    if outcome is None:
+        return game.state == "running"
+    return (game.state, game.cause, game.player.current_room.room_id) == outcome
 
-        # Move Wumpus and check for deaths
-        self.check_pit_kill(ui)
-        if self.player.is_alive == False:
+# ==============================================================
+#                       S N A P S H O T S
+# ==============================================================
+# Cave snapshot file: a generated cave and its game state, laid out to
+# be memory-mapped and used without parsing
+#
+# File:  CAVE_HEADER (parameters, player, Wumpuses, turns, outcome)
+#        the game rng state (625 uint32), zero padding to 8 bytes
+#        adjacency (num_rooms x 4 int32), safe room ids and positions
+#        (RoomSet.ids, RoomSet.pos, int32), rooms of the living
+#        Wumpuses (int32), hazards and senses (1 byte per room).
+#        Everything little-endian
+# load_cave() maps the file copy-on-write: processes loading the same
+# snapshot share its pages until they write one (the Wumpus moving
+# writes a few hazard and sense bytes), and the file never changes
+# ==============================================================
+
+CAVE_MAGIC = b"WUMPUSC2"
+CAVE_HEADER = struct.Struct("<8sQ?IddH?IH?HIIBBdI")
+CAVE_RNG = struct.Struct("<625I")
+
+# Byte offsets of the arrays in a snapshot of num_rooms rooms with safe safe rooms and alive living Wumpuses
+def cave_layout(num_rooms: int, safe: int, alive: int) -> dict:
+    adjacency = -(-(CAVE_HEADER.size + CAVE_RNG.size) // 8) * 8
+    ids = adjacency + num_rooms * 16
+    pos = ids + safe * 4
+    wumpus = pos + num_rooms * 4
+    hazards = wumpus + alive * 4
+    senses = hazards + num_rooms
+    return {"adjacency": adjacency, "ids": ids, "pos": pos, "wumpus": wumpus, "hazards": hazards,
+            "senses": senses, "end": senses + num_rooms}
+
+# int32 array as little-endian bytes
+def int32_bytes(values) -> bytes:
+    values = array("i", values)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+# Writes a set-up game (either backend) and its current state to path
+def save_cave(game, path: str):
+    n = game.num_rooms
+    version, state, gauss = game.rng.getstate()
+    layout = cave_layout(n, len(game.safe_rooms), len(game.wumpus_rooms))
+    header = CAVE_HEADER.pack(
+        CAVE_MAGIC, game.seed or 0, game.seed is not None, n, game.pit_rate, game.bat_rate,
+        game.starting_arrows, game.wumpus_chases,
+        game.player.current_room.room_id, game.player.arrows, game.player.is_alive,
+        game.wumpuses, len(game.wumpus_rooms), game.turns,
+        REPLAY_STATES.index(game.state), REPLAY_CAUSES.index(game.cause),
+        float("nan") if gauss is None else gauss, len(game.safe_rooms))
+    with open(path, "wb") as file:
+        file.write(header)
+        file.write(CAVE_RNG.pack(*state))
+        file.write(bytes(layout["adjacency"] - file.tell()))
+        file.write(int32_bytes(game.adjacency))
+        file.write(int32_bytes(game.safe_rooms.ids))
+        file.write(int32_bytes(game.safe_rooms.pos))
+        file.write(int32_bytes(room.room_id for room in game.wumpus_rooms))
+        file.write(bytes(game.hazard_bits(room_id) for room_id in range(n)))
+        file.write(game.senses)
+
+# Opens a snapshot as a CompactWumpusGame whose cave lives in the mapped file
+# The safe room set is copied (it grows and shrinks), everything else is used in place
+def load_cave(path: str) -> CompactWumpusGame:
+    import mmap
+    with open(path, "rb") as file:
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    view = memoryview(mapping)
+    (magic, seed, seeded, n, pit_rate, bat_rate, starting_arrows, wumpus_chases, player_room, arrows, is_alive,
+     wumpuses, alive, turns, state, cause, gauss, safe) = CAVE_HEADER.unpack_from(view)
+    if magic != CAVE_MAGIC:
+        raise ValueError("not a Wumpus cave snapshot")
+    layout = cave_layout(n, safe, alive)
+    if len(view) < layout["end"]:
+        raise ValueError("truncated Wumpus cave snapshot")
+
+    # int32 array at start, mapped in place unless own is set or the machine is big-endian
+    def int32s(start: int, count: int, own: bool = False):
+        data = view[start:start + count * 4]
+        if sys.byteorder == "little" and not own:
+            return data.cast("i")
+        values = array("i")
+        values.frombytes(data)
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values
+
+    game = CompactWumpusGame(n, pit_rate, bat_rate, starting_arrows, wumpus_chases, seed if seeded else None,
+                             wumpuses = wumpuses)
+    game.rng.setstate((3, CAVE_RNG.unpack_from(view, CAVE_HEADER.size), None if gauss != gauss else gauss))
+    game.rooms = CaveRooms(game)
+    game.adjacency = int32s(layout["adjacency"], n * 4)
+    game.hazards = view[layout["hazards"]:layout["hazards"] + n]
+    game.senses = view[layout["senses"]:layout["senses"] + n]
+    game.safe_rooms = RoomSet(game.rooms)
+    game.safe_rooms.ids = int32s(layout["ids"], safe, own = True)
+    game.safe_rooms.pos = int32s(layout["pos"], n, own = True)
+    game.wumpus_rooms = [game.rooms[room] for room in int32s(layout["wumpus"], alive)]
+    game.wumpus_alive = alive > 0
+    game.player = Player(game.rooms[player_room], arrows)
+    game.player.is_alive = is_alive
+    game.turns = turns
+    game.state = REPLAY_STATES[state]
+    game.cause = REPLAY_CAUSES[cause]
+    return game
+
+# ==============================================================
+#                        C A V E   P O O L
+# ==============================================================
+# Caves are generated ahead of time by one background thread per
+# difficulty, checked against fairness criteria and kept in a bounded
+# queue, so a new round starts without waiting for setup(). Pooled
+# games are ordinary seeded games: game.seed reproduces the same cave,
+# so replays and derive_seed() keep working
+# ==============================================================
+
+# Default fairness criteria, see unfair_reason()
+FAIRNESS = {
+    "max_pits_nearby": 1,       # pits next to the starting room
+    "min_wumpus_distance": 2,   # tunnels from the starting room to the nearest Wumpus
+    "pit_free_path": True,      # every Wumpus can be walked to without crossing a pit
+}
+
+# Name of the first fairness criterion a set-up game fails, None if it passes them all
+def unfair_reason(game, criteria: dict = FAIRNESS) -> str:
+    adjacency = game.adjacency
+    start = game.player.current_room.room_id
+    nearby = [room for room in adjacency[start * 4:start * 4 + 4] if room >= 0]
+    if sum(game.hazard_bits(room) & PIT for room in nearby) > criteria.get("max_pits_nearby", 4) * PIT:
+        return "max_pits_nearby"
+
+    wumpuses = [room.room_id for room in game.wumpus_rooms]
+    field = ChaseField(adjacency)
+    field.refresh(start)
+    if min(field.distance(room) for room in wumpuses) < criteria.get("min_wumpus_distance", 0):
+        return "min_wumpus_distance"
+
+    if criteria.get("pit_free_path", False):
+        seen = {start}
+        queue = deque([start])
+        while queue:
+            room = queue.popleft()
+            for other in adjacency[room * 4:room * 4 + 4]:
+                if other >= 0 and other not in seen and not game.hazard_bits(other) & PIT:
+                    seen.add(other)
+                    queue.append(other)
+        if not seen.issuperset(wumpuses):
+            return "pit_free_path"
+    return None
+
+# Class for the pool of set-up games, get(params) returns one of the difficulty's pooled games
+# Counts hits, misses, candidates and rejections (per criterion) and times generation into self.metrics
+class CavePool:
+    def __init__(self, difficulties: dict = DIFFICULTIES, size: int = 4, criteria: dict = FAIRNESS,
+                 seed: int = SEED, backend = None):
+        self.size = size
+        self.criteria = criteria
+        self.seed = seed
+        self.backend = backend or WumpusGame
+        self.metrics = Metrics()
+        self.lock = threading.Lock()        # guards self.metrics, shared with the producer threads
+        self.stopping = threading.Event()
+        self.queues = {}                    # parameter key -> Queue of set-up games
+        self.labels = {}                    # parameter key -> difficulty name, for seeds
+        for label, params in difficulties.items():
+            key = self.key(params)
+            self.queues[key] = Queue(size)
+            self.labels[key] = label
+        self.threads = []
+
+    @staticmethod
+    def key(params: dict) -> tuple:
+        return tuple(sorted(params.items()))
+
+    def count(self, name: str):
+        with self.lock:
+            self.metrics.count(name)
+
+    # Starts one producer thread per difficulty, returns the pool
+    def start(self) -> "CavePool":
+        for key in self.queues:
+            thread = threading.Thread(target=self.produce, args=(key,), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def close(self):
+        self.stopping.set()
+
+    # Producer loop: builds candidate games from consecutive seeds and queues the fair ones
+    # One thread per difficulty, so every difficulty hands out the same games in the same order
+    def produce(self, key: tuple):
+        params = dict(key)
+        label = self.labels[key]
+        pool = self.queues[key]
+        candidate = 0
+        while not self.stopping.is_set():
+            start = time.perf_counter()
+            game = self.backend(**params, seed = derive_seed(self.seed, "pool", label, candidate))
+            game.setup()
+            candidate += 1
+            reason = unfair_reason(game, self.criteria)
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.metrics.observe("pool_generate", elapsed)
+                self.metrics.count("pool_generated")
+                if reason is not None:
+                    self.metrics.count("pool_rejected")
+                    self.metrics.count("pool_rejected_" + reason)
+            if reason is not None:
+                continue
+            while not self.stopping.is_set():
+                try:
+                    pool.put(game, timeout=0.1)
+                    break
+                except Full:
+                    pass
+
+    # A set-up game for params: from the pool (a hit), waiting for its producer when empty (a miss),
+    # or generated here without a fairness check for parameters the pool does not hold
+    # block=False returns None instead of waiting or generating, for callers on an event loop
+    def get(self, params: dict, seed: int = None, block: bool = True):
+        pool = self.queues.get(self.key(params))
+        if pool is None:
+            if not block:
+                return None
+            self.count("pool_unpooled")
+            game = self.backend(**params, seed = seed)
+            game.setup()
+            return game
+        try:
+            game = pool.get_nowait()
+            self.count("pool_hit")
+        except Empty:
+            if not block:
+                return None
+            start = time.perf_counter()
+            game = pool.get()
+            with self.lock:
+                self.metrics.count("pool_miss")
+                self.metrics.observe("pool_wait", time.perf_counter() - start)
+        return game
+
+    # Hit rate and generation throughput so far
+    def stats(self) -> dict:
+        with self.lock:
+            counters = dict(self.metrics.counters)
+            counts, total = self.metrics.histograms.get("pool_generate", [[0], 0.0])
+        hits = counters.get("pool_hit", 0)
+        requests = hits + counters.get("pool_miss", 0)
+        generated = sum(counts)
+        return {
+            "hit_rate": hits / requests if requests else 0.0,
+            "caves_per_sec": generated / total if total else 0.0,
+            "rejection_rate": counters.get("pool_rejected", 0) / generated if generated else 0.0,
+            "pooled": sum(pool.qsize() for pool in self.queues.values()),
+        }
+
+# ==============================================================
+#                   B A T C H E D   G A M E S
+# ==============================================================
+# Many games of one difficulty stepped in lockstep, stored as flat
+# arrays instead of one WumpusGame per game. Room r of game g is the
+# global room g * num_rooms + r, so one adjacency array and one hazard
+# byte per room (PIT/BATS/WUMPUS) hold every cave, and one sense_table()
+# covers them all. Actions are replay action bytes (REPLAY_CODES),
+# states and causes are indices into REPLAY_STATES and REPLAY_CAUSES
+# ==============================================================
+
+# Class for K games played in lockstep with the rules of WumpusGame.step
+# Game g starts like CompactWumpusGame(seed = derive_seed(seed, g)), bat drops draw from one shared rng
+# A horde of k Wumpuses per game takes k slots in wumpus, game g uses wumpus[g * k:g * k + k]
+class WumpusBatch:
+    MAX_DROP_DRAWS = 64    # random draws for a bat drop before safe_room() falls back to listing the rooms
+
+    def __init__(self, params: dict, games: int, seed: int = SEED):
+        self.params = dict(params)
+        self.num_games = games
+        self.wumpuses = params.get("wumpuses", 1)
+        self.num_rooms = n = params["num_rooms"]
+        self.starting_arrows = params["starting_arrows"]
+        self.wumpus_chases = params["wumpus_chases"]
+        self.rng = random.Random(derive_seed(seed, "batch"))
+
+        self.adjacency = array("i")
+        hazards = bytearray()
+        player = array("i")
+        wumpus = array("i")
+        drops = array("i")                  # global rooms without pit or bats, game by game
+        first_drop = array("I", [0])        # drops[first_drop[g]:first_drop[g + 1]] are the rooms of game g
+        for g in range(games):
+            game = CompactWumpusGame(**params, seed = derive_seed(seed, g))
+            game.setup()
+            base = g * n
+            self.adjacency.extend([room + base for room in game.adjacency])
+            hazards += game.hazards
+            player.append(base + game.player.current_room.room_id)
+            wumpus.extend([base + room.room_id for room in game.wumpus_rooms])
+            drops.extend([base + room for room, bits in enumerate(game.hazards) if not bits & (PIT | BATS)])
+            first_drop.append(len(drops))
+
+        self.hazards = hazards                                  # PIT | BATS | WUMPUS per global room
+        self.senses = sense_table(self.adjacency, hazards)      # hazard bits sensed per global room
+        self.player = player                                    # global room of each player
+        self.wumpus = wumpus                                    # global room of each Wumpus, -1 once dead
+        self.alive = bytearray([self.wumpuses]) * games         # Wumpuses left in each game
+        self.arrows = bytearray([self.starting_arrows]) * games
+        self.state = bytearray(games)                           # index into REPLAY_STATES
+        self.cause = bytearray(games)                           # index into REPLAY_CAUSES
+        self.turns = array("I", [0]) * games
+        self.drops = drops
+        self.first_drop = first_drop
+        self.start = (bytes(hazards), bytes(self.senses), array("i", player), array("i", wumpus))
+
+        # Chase table: hops[goal][room - base] is the next room (of the same game) from room towards the global
+        # goal room, a row is built by chase_row() the first time a Wumpus chases towards goal.
+        # A cave never changes, so rows outlive restarts
+        self.NO_HOP = 255 if n < 255 else -1
+        self.hops = {}
+
+    # Puts game g back to its first turn, same cave, hazards and spawn
+    def restart(self, g: int):
+        hazards, senses, player, wumpus = self.start
+        n = self.num_rooms
+        rooms = slice(g * n, g * n + n)
+        self.hazards[rooms] = hazards[rooms]
+        self.senses[rooms] = senses[rooms]
+        self.player[g] = player[g]
+        k = self.wumpuses
+        self.wumpus[g * k:g * k + k] = wumpus[g * k:g * k + k]
+        self.alive[g] = k
+        self.arrows[g] = self.starting_arrows
+        self.state[g] = 0
+        self.cause[g] = 0
+        self.turns[g] = 0
+
+    # Restarts every finished game, returns how many were restarted
+    def restart_finished(self) -> int:
+        finished = [g for g, state in enumerate(self.state) if state]
+        for g in finished:
+            self.restart(g)
+        return len(finished)
+
+    # Moves the Wumpus smell from the neighbors of old to the neighbors of new (-1 when it dies)
+    # With one Wumpus per game only its bit changes, in a horde the rooms around both are sensed again
+    def move_smell(self, old: int, new: int):
+        adjacency = self.adjacency
+        senses = self.senses
+        if self.wumpuses == 1:
+            for nearby in adjacency[old * 4:old * 4 + 4]:
+                senses[nearby] &= ~WUMPUS
+            if new >= 0:
+                for nearby in adjacency[new * 4:new * 4 + 4]:
+                    senses[nearby] |= WUMPUS
+            return
+        hazards = self.hazards
+        for moved in (old, new):
+            if moved < 0:
+                continue
+            for nearby in adjacency[moved * 4:moved * 4 + 4]:
+                if any(hazards[other] & WUMPUS for other in adjacency[nearby * 4:nearby * 4 + 4]):
+                    senses[nearby] |= WUMPUS
+                else:
+                    senses[nearby] &= ~WUMPUS
+
+    # Uniform random room of game g without pit, bats or Wumpus, other than room (safe_rooms in WumpusGame)
+    # Draws from the rooms without pit or bats, only a Wumpus or room itself can make a draw miss
+    def safe_room(self, g: int, room: int) -> int:
+        drops = self.drops
+        first, last = self.first_drop[g], self.first_drop[g + 1]
+        hazards = self.hazards
+        for _ in range(self.MAX_DROP_DRAWS):
+            if first == last:
+                break
+            drop = drops[first + self.rng.randrange(last - first)]
+            if not hazards[drop] and drop != room:
+                return drop
+        landing = [drop for drop in drops[first:last] if not hazards[drop] and drop != room]
+        if not landing:
+            raise ValueError(f"game {g} has no room without pit, bats or Wumpus to land in")
+        return self.rng.choice(landing)
+
+    # Builds the chase table row of a global goal room with ChaseField's breadth-first hops
+    def chase_row(self, goal: int) -> array:
+        n = self.num_rooms
+        base = goal - goal % n
+        row = array("B" if n < 255 else "i", [self.NO_HOP]) * n
+        adjacency = self.adjacency
+        row[goal - base] = goal - base
+        queue = deque([goal])
+        while queue:
+            current = queue.popleft()
+            for nearby in adjacency[current * 4:current * 4 + 4]:
+                if row[nearby - base] == self.NO_HOP:
+                    row[nearby - base] = current - base
+                    queue.append(nearby)
+        self.hops[goal] = row
+        return row
+
+    # Next global room of a chasing Wumpus in start towards goal, -1 if goal can't be reached
+    def chase_hop(self, start: int, goal: int) -> int:
+        row = self.hops.get(goal)
+        if row is None:
+            row = self.chase_row(goal)
+        base = goal - goal % self.num_rooms
+        hop = row[start - base]
+        return -1 if hop == self.NO_HOP else base + hop
+
+    # Tunnels from start to goal along the chase table, -1 if goal can't be reached (ChaseField.distance)
+    def chase_distance(self, start: int, goal: int) -> int:
+        steps = 0
+        while start != goal:
+            start = self.chase_hop(start, goal)
+            if start < 0:
+                return -1
+            steps += 1
+        return steps
+
+    # Plays one action byte per game, finished games are skipped; returns the number of games still running
+    def step(self, actions) -> int:
+        adjacency = self.adjacency
+        hazards = self.hazards
+        player = self.player
+        wumpus = self.wumpus
+        alive = self.alive
+        k = self.wumpuses
+        arrows = self.arrows
+        state = self.state
+        cause = self.cause
+        turns = self.turns
+        chases = self.wumpus_chases
+        running = 0
+        for g, code in enumerate(actions):
+            if state[g]:
+                continue
+            room = player[g]
+            turns[g] += 1
+
+            # Move or shoot, an arrow leaves every room through that room's tunnels
+            if code < 4:
+                room = player[g] = adjacency[room * 4 + code]
+            elif arrows[g]:
+                arrows[g] -= 1
+                arrow = room
+                for shift in (4, 2, 0):
+                    arrow = adjacency[arrow * 4 + (code >> shift & 3)]
+                    if hazards[arrow] & WUMPUS:
+                        hazards[arrow] &= ~WUMPUS
+                        wumpus[wumpus.index(arrow, g * k, g * k + k)] = -1
+                        alive[g] -= 1
+                        self.move_smell(arrow, -1)
+                        if not alive[g]:
+                            cause[g] = 4    # wumpus_hit
+                        break
+                    if arrow == room:
+                        cause[g] = 3    # suicide
+                        break
+                if cause[g] == 3:
+                    state[g] = 2
+                    continue
+
+            # Hazards and the chase, as WumpusGame.resolve_turn
+            if hazards[room] & PIT:
+                state[g], cause[g] = 2, 1
+                continue
+            if hazards[room] & BATS:
+                room = player[g] = self.safe_room(g, room)
+            if chases and alive[g]:
+                # Nearest Wumpus first, one never steps into a room that already holds one
+                slots = range(g * k, g * k + k)
+                if alive[g] > 1:
+                    slots = sorted((i for i in slots if wumpus[i] >= 0),
+                                   key=lambda i: (self.chase_distance(wumpus[i], room), wumpus[i]))
+                for i in slots:
+                    old = wumpus[i]
+                    if old < 0 or old == room:
+                        continue
+                    hop = self.chase_hop(old, room)
+                    if hop < 0:
+                        hop = self.safe_room(g, old)
+                    elif hazards[hop] & WUMPUS:
+                        continue
+                    hazards[old] &= ~WUMPUS
+                    hazards[hop] |= WUMPUS
+                    wumpus[i] = hop
+                    self.move_smell(old, hop)
+            if hazards[room] & WUMPUS:
+                state[g], cause[g] = 2, 2
+                continue
+
+            # Game state, as WumpusGame.check_game_state
+            if not alive[g]:
+                state[g] = 1
+            elif not arrows[g]:
+                state[g], cause[g] = 2, 5
+            else:
+                running += 1
+        return running
+
+    # Senses of the players as one PIT | BATS | WUMPUS byte per game
+    def sensed(self) -> bytes:
+        senses = self.senses
+        return bytes(senses[room] for room in self.player)
+
+# ==============================================================
+#                     E N V I R O N M E N T
+# ==============================================================
+# reset/step interface for agents, in the style of Gym environments
+# Actions are integers: 0-3 move N/E/S/W, 4 + t shoots ARROW_SHOTS[t]
+# Observations are OBS_SIZE integers written into a buffer the caller
+# allocates once (array("i"), a NumPy int32 array, ...):
+#   pit, bats, wumpus sensed (0/1), current room, N/E/S/W neighbor ids
+#   (-1 for a missing tunnel), arrows left
+# ==============================================================
+
+ENV_ACTIONS = [("M", direction) for direction in "NESW"] + [("S", shot) for shot in ARROW_SHOTS]
+OBS_SIZE = 9
+OBS_SENSES = 0      # index of the pit sense, bats and wumpus follow
+OBS_ROOM = 3
+OBS_NEIGHBORS = 4   # index of the N neighbor, E, S and W follow
+OBS_ARROWS = 8
+
+# Class for one WumpusGame behind reset(seed) and step(action)
+# Reward is +1 for a win, -1 for a loss and 0 otherwise; max_turns ends (truncates) long games
+class WumpusEnv:
+    REWARDS = {"running": 0.0, "win": 1.0, "lose": -1.0}
+
+    def __init__(self, params: dict = None, backend = None, max_turns: int = None, observation = None):
+        self.params = dict(params or DIFFICULTIES["N"])
+        self.backend = backend or WumpusGame
+        self.max_turns = max_turns
+        self.observation = array("i", [0]) * OBS_SIZE if observation is None else observation
+        self.game = None
+        self.done = True
+
+    # Starts a new game, writes its first observation into observation (default: self.observation) and returns it
+    def reset(self, seed: int = None, observation = None):
+        self.game = self.backend(**self.params, seed = seed)
+        self.game.setup()
+        self.done = False
+        return self.observe(self.observation if observation is None else observation)
+
+    # Plays one action, returns (observation, reward, done)
+    def step(self, action: int, observation = None) -> tuple:
+        if self.done:
+            raise ValueError("the game is over, call reset() first")
+        if not 0 <= action < len(ENV_ACTIONS):
+            raise ValueError(f"invalid action {action!r}")
+        game = self.game
+        state, _ = game.step(*ENV_ACTIONS[action])
+        self.done = state != "running" or (self.max_turns is not None and game.turns >= self.max_turns)
+        return self.observe(self.observation if observation is None else observation), self.REWARDS[state], self.done
+
+    # Writes the current observation into a buffer of OBS_SIZE integers, item by item without allocating
+    def observe(self, observation):
+        game = self.game
+        room = game.player.current_room.room_id
+        sensed = game.senses[room]
+        observation[0] = sensed & PIT
+        observation[1] = (sensed & BATS) >> 1
+        observation[2] = (sensed & WUMPUS) >> 2
+        observation[3] = room
+        adjacency = game.adjacency
+        base = room * 4
+        observation[4] = adjacency[base]
+        observation[5] = adjacency[base + 1]
+        observation[6] = adjacency[base + 2]
+        observation[7] = adjacency[base + 3]
+        observation[8] = game.player.arrows
+        return observation
+
+# ==============================================================
+#                         P L A N N E R
+# ==============================================================
+# Monte Carlo tree search on the game's own state: every iteration
+# walks down the tree by UCT, tries one new action, plays a random
+# rollout and backs the result up, then restore() undoes it all.
+# It knows where the Wumpus is and which bat drops the rng will give,
+# so it is an upper bound for testing players and analysing caves,
+# not a fair opponent (see Solver for one)
+# ==============================================================
+
+# Class for a node of the search tree, actions are tried in order and become children
+class PlanNode:
+    __slots__ = ("actions", "children", "visits", "wins")
+
+    def __init__(self, actions: list):
+        self.actions = actions
+        self.children = {}
+        self.visits = 0
+        self.wins = 0.0
+
+# Class for the planner, plan() returns this turn's ("M", direction) or ("S", three directions)
+class MCTSPlanner:
+    EXPLORATION = 1.4   # UCT exploration constant
+    ROLLOUT_TURNS = 30  # a rollout still running after this many turns counts as a loss
+    SHOT_RATE = 0.1     # rollouts walk at random and shoot a random steering this often
+
+    def __init__(self, game, iterations: int = 2000, seed: int = None):
+        self.game = game
+        self.iterations = iterations
+        self.rng = random.Random(seed)
+        self.states = 0     # turns simulated so far, tree and rollouts
+
+    # Moves, plus a shot that hits a Wumpus when one does
+    def actions(self) -> list:
+        actions = [("M", direction) for direction in "NESW"]
+        shot = self.hit_shot()
+        if shot is not None:
+            actions.insert(0, ("S", shot))
+        return actions
+
+    # First steering from the player's room that hits a Wumpus before flying back into the room, or None
+    def hit_shot(self):
+        game = self.game
+        if not game.wumpus_alive or game.player.arrows <= 0:
+            return None
+        room = game.player.current_room.room_id
+        levels = arrow_flights(game.adjacency, room)
+        for depth, level in enumerate(levels):
+            for wumpus_room in game.wumpus_rooms:
+                wumpus = wumpus_room.room_id
+                if wumpus in level:
+                    prefix = level.index(wumpus)
+                    if all(levels[before][prefix >> 2 * (depth - before)] != room for before in range(depth)):
+                        return ARROW_SHOTS[prefix << 2 * (2 - depth)][:depth + 1] + "N" * (2 - depth)
+        return None
+
+    # Random turns until the game ends or ROLLOUT_TURNS pass, 1.0 for a win
+    def rollout(self) -> float:
+        game = self.game
+        rng = self.rng
+        for _ in range(self.ROLLOUT_TURNS):
+            if game.state != "running":
+                break
+            if rng.random() < self.SHOT_RATE:
+                game.step("S", rng.choice(ARROW_SHOTS))
+            else:
+                game.step("M", "NESW"[rng.randrange(4)])
+            self.states += 1
+        return 1.0 if game.state == "win" else 0.0
+
+    def plan(self) -> tuple:
+        game = self.game
+        listener, recorder, metrics = game.listener, game.recorder, game.metrics
+        game.listener = game.recorder = game.metrics = None
+        root = PlanNode(self.actions())
+        start = game.checkpoint()
+        try:
+            for _ in range(self.iterations):
+                node = root
+                path = [root]
+                # Selection and expansion: UCT through fully tried nodes, then one untried action
+                while game.state == "running":
+                    if len(node.children) < len(node.actions):
+                        action = node.actions[len(node.children)]
+                        game.step(*action)
+                        self.states += 1
+                        child = node.children[action] = PlanNode(self.actions() if game.state == "running" else [])
+                        path.append(child)
+                        break
+                    log_visits = math.log(node.visits)
+                    action, node = max(node.children.items(), key=lambda item: item[1].wins / item[1].visits
+                                       + self.EXPLORATION * math.sqrt(log_visits / item[1].visits))
+                    game.step(*action)
+                    self.states += 1
+                    path.append(node)
+                result = self.rollout()
+                for node in path:
+                    node.visits += 1
+                    node.wins += result
+                game.restore(start)
+        finally:
+            game.restore(start)
+            game.forget_checkpoints()
+            game.listener, game.recorder, game.metrics = listener, recorder, metrics
+        return max(root.children.items(), key=lambda item: item[1].visits)[0]
+
+# Answers for ScriptedUI from an MCTSPlanner playing the game
+def planner_policy(game, iterations: int = 500, seed: int = None):
+    planner = MCTSPlanner(game, iterations, seed)
+    plan = deque()
+    def policy(kind: str) -> str:
+        if kind == "action":
+            action, directions = planner.plan()
+            plan.clear()
+            plan.extend(directions)
+            return action
+        return plan.popleft() if plan else "N"
+    return policy
+
+# ==============================================================
+#                          S E R V E R
+# ==============================================================
+# Asyncio TCP server hosting many WumpusGame sessions at once
+# Plain line protocol, playable with telnet or netcat:
+#   M N        move north
+#   S N E S    shoot an arrow steered north, east, south (1-3 directions)
+#   Q          quit
+# Every prompt ends with ": " and no newline
+# ==============================================================
+
+# Class for a TextUI that renders into a buffer instead of the terminal
+# The timeline is played by the session with asyncio.sleep, so pauses never block other sessions
+class SessionUI(TextUI):
+    WIDTH = 120
+    TEXT_CACHE_SIZE = 4096
+    texts = {}    # (objects, print options) -> rendered text, shared by every session
+
+    def __init__(self, speed: float = 1.0):
+        self.buffer = io.StringIO()
+        load_rich()
+        super().__init__(Console(file=self.buffer, width=self.WIDTH, color_system=None, force_terminal=False), speed)
+        self.renderer = SharedPanelRenderer(self.console)
+
+    # Returns and clears everything rendered since the last call
+    def take(self) -> str:
+        text = self.buffer.getvalue()
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return text
+
+    # Text of console.print(*objects, **kwargs), rendered once per server for the same arguments
+    # build: optional function returning the objects, only called when the text isn't cached
+    def render_text(self, key: tuple, build = None) -> str:
+        texts = SessionUI.texts
+        text = texts.get(key)
+        if text is None:
+            objects, options = key
+            if build is not None:
+                objects = build()
+            with self.console.capture() as capture:
+                self.console.print(*objects, **dict(options))
+            text = capture.get()
+            if len(texts) >= self.TEXT_CACHE_SIZE:
+                del texts[next(iter(texts))]
+            texts[key] = text
+        return text
+
+    # Queues a message, messages made of strings come from the shared cache
+    def print(self, *objects, **kwargs):
+        if all(isinstance(item, str) for item in objects):
+            try:
+                text = self.render_text((objects, tuple(sorted(kwargs.items()))))
+            except TypeError:    # unhashable print options
+                super().print(*objects, **kwargs)
+                return
+            self.timeline.add(partial(self.buffer.write, text))
+        else:
+            super().print(*objects, **kwargs)
+
+    # Queues a panel that never changes (the difficulty menu), built and rendered once per server
+    def print_static(self, name: str, build):
+        self.timeline.add(partial(self.buffer.write, self.render_text((name, ()), lambda: (build(),))))
+
+    # No cursor tricks over a socket
+    def clear_prompt(self, to_clear: str):
+        pass
+
+# Class for a PanelRenderer whose rendered panels and rows are shared by every session of the server
+# Every session renders at the same width without colors, so panels with the same content render to the
+# same lines, whichever session built them. Panels are keyed by content instead of by object
+class SharedPanelRenderer(PanelRenderer):
+    ROW_CACHE_SIZE = 4096
+    panels = {}    # (console width, column width, panel content) -> rendered lines
+    rows = {}      # (console width, panel contents) -> text of the row
+    measured = {}  # panel content -> width of a panel with expand=False
+
+    # Hashable content of a panel, None if its renderable isn't plain markup
+    @staticmethod
+    def content(panel):
+        if not isinstance(panel.renderable, str):
+            return None
+        return (panel.renderable, panel.title, str(panel.border_style), panel.height, panel.expand)
+
+    @staticmethod
+    def remember(cache: dict, key, value, size: int):
+        if len(cache) >= size:
+            del cache[next(iter(cache))]
+        cache[key] = value
+
+    def render(self, panel, width: int) -> list:
+        content = self.content(panel)
+        if content is None:
+            return super().render(panel, width)
+        key = (self.console.width, width, content)
+        lines = self.panels.get(key)
+        if lines is not None:
+            self.cache_hits += 1
+            return lines
+        lines = self.console.render_lines(panel, self.console.options.update_width(width), pad=True)
+        self.remember(self.panels, key, lines, self.ROW_CACHE_SIZE)
+        return lines
+
+    def measure(self, panel) -> int:
+        content = self.content(panel)
+        if content is None:
+            return super().measure(panel)
+        width = self.measured.get(content)
+        if width is None:
+            width = self.console.measure(panel).maximum
+            self.remember(self.measured, content, width, self.CACHE_SIZE)
+        return width
+
+    # Without colors the segments need no styling, their text is the output
+    def lines(self, segments: list) -> list:
+        if self.console.color_system is not None:
+            return super().lines(segments)
+        return "".join(segment.text for segment in segments).splitlines()
+
+    # Appends the row below the output, a session is never a terminal so rows are never redrawn in place
+    def draw(self, panels: list):
+        contents = tuple(self.content(panel) for panel in panels)
+        if None in contents:
+            super().draw(panels)
             return
-        self.check_bats_transport(ui)
-        self.wumpus_chase(ui)
-        self.check_wumpus_encounter(ui)
+        start = time.perf_counter()
+        key = (self.console.width, contents)
+        text = self.rows.get(key)
+        if text is None:
+            text = "\n".join(self.compose(panels)) + "\n"
+            self.remember(self.rows, key, text, self.ROW_CACHE_SIZE)
+        else:
+            self.cache_hits += 1
+        self.console.file.write(text)
+        self.bytes += len(text.encode("utf-8", "replace"))
+        self.draws += 1
+        self.render_seconds += time.perf_counter() - start
+
+# Splits a command line into (action, directions), None if it isn't a valid command
+# "m n" -> ("M", "N"), "S NES" -> ("S", "NES"), "q" -> ("Q", "")
+def parse_command(line: str):
+    text = "".join(line.upper().split())
+    if not text or text[0] not in "MSQ":
+        return None
+    action, directions = text[0], text[1:]
+    if any(direction not in DIRECTIONS for direction in directions):
+        return None
+    if (action == "M" and len(directions) > 1) or (action == "S" and len(directions) > 3) or (action == "Q" and directions):
+        return None
+    return action, directions
+
+# Class for one connected player, plays rounds of WumpusGame over the socket
+class GameSession:
+    def __init__(self, reader, writer, seed: int, speed: float = 1.0, metrics: Metrics = None,
+                 pool: CavePool = None, wumpuses: int = None):
+        self.reader = reader
+        self.writer = writer
+        self.seed = seed
+        self.ui = SessionUI(speed)
+        self.metrics = metrics  # optional Metrics of this session, merged into the server's when it ends
+        self.pool = pool        # optional CavePool shared by all sessions
+        self.wumpuses = wumpuses    # optional horde size for every difficulty
+
+    # Plays the UI timeline to the socket, pausing between frames without blocking other sessions
+    async def flush(self):
+        frames = self.ui.timeline.frames
+        while frames:
+            action, seconds = frames.popleft()
+            if action is not None:
+                action()
+            delay = self.ui.timeline.delay(seconds)
+            if delay > 0:
+                self.writer.write(self.ui.take().encode())
+                await self.writer.drain()
+                import asyncio
+                await asyncio.sleep(delay)
+        self.writer.write(self.ui.take().encode())
+        await self.writer.drain()
+
+    # Shows a prompt and returns the player's answer, raises EOFError when the player is gone
+    async def ask(self, prompt: str) -> str:
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        await self.flush()
+        self.writer.write(prompt.encode())
+        await self.writer.drain()
+        if metrics is not None:
+            waiting = time.perf_counter()
+            metrics.observe("playback", waiting - start)
+        line = await self.reader.readline()
+        if metrics is not None:
+            metrics.observe("input_wait", time.perf_counter() - waiting)
+        if not line:
+            raise EOFError("player disconnected")
+        return line.decode(errors="replace").strip()
+
+    async def ask_difficulty(self) -> dict:
+        self.ui.print_static("difficulties", self.ui.difficulty_panel)
+        while True:
+            choice = (await self.ask("Choose a difficulty [E/N/H]: ")).upper()
+            if choice in DIFFICULTIES:
+                if self.wumpuses is not None:
+                    return dict(DIFFICULTIES[choice], wumpuses = self.wumpuses)
+                return dict(DIFFICULTIES[choice])
+            if choice == "Q":
+                raise EOFError("player quit")
+            self.ui.print("Not a valid difficulty!\n")
+
+    # Asks for one full command, filling in missing directions with follow-up prompts
+    async def ask_command(self) -> tuple:
+        while True:
+            command = parse_command(await self.ask("> Move or Shoot (M/S): "))
+            if command is None:
+                self.ui.show_message("invalid_action")
+                continue
+            action, directions = command
+            while action == "M" and not directions:
+                command = parse_command("M" + await self.ask("> [N/E/S/W] Direction: "))
+                directions = command[1] if command else ""
+                if not directions:
+                    self.ui.show_message("invalid_direction")
+            while action == "S" and len(directions) < 3:
+                command = parse_command("S" + directions + await self.ask(f"> [N/E/S/W] Arrow direction {len(directions) + 1}/3: "))
+                if command is None:
+                    self.ui.show_message("invalid_direction")
+                else:
+                    directions = command[1]
+            return action, directions
+
+    # Plays one full game, returns False if the player quit
+    async def play_round(self, round_number: int) -> bool:
+        params = await self.ask_difficulty()
+        if self.pool is not None:
+            seed = derive_seed(self.seed, round_number)
+            game = self.pool.get(params, seed = seed, block = False)
+            if game is None:
+                # A miss waits for the producer in a worker thread, never on the event loop every session shares
+                import asyncio
+                game = await asyncio.get_running_loop().run_in_executor(None, partial(self.pool.get, params, seed))
+        else:
+            game = WumpusGame(**params, seed = derive_seed(self.seed, round_number))
+            game.setup()
+        game.listener = self.ui.show_event
+        game.metrics = metrics = self.metrics
+        while not game.is_over():
+            if metrics is not None:
+                start = time.perf_counter()
+            game.show_state(self.ui)
+            if metrics is not None:
+                metrics.observe("render", time.perf_counter() - start)
+            action, directions = await self.ask_command()
+            if action == "Q":
+                return False
+            game.step(action, directions)
+        game.check_game_state(self.ui)
+        self.ui.show_result(game.check_game_state())
+        return True
+
+    async def run(self):
+        self.ui.print("WUMPUS | culverts beneath Hardox | commands: M N, S N E S, Q\n")
+        round_number = 0
+        while await self.play_round(round_number):
+            round_number += 1
+            if (await self.ask("Play again? [Y/N]: ")).upper() != "Y":
+                break
+        self.ui.print("Goodbye!")
+        await self.flush()
+
+# Class for the TCP server, one GameSession per connection
+class WumpusServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 7777, seed: int = SEED, speed: float = 1.0,
+                 metrics: Metrics = None, pool: int = 4, wumpuses: int = None):
+        self.host = host
+        self.port = port
+        self.seed = seed
+        self.speed = speed
+        self.metrics = metrics  # optional server-wide Metrics, every finished session is merged into it
+        self.wumpuses = wumpuses    # optional horde size for every difficulty
+        difficulties = DIFFICULTIES if wumpuses is None else horde_difficulties(wumpuses)
+        self.pool = CavePool(difficulties, size = pool, seed = derive_seed(seed, "pool")) if pool else None
+        self.sessions = 0       # sessions started so far
+        self.active = 0         # sessions currently connected
+
+    async def handle(self, reader, writer):
+        metrics = Metrics() if self.metrics is not None else None
+        session = GameSession(reader, writer, derive_seed(self.seed, "session", self.sessions), self.speed, metrics,
+                              self.pool, self.wumpuses)
+        self.sessions += 1
+        self.active += 1
+        try:
+            await session.run()
+        except (EOFError, ConnectionError):
+            pass
+        finally:
+            self.active -= 1
+            writer.close()
+            if metrics is not None:
+                metrics.count("sessions")
+                self.metrics.merge(metrics)
+
+    async def start(self):
+        import asyncio
+        if self.pool is not None and not self.pool.threads:
+            self.pool.start()
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, limit=1024, backlog=1024)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Wumpus server listening on {self.host}:{self.port}")
+        async with self.server:
+            await self.server.serve_forever()
+
+# Runs the server until interrupted, then writes the metrics of all finished sessions to the metrics file
+def run_server(host: str, port: int, speed: float, metrics: str = None, pool: int = 4, wumpuses: int = None):
+    import asyncio
+    server = WumpusServer(host, port, speed = speed, metrics = Metrics() if metrics else None, pool = pool,
+                          wumpuses = wumpuses)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    if server.pool is not None:
+        server.pool.close()
+    if metrics:
+        if server.pool is not None:
+            server.metrics.merge(server.pool.metrics)
+        server.metrics.export(metrics)
 
 # Runs the game if program is run NOT as an imported module
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Hunt the Wumpus")
+    parser.add_argument("--server", action="store_true", help="host games over TCP instead of the terminal")
+    parser.add_argument("--host", default="127.0.0.1", help="server address (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=7777, help="server port (default 7777)")
+    parser.add_argument("--anim-speed", type=float, default=None, help="animation speed factor, 0 disables animations")
+    parser.add_argument("--fast", action="store_true", help="play animations at 4x speed")
+    parser.add_argument("--no-anim", action="store_true", help="disable animations")
+    parser.add_argument("--record", metavar="FILE", default=None, help="append a replay of every round to FILE")
+    parser.add_argument("--metrics", metavar="FILE", default=None,
+                        help="write per-phase turn latency metrics to FILE on exit (.json for JSON, else Prometheus text)")
+    parser.add_argument("--pool", type=int, default=4, metavar="SIZE",
+                        help="caves generated ahead per difficulty in the background, 0 to generate each on demand")
+    parser.add_argument("--script", metavar="FILE", default=None,
+                        help="answer every prompt from FILE (- for stdin) with plain, machine-parsable output")
+    parser.add_argument("--seed", type=int, default=SEED, help="seed for the terminal game's caves (default: random)")
+    parser.add_argument("--wumpuses", type=int, default=None, metavar="N",
+                        help="horde mode: N Wumpuses in every difficulty (default: one Wumpus)")
+    args = parser.parse_args()
+    if args.wumpuses is not None and not 1 <= args.wumpuses <= 16:
+        parser.error("--wumpuses must be 1 to 16, the most a replay records")
+    speed = animation_speed(0 if args.no_anim else FAST_ANIMATIONS if args.fast else args.anim_speed)
+    if args.server:
+        run_server(args.host, args.port, speed, args.metrics, args.pool, args.wumpuses)
+    elif args.script is not None:
+        with (sys.stdin if args.script == "-" else open(args.script)) as script:
+            main(speed, args.record, args.metrics, args.pool, script, args.seed, args.wumpuses)
+    else:
+        main(speed, args.record, args.metrics, args.pool, seed = args.seed, wumpuses = args.wumpuses)
@@ -0,0 +1,1022 @@
+'''
+benchmarks.py
+--------
+Performance measurements for the Wumpus engine
+
+Run all benchmarks:      python benchmarks.py
+Run a single benchmark:  python benchmarks.py headless
+Save results as JSON:    python benchmarks.py phases --json baseline.json
+Flag regressions:        python benchmarks.py phases --compare baseline.json --threshold 0.1
+Correctness checks:      python benchmarks.py --check
+--------
+'''
+
+# --- STANDARD LIBRARY ---
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import deque
+from functools import partial
+
+# --- GAME ---
+import Wumpus
+
+# Metric name -> seconds, filled by benchmarks that report comparable numbers
+RESULTS = {}
+
+def record(name: str, seconds: float):
+    RESULTS[name] = seconds
+
+# ==============================================================
+#                      H E A D L E S S
+# ==============================================================
+# Full games through run_game() with a scripted UI, no console or sleeps
+# ==============================================================
+
+def bench_headless(games: int = 5000):
+    for key, params in Wumpus.DIFFICULTIES.items():
+        turns = 0
+        start = time.perf_counter()
+        for i in range(games):
+            game = Wumpus.WumpusGame(**params, seed = i)
+            Wumpus.run_game(Wumpus.ScriptedUI(Wumpus.random_policy(i)), game)
+            turns += game.turns
+        elapsed = time.perf_counter() - start
+        print(f"headless {key}: {games} games in {elapsed:.2f}s | "
+              f"{games / elapsed:,.0f} games/sec | {turns / elapsed:,.0f} turns/sec")
+
+# ==============================================================
+#                         P H A S E S
+# ==============================================================
+# Seconds per call of every WumpusGame phase from the built-in cave sizes
+# to 10^6 rooms, for both backends, recorded as phases/<backend>/<rooms>/<phase>
+# ==============================================================
+
+PHASE_SIZES = (15, 20, 30, 1_000, 100_000, 1_000_000)
+OBJECT_LIMIT = 100_000    # the Room object graph takes minutes and gigabytes beyond this
+SETUP_PHASES = ("generate_rooms", "connect_rooms", "place_hazards", "place_player")
+ROUNDS = 5                # every case keeps its fastest round, a busy machine only slows some rounds
+
+def bench_phases(sizes: tuple = PHASE_SIZES):
+    for n in sizes:
+        for backend in (Wumpus.WumpusGame, Wumpus.CompactWumpusGame):
+            if backend is Wumpus.WumpusGame and n > OBJECT_LIMIT:
+                continue
+            prefix = f"phases/{backend.__name__}/{n}"
+            calls = max(1, min(5000, 200_000 // n))
+            best = {}
+            def keep(phase: str, seconds: float):
+                best[phase] = min(best.get(phase, seconds), seconds)
+
+            # Cave setup, one build per round
+            rounds = ROUNDS if n <= OBJECT_LIMIT else 1
+            for seed in range(rounds):
+                game = backend(num_rooms = n, seed = seed)
+                game.random_seed()
+                for phase in SETUP_PHASES:
+                    start = time.perf_counter()
+                    getattr(game, phase)()
+                    keep(phase, time.perf_counter() - start)
+            rng = random.Random(n)
+            pairs = [(game.rooms[rng.randrange(n)], game.rooms[rng.randrange(n)]) for _ in range(max(1, calls // 20))]
+            rooms = [game.rooms[rng.randrange(n)] for _ in range(calls)]
+            walk = [rng.randrange(4) for _ in range(calls)]
+            moves = [rng.choice("NESW") for _ in range(calls)]
+
+            for _ in range(rounds):
+                # Shortest paths between random pairs of rooms
+                start = time.perf_counter()
+                for a, b in pairs:
+                    game.find_path(a, b)
+                keep("find_path", (time.perf_counter() - start) / len(pairs))
+
+                # Senses from random rooms
+                start = time.perf_counter()
+                for room in rooms:
+                    game.player.current_room = room
+                    game.sense_environment()
+                keep("sense_environment", (time.perf_counter() - start) / calls)
+
+                # Chasing Wumpus while the player walks, the player is moved without hazard checks
+                game.wumpus_chases = True
+                game.player.current_room = game.safe_rooms[0]
+                elapsed = 0.0
+                for direction in walk:
+                    game.player.current_room = game.player.current_room.connected_rooms[direction]
+                    start = time.perf_counter()
+                    game.wumpus_chase()
+                    elapsed += time.perf_counter() - start
+                keep("wumpus_chase", elapsed / calls)
+
+                # Full headless move turns through step(), hazards included
+                game.wumpus_chases = False
+                game.place_player()
+                elapsed = 0.0
+                for direction in moves:
+                    start = time.perf_counter()
+                    state, events = game.step("M", direction)
+                    elapsed += time.perf_counter() - start
+                    if state != "running":
+                        game.place_player()
+                keep("turn", elapsed / calls)
+
+            for phase, seconds in best.items():
+                record(f"{prefix}/{phase}", seconds)
+            print(f"phases {backend.__name__:>17} n={n:>9,}: " + " | ".join(
+                f"{phase} {seconds * 1e6:,.1f}us" for phase, seconds in best.items()))
+
+# ==============================================================
+#                  C O M P A C T   B A C K E N D
+# ==============================================================
+# Memory and speed of the Room object graph vs CompactWumpusGame
+# ==============================================================
+
+def bench_compact(sizes: tuple = (15, 10_000, 1_000_000)):
+    for n in sizes:
+        for backend in (Wumpus.WumpusGame, Wumpus.CompactWumpusGame):
+            game = backend(num_rooms = n, seed = 1)
+
+            # Build the cave while tracing allocations
+            tracemalloc.start()
+            start = time.perf_counter()
+            game.random_seed()
+            game.generate_rooms()
+            game.connect_rooms()
+            game.place_hazards()
+            game.place_player()
+            build = time.perf_counter() - start
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            # Senses from 1000 random rooms
+            rng = random.Random(n)
+            rooms = [game.rooms[rng.randrange(n)] for _ in range(1000)]
+            start = time.perf_counter()
+            for room in rooms:
+                game.player.current_room = room
+                game.sense_environment()
+            sense = (time.perf_counter() - start) / len(rooms)
+
+            # Shortest paths between 20 random pairs of rooms
+            pairs = [(game.rooms[rng.randrange(n)], game.rooms[rng.randrange(n)]) for _ in range(20)]
+            start = time.perf_counter()
+            for a, b in pairs:
+                game.find_path(a, b)
+            path = (time.perf_counter() - start) / len(pairs)
+
+            print(f"{backend.__name__:>17} n={n:>9,}: build {build:8.3f}s | "
+                  f"{memory / 2**20:9.2f} MiB ({memory / n:6.1f} B/room) | "
+                  f"sense {sense * 1e6:6.2f}us | find_path {path * 1e3:9.3f}ms")
+
+# ==============================================================
+#                  C A V E   G E N E R A T O R
+# ==============================================================
+# regular_cave() from 20 rooms to 10^6 rooms, should grow linearly
+# ==============================================================
+
+def bench_cave(sizes: tuple = (20, 100, 1_000, 10_000, 100_000, 1_000_000)):
+    for n in sizes:
+        repeats = max(1, 100_000 // n)
+        start = time.perf_counter()
+        for seed in range(repeats):
+            Wumpus.regular_cave(n, random.Random(seed))
+        elapsed = (time.perf_counter() - start) / repeats
+        print(f"regular_cave n={n:>9,}: {elapsed * 1e3:10.3f}ms | {elapsed / n * 1e9:7.1f}ns/room")
+
+# ==============================================================
+#                      T O P O L O G I E S
+# ==============================================================
+# Every cave generator in TOPOLOGIES and the validation of its caves
+# (tunnel checks and union-find), with one breadth-first search from a
+# single room for scale: checking connectivity by searching from every
+# room would cost n of those
+# ==============================================================
+
+# Visits every room reachable from start, returns how many
+def full_bfs(adjacency, start: int) -> int:
+    seen = bytearray(len(adjacency) // 4)
+    seen[start] = 1
+    queue = deque([start])
+    while queue:
+        room = queue.popleft()
+        for nearby in adjacency[room * 4:room * 4 + 4]:
+            if nearby >= 0 and not seen[nearby]:
+                seen[nearby] = 1
+                queue.append(nearby)
+    return sum(seen)
+
+def bench_topology(sizes: tuple = (1_000, 100_000, 1_000_000)):
+    for name, generate in Wumpus.TOPOLOGIES.items():
+        for n in (20,) if name == "dodecahedron" else sizes:
+            repeats = max(1, 100_000 // n)
+            timings = {"generate": 0.0, "validate": 0.0, "bfs": 0.0}
+            for seed in range(repeats):
+                start = time.perf_counter()
+                adjacency = generate(n, random.Random(seed))
+                timings["generate"] += time.perf_counter() - start
+                start = time.perf_counter()
+                Wumpus.validate_cave(adjacency)
+                timings["validate"] += time.perf_counter() - start
+                start = time.perf_counter()
+                full_bfs(adjacency, 0)
+                timings["bfs"] += time.perf_counter() - start
+            for phase, seconds in timings.items():
+                record(f"topology/{name}/{phase}/{n}", seconds / repeats)
+            print(f"{name:>12} n={n:>9,}: " + " | ".join(
+                f"{phase} {seconds / repeats * 1e3:9.3f}ms" for phase, seconds in timings.items())
+                + f" | validate {timings['validate'] / repeats / n * 1e9:6.1f}ns/room")
+
+# ==============================================================
+#                          C H A S E
+# ==============================================================
+# Per-turn cost of the HARD chase: path search from the Wumpus every turn
+# vs the lazy distance field rooted at the player
+# ==============================================================
+
+# The pre-ChaseField find_path: every queue entry carries a copy of its whole path
+def path_copying_bfs(adjacency, start: int, goal: int) -> list:
+    queue = deque([[start]])
+    visited = {start}
+    while queue:
+        path = queue.popleft()
+        room = path[-1]
+        if room == goal:
+            return path
+        for nearby in adjacency[room * 4:room * 4 + 4]:
+            if nearby not in visited:
+                visited.add(nearby)
+                queue.append(path + [nearby])
+
+def bench_chase(sizes: tuple = (1_000, 10_000, 100_000, 1_000_000), turns: int = 20):
+    for n in sizes:
+        game = Wumpus.CompactWumpusGame(num_rooms = n, seed = 1)
+        game.setup()
+        rng = random.Random(n)
+        player_walk = [rng.randrange(4) for _ in range(turns)]
+        start_room = game.wumpus_rooms[0].room_id
+
+        # Original approach: path-copying BFS from the Wumpus to the player every turn
+        player = game.player.current_room.room_id
+        wumpus = start_room
+        start = time.perf_counter()
+        for direction in player_walk:
+            player = game.adjacency[player * 4 + direction]
+            path = path_copying_bfs(game.adjacency, wumpus, player)
+            if len(path) > 1:
+                wumpus = path[1]
+        per_copying = (time.perf_counter() - start) / turns
+
+        # Parent-pointer find_path from the Wumpus to the player every turn
+        player = game.player.current_room.room_id
+        wumpus = start_room
+        start = time.perf_counter()
+        for direction in player_walk:
+            player = game.adjacency[player * 4 + direction]
+            path = game.find_path(game.rooms[wumpus], game.rooms[player])
+            if len(path) > 1:
+                wumpus = path[1].room_id
+        per_path = (time.perf_counter() - start) / turns
+
+        # Chase field, refreshed when the player moves, O(1) hop for the Wumpus
+        field = Wumpus.ChaseField(game.adjacency)
+        player = game.player.current_room.room_id
+        wumpus = start_room
+        start = time.perf_counter()
+        for direction in player_walk:
+            player = game.adjacency[player * 4 + direction]
+            if field.root != player:
+                field.refresh(player)
+            step = field.hop(wumpus)
+            if step >= 0:
+                wumpus = step
+        per_field = (time.perf_counter() - start) / turns
+
+        # Wumpus steps while the player stands still, no refresh needed
+        start = time.perf_counter()
+        for _ in range(turns):
+            step = field.hop(wumpus)
+            if step >= 0:
+                wumpus = step
+        per_hop = (time.perf_counter() - start) / turns
+
+        print(f"chase n={n:>9,}: path-copying {per_copying * 1e3:9.3f}ms/turn | "
+              f"find_path {per_path * 1e3:9.3f}ms/turn | "
+              f"field {per_field * 1e3:9.3f}ms/turn | hop {per_hop * 1e6:6.2f}us")
+
+# ==============================================================
+#                          H O R D E
+# ==============================================================
+# Per-turn cost of chasing with many Wumpuses: one find_path per
+# Wumpus vs wumpus_chase(), one distance field shared by all of them
+# ==============================================================
+
+def bench_horde(sizes: tuple = (10_000, 100_000), hordes: tuple = (1, 10, 100), turns: int = 10):
+    for n in sizes:
+        for wumpuses in hordes:
+            game = Wumpus.CompactWumpusGame(num_rooms = n, pit_rate = 0, bat_rate = 0, wumpus_chases = True,
+                                            wumpuses = wumpuses, seed = 1)
+            game.setup()
+            rng = random.Random(n)
+            player_walk = ["NESW"[rng.randrange(4)] for _ in range(turns)]
+
+            # One parent-pointer search from every Wumpus to the player, the path is only computed
+            player = game.player.current_room
+            start = time.perf_counter()
+            for _ in range(turns):
+                for wumpus_room in game.wumpus_rooms:
+                    game.find_path(wumpus_room, player)
+            per_path = (time.perf_counter() - start) / turns
+
+            # The engine's chase: the player moves, then every Wumpus steps along the shared field
+            start = time.perf_counter()
+            for direction in player_walk:
+                game.move(direction)
+                game.wumpus_chase()
+            per_chase = (time.perf_counter() - start) / turns
+            record(f"horde/find_path/{n}/{wumpuses}", per_path)
+            record(f"horde/chase/{n}/{wumpuses}", per_chase)
+            print(f"horde n={n:>9,} wumpuses={wumpuses:>4}: find_path per Wumpus {per_path * 1e3:10.3f}ms/turn | "
+                  f"wumpus_chase {per_chase * 1e3:9.3f}ms/turn")
+
+# ==============================================================
+#                       T U R N   C O S T
+# ==============================================================
+# Headless move turns (no chase) should cost the same at every cave size
+# ==============================================================
+
+def bench_turn(sizes: tuple = (20, 1_000, 10_000, 100_000, 1_000_000), turns: int = 20_000):
+    for n in sizes:
+        game = Wumpus.CompactWumpusGame(num_rooms = n, seed = 1)
+        game.setup()
+        rng = random.Random(n)
+        moves = [rng.choice("NESW") for _ in range(turns)]
+        elapsed = 0.0
+        for direction in moves:
+            start = time.perf_counter()
+            state, events = game.step("M", direction)
+            elapsed += time.perf_counter() - start
+            if state != "running":
+                game.place_player()
+        print(f"turn n={n:>9,}: {elapsed / turns * 1e6:7.2f}us/turn")
+
+# ==============================================================
+#                        T H R E A D S
+# ==============================================================
+# Games on a thread pool must give the same results as a serial run
+# ==============================================================
+
+def bench_threads(games: int = 5000, workers: int = 16):
+    params = Wumpus.DIFFICULTIES["H"]
+    seeds = [Wumpus.derive_seed(1, i) for i in range(games)]
+
+    start = time.perf_counter()
+    serial = [Wumpus.play_headless(params, seed) for seed in seeds]
+    serial_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    threaded = Wumpus.play_many(params, seeds, workers = workers)
+    threaded_time = time.perf_counter() - start
+
+    outcome = lambda game: (game.cause, game.turns, game.player.current_room.room_id)
+    mismatches = sum(outcome(a) != outcome(b) for a, b in zip(serial, threaded))
+    print(f"threads: {games} games serial {games / serial_time:,.0f} games/sec | "
+          f"{workers} threads {games / threaded_time:,.0f} games/sec | {mismatches} mismatches")
+
+# ==============================================================
+#                      A N I M A T I O N
+# ==============================================================
+# Wall-clock time per turn of the full TextUI, with and without animations
+# ==============================================================
+
+# Class for a TextUI rendering into a buffer and answering prompts from a policy
+class BufferedTextUI(Wumpus.TextUI):
+    def __init__(self, policy, speed: float):
+        super().__init__(Wumpus.Console(file = io.StringIO(), width = 120), speed)
+        self.policy = policy
+
+    def answer(self, kind: str) -> str:
+        self.timeline.play()
+        return self.policy(kind)
+
+    def ask_action(self) -> str:
+        return self.answer("action")
+
+    def ask_move_direction(self, room_id: int) -> str:
+        return self.answer("move")
+
+    def ask_shoot_direction(self, iteration: int) -> str:
+        return self.answer("shoot")
+
+def bench_animation(settings: tuple = (("normal", 1.0, 12), ("fast", Wumpus.FAST_ANIMATIONS, 40), ("off", 0.0, 2000))):
+    for name, speed, turns in settings:
+        ui = BufferedTextUI(Wumpus.random_policy(1), speed)
+        played = 0
+        seed = 0
+        start = time.perf_counter()
+        while played < turns:
+            game = Wumpus.WumpusGame(**Wumpus.DIFFICULTIES["N"], seed = seed)
+            Wumpus.run_game(ui, game)
+            ui.timeline.play()
+            played += game.turns
+            seed += 1
+        elapsed = time.perf_counter() - start
+        print(f"animation {name:>6} (speed {speed:g}): {played} turns | {elapsed / played * 1e3:9.2f}ms/turn")
+
+# ==============================================================
+#                          S O L V E R
+# ==============================================================
+# Decisions per second of the belief-state Solver (observe + decide),
+# and its win rate next to the random policy
+# ==============================================================
+
+def bench_solver(games: int = 2000):
+    for key, params in Wumpus.DIFFICULTIES.items():
+        decisions = 0
+        thinking = 0.0
+        wins = 0
+        for i in range(games):
+            game = Wumpus.WumpusGame(**params, seed = i)
+            game.setup()
+            solver = Wumpus.Solver(game)
+            while not game.is_over():
+                start = time.perf_counter()
+                action, directions = solver.hint()
+                thinking += time.perf_counter() - start
+                game.step(action, directions)
+            decisions += solver.decisions
+            wins += game.check_game_state() == "win"
+        random_wins = sum(Wumpus.play_headless(params, i).check_game_state() == "win" for i in range(games))
+        print(f"solver {key}: {decisions / thinking:9,.0f} decisions/sec | {thinking / decisions * 1e6:6.1f}us/decision | "
+              f"win rate {wins / games:6.1%} (random {random_wins / games:6.1%})")
+
+# ==============================================================
+#                          A R R O W S
+# ==============================================================
+# Scoring every shot from a room: the 64 steerings flown one by one
+# vs all of them in one pass with shared prefixes (arrow_outcomes)
+# ==============================================================
+
+# Flies the 64 steerings one by one, 192 steps
+def steering_outcomes(adjacency, room: int, targets) -> bytes:
+    outcomes = []
+    for shot in Wumpus.ARROW_SHOTS:
+        outcome = Wumpus.ARROW_MISS
+        arrow_room = room
+        for direction in shot:
+            arrow_room = adjacency[arrow_room * 4 + Wumpus.DIRECTIONS[direction]]
+            if arrow_room in targets:
+                outcome = Wumpus.ARROW_HIT
+                break
+            if arrow_room == room:
+                outcome = Wumpus.ARROW_SUICIDE
+                break
+        outcomes.append(outcome)
+    return bytes(outcomes)
+
+def bench_arrows(sizes: tuple = (30, 1_000_000), rooms: int = 20_000):
+    for n in sizes:
+        adjacency = Wumpus.regular_cave(n, random.Random(n))
+        rng = random.Random(1)
+        starts = [rng.randrange(n) for _ in range(rooms)]
+        targets = [(rng.randrange(n),) for _ in range(rooms)]
+        for name, score in (("one by one", steering_outcomes), ("batched", Wumpus.arrow_outcomes)):
+            start = time.perf_counter()
+            for room, wumpus in zip(starts, targets):
+                score(adjacency, room, wumpus)
+            elapsed = time.perf_counter() - start
+            record(f"arrows/{n}/{name.replace(' ', '_')}", elapsed / rooms)
+            print(f"arrows {n:>9,} rooms {name:>10}: {elapsed / rooms * 1e6:6.1f}us per room (64 shots)")
+
+# ==============================================================
+#                       S N A P S H O T S
+# ==============================================================
+# Generating a large cave vs saving it once and memory-mapping the
+# snapshot, with the memory each load allocates outside the mapping
+# ==============================================================
+
+def bench_snapshot(sizes: tuple = (10_000, 1_000_000), path: str = "bench_cave.wcs"):
+    for n in sizes:
+        params = dict(Wumpus.DIFFICULTIES["H"], num_rooms = n)
+        start = time.perf_counter()
+        game = Wumpus.CompactWumpusGame(**params, seed = n)
+        game.setup()
+        generate = time.perf_counter() - start
+
+        start = time.perf_counter()
+        Wumpus.save_cave(game, path)
+        save = time.perf_counter() - start
+        size = os.path.getsize(path)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        loaded = Wumpus.load_cave(path)
+        load = time.perf_counter() - start
+        memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        # A few turns on the loaded cave, the snapshot itself is left unchanged
+        for direction in "NESWNESW":
+            if loaded.is_over():
+                break
+            loaded.step("M", direction)
+        os.remove(path)
+        record(f"snapshot/{n}/generate", generate)
+        record(f"snapshot/{n}/load", load)
+        print(f"snapshot {n:>9,} rooms: generate {generate:7.3f}s | save {save:6.3f}s | load {load * 1e3:8.2f}ms | "
+              f"file {size / 1e6:6.1f}MB | allocated on load {memory / 1e6:5.1f}MB")
+
+# ==============================================================
+#                       C A V E   P O O L
+# ==============================================================
+# Time from choosing a difficulty to a fair, set-up game: generating
+# until a cave passes the fairness criteria vs taking one from a
+# CavePool. Each pooled round is a pause (a player at the prompt, the
+# GIL released) or a headless game played back to back
+# ==============================================================
+
+def bench_pool(rounds: int = 500, size: int = 4, pause: float = 0.005):
+    for key, params in Wumpus.DIFFICULTIES.items():
+        start = time.perf_counter()
+        seed = 0
+        for _ in range(rounds):
+            while True:
+                game = Wumpus.WumpusGame(**params, seed = seed)
+                game.setup()
+                seed += 1
+                if Wumpus.unfair_reason(game) is None:
+                    break
+        per_sync = (time.perf_counter() - start) / rounds
+
+        results = []
+        for name in ("prompt", "headless"):
+            pool = Wumpus.CavePool({key: params}, size = size, seed = 1).start()
+            time.sleep(0.1)
+            waiting = 0.0
+            for i in range(rounds):
+                start = time.perf_counter()
+                game = pool.get(params)
+                waiting += time.perf_counter() - start
+                if name == "prompt":
+                    time.sleep(pause)
+                else:
+                    Wumpus.run_game(Wumpus.ScriptedUI(Wumpus.random_policy(i)), game)
+            pool.close()
+            stats = pool.stats()
+            record(f"pool/{key}/{name}", waiting / rounds)
+            results.append(f"{name}: get {waiting / rounds * 1e6:6.1f}us, hit rate {stats['hit_rate']:6.1%}")
+        record(f"pool/{key}/sync", per_sync)
+        print(f"pool {key}: generate until fair {per_sync * 1e6:6.1f}us | " + " | ".join(results)
+              + f" | {stats['caves_per_sec']:,.0f} caves/sec per producer, {stats['rejection_rate']:5.1%} rejected")
+
+# ==============================================================
+#                          B A T C H
+# ==============================================================
+# Game steps per second for K games stepped in lockstep by WumpusBatch,
+# finished games restarted every step, vs K WumpusGame.step calls
+# ==============================================================
+
+def bench_batch(sizes: tuple = (1, 1_000, 100_000), steps: int = 20):
+    params = Wumpus.DIFFICULTIES["H"]
+    codes = list(Wumpus.REPLAY_ACTIONS)
+    for k in sizes:
+        start = time.perf_counter()
+        batch = Wumpus.WumpusBatch(params, k, seed = 1)
+        setup = time.perf_counter() - start
+        rng = random.Random(k)
+        actions = [bytes(rng.choice(codes) if rng.random() < 0.25 else rng.randrange(4) for _ in range(k)) for _ in range(4)]
+
+        # Untimed first steps fill the chase table, a long training run reuses its rows
+        for i in range(steps):
+            batch.restart_finished()
+            batch.step(actions[i % 4])
+        # Finished games are restarted before each step, so every step plays all K games
+        played = 0
+        start = time.perf_counter()
+        for i in range(steps):
+            batch.restart_finished()
+            batch.step(actions[i % 4])
+            played += k
+        elapsed = time.perf_counter() - start
+        record(f"batch/{k}", elapsed / played)
+
+        # The same number of steps through WumpusGame objects, restarted with a new game when finished
+        games = [Wumpus.WumpusGame(**params, seed = Wumpus.derive_seed(1, g)) for g in range(min(k, 1_000))]
+        for game in games:
+            game.setup()
+        decoded = [[Wumpus.REPLAY_ACTIONS[code] for code in row[:len(games)]] for row in actions]
+        single = 0
+        start = time.perf_counter()
+        for i in range(steps):
+            for game, (action, directions) in zip(games, decoded[i % 4]):
+                if game.state == "running":
+                    game.step(action, directions)
+                    single += 1
+        single_elapsed = time.perf_counter() - start
+        print(f"batch K={k:>7,}: setup {setup:6.2f}s | {played / elapsed:10,.0f} game steps/sec "
+              f"({elapsed / played * 1e6:5.2f}us) | WumpusGame.step {single / single_elapsed:10,.0f} steps/sec")
+
+# ==============================================================
+#                     E N V I R O N M E N T
+# ==============================================================
+# WumpusEnv steps per second (reset excluded), and the cost of writing
+# an observation into a preallocated buffer vs building a new list
+# ==============================================================
+
+def bench_env(episodes: int = 2000, observations: int = 200_000):
+    env = Wumpus.WumpusEnv(Wumpus.DIFFICULTIES["H"])
+    rng = random.Random(1)
+    steps = 0
+    stepping = 0.0
+    for episode in range(episodes):
+        env.reset(episode)
+        done = False
+        while not done:
+            action = rng.randrange(4) if rng.random() < 0.8 else rng.randrange(len(Wumpus.ENV_ACTIONS))
+            start = time.perf_counter()
+            _, _, done = env.step(action)
+            stepping += time.perf_counter() - start
+            steps += 1
+    record("env/step", stepping / steps)
+
+    # The observation alone: written item by item into one buffer vs a new list per step
+    game = env.game
+    def fresh_observation():
+        room = game.player.current_room.room_id
+        sensed = game.senses[room]
+        return [sensed & 1, (sensed & 2) >> 1, (sensed & 4) >> 2, room,
+                *game.adjacency[room * 4:room * 4 + 4], game.player.arrows]
+    buffer = env.observation
+    timings = {}
+    for name, observe in (("buffer", partial(env.observe, buffer)), ("new list", fresh_observation)):
+        start = time.perf_counter()
+        for _ in range(observations):
+            observe()
+        timings[name] = (time.perf_counter() - start) / observations
+        tracemalloc.start()
+        observe()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        record(f"env/observe/{name.replace(' ', '_')}", timings[name])
+        print(f"env observe {name:>8}: {timings[name] * 1e6:5.2f}us | peak traced {peak:,} bytes")
+    print(f"env: {steps / stepping:,.0f} steps/sec ({stepping / steps * 1e6:.1f}us per step, reset excluded)")
+
+# ==============================================================
+#                         P L A N N E R
+# ==============================================================
+# Cost of branching a game for tree search: deepcopy vs fork() vs
+# checkpoint()/restore() around one turn, and MCTSPlanner states/sec
+# ==============================================================
+
+def bench_mcts(sizes: tuple = (20, 10_000), copies: int = 2000, games: int = 20, iterations: int = 500):
+    for rooms in sizes:
+        params = dict(Wumpus.DIFFICULTIES["H"], num_rooms = rooms)
+        for backend in (Wumpus.WumpusGame, Wumpus.CompactWumpusGame):
+            game = backend(**params, seed = 1)
+            game.setup()
+            def deep():
+                copy = Wumpus.copy.deepcopy(game)
+                copy.step("M", "N")
+            def forked():
+                copy = game.fork()
+                copy.step("M", "N")
+            def undone():
+                cp = game.checkpoint()
+                game.step("M", "N")
+                game.restore(cp)
+            # deepcopy recurses through the Room graph, so it only runs on small caves
+            branches = (("deepcopy", deep),) if rooms < 1_000 else ()
+            runs = copies if rooms < 1_000 else copies // 100
+            timings = {}
+            for name, branch in branches + (("fork", forked), ("checkpoint", undone)):
+                count = runs if name != "checkpoint" else copies
+                start = time.perf_counter()
+                for _ in range(count):
+                    branch()
+                timings[name] = (time.perf_counter() - start) / count
+                record(f"mcts/{name}/{backend.__name__}/{rooms}", timings[name])
+            game.forget_checkpoints()
+            print(f"branch {backend.__name__:>17} {rooms:>6} rooms: " + " | ".join(
+                f"{name} {seconds * 1e6:9.1f}us" for name, seconds in timings.items()))
+
+    states = 0
+    wins = 0
+    start = time.perf_counter()
+    for seed in range(games):
+        game = Wumpus.WumpusGame(**Wumpus.DIFFICULTIES["H"], seed = seed)
+        game.setup()
+        planner = Wumpus.MCTSPlanner(game, iterations, seed)
+        while not game.is_over():
+            game.step(*planner.plan())
+        states += planner.states
+        wins += game.state == "win"
+    elapsed = time.perf_counter() - start
+    record("mcts/state", elapsed / states)
+    print(f"mcts: {states / elapsed:,.0f} states/sec ({iterations} iterations per turn) | {wins}/{games} games won")
+
+# ==============================================================
+#                          R E P L A Y
+# ==============================================================
+# Replay log size and the cost of recording and verifying games
+# ==============================================================
+
+def bench_replay(games: int = 10_000):
+    params = Wumpus.DIFFICULTIES["N"]
+    seeds = [Wumpus.derive_seed(1, i) for i in range(games)]
+    scripts = []
+    for seed in seeds:
+        game = Wumpus.WumpusGame(**params, seed = seed)
+        game.setup()
+        solver = Wumpus.Solver(game)
+        script = []
+        while not game.is_over():
+            script.append(solver.hint())
+            game.step(*script[-1])
+        scripts.append(script)
+
+    # Same games with and without a recorder attached
+    for name in ("plain", "recorded"):
+        file = io.BytesIO()
+        writer = Wumpus.ReplayWriter(file)
+        start = time.perf_counter()
+        for seed, script in zip(seeds, scripts):
+            game = Wumpus.WumpusGame(**params, seed = seed)
+            game.setup()
+            if name == "recorded":
+                game.recorder = writer
+            for action, directions in script:
+                game.step(action, directions)
+        elapsed = time.perf_counter() - start
+        print(f"replay {name:>8}: {games / elapsed:8,.0f} games/sec")
+
+    data = file.getvalue()
+    for backend in (Wumpus.WumpusGame, Wumpus.CompactWumpusGame):
+        start = time.perf_counter()
+        verified = sum(Wumpus.verify_replay(*record, backend = backend) for record in Wumpus.read_replays(data))
+        elapsed = time.perf_counter() - start
+        print(f"replay verify {backend.__name__:>17}: {verified:,}/{games:,} ok | "
+              f"{games / elapsed * 60:10,.0f} replays/min per core | {len(data) / games:.1f} bytes/game")
+
+# ==============================================================
+#                       R E N D E R I N G
+# ==============================================================
+# Time and bytes per turn for the panel row on a 120x50 terminal:
+# rich Columns rebuilt and printed every turn vs the cached PanelRenderer
+# ==============================================================
+
+def bench_render(turns: int = 2000):
+    game = Wumpus.WumpusGame(**Wumpus.DIFFICULTIES["H"], seed = 1)
+    game.setup()
+    rng = random.Random(1)
+    states = []
+    while len(states) < turns:
+        state, events = game.step("M", rng.choice("NESW"))
+        if state != "running":
+            game.setup()
+        states.append((game.sense_environment(), game.player.current_room.room_id,
+                       game.player.arrows, list(game.player.current_room.connected_rooms)))
+
+    for name in ("columns", "renderer"):
+        file = Wumpus.OutputCounter(io.StringIO())
+        ui = Wumpus.TextUI(Wumpus.Console(file = file, width = 120, height = 50, force_terminal = True), 0)
+        elapsed = 0.0
+        panel_bytes = 0
+        for senses, room, arrows, nearby in states:
+            start = time.perf_counter()
+            written = file.bytes
+            senses_panel = ui.display_senses(senses)
+            status_panel = ui.display_status(room, arrows, nearby)
+            if name == "columns":
+                actions_panel = Wumpus.Panel("[bold white]What do you want to do?[/bold white]\n\n"
+                                             "[bold magenta][M][/bold magenta] Move\n[bold red][S][/bold red] Shoot an arrow",
+                                             expand = False, title = "[bold white]ACTION[/bold white]", border_style = "white", height = 6)
+                ui.console.print(Wumpus.Columns([actions_panel, status_panel, senses_panel], equal = True))
+            else:
+                ui.show_panels(senses_panel, status_panel)
+                ui.timeline.play()
+            elapsed += time.perf_counter() - start
+            panel_bytes += file.bytes - written
+
+            # A turn's worth of log lines between two panel rows
+            ui.console.print(".\n.\n.\nYou are now in room 1\n")
+        print(f"render {name:>8}: {elapsed / turns * 1e3:6.3f}ms/turn | {panel_bytes / turns:7.0f} bytes/turn"
+              + (f" | {ui.renderer.in_place / turns:.0%} in place" if name == "renderer" else ""))
+
+# ==============================================================
+#                        S T A R T U P
+# ==============================================================
+# Cold start in fresh interpreters: importing the engine alone vs the
+# eager rich/asyncio imports of earlier versions, time to the title and
+# first game prompts, and clearing the screen with a process vs escapes
+# ==============================================================
+
+# Best wall time of a fresh "python -c code" over a number of runs
+def cold_run(code: str, runs: int) -> float:
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check = True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+# Best times until the game prints each marker, answering every prompt with ENTER
+def cold_prompts(markers: tuple, runs: int) -> list:
+    best = [float("inf")] * len(markers)
+    for _ in range(runs):
+        start = time.perf_counter()
+        game = subprocess.Popen([sys.executable, "Wumpus.py", "--no-anim"], stdin = subprocess.PIPE,
+                                stdout = subprocess.PIPE, stderr = subprocess.DEVNULL)
+        output = b""
+        for i, marker in enumerate(markers):
+            while marker not in output:
+                output += os.read(game.stdout.fileno(), 65536)
+            best[i] = min(best[i], time.perf_counter() - start)
+            game.stdin.write(b"\n")
+            game.stdin.flush()
+        game.kill()
+        game.wait()
+    return best
+
+def bench_startup(runs: int = 10):
+    eager = "import rich.console, rich.table, rich.text, rich.box, rich.panel, rich.columns, rich.align, asyncio, argparse, concurrent.futures"
+    python = cold_run("pass", runs)
+    engine = cold_run("import Wumpus", runs)
+    before = cold_run(eager + "; import Wumpus", runs)
+    print(f"startup: interpreter {python * 1e3:6.1f}ms | import Wumpus {engine * 1e3:6.1f}ms | "
+          f"with eager rich/asyncio imports {before * 1e3:6.1f}ms")
+
+    title, intro = cold_prompts((b"Press ENTER", b"SKIP INTRO?"), runs)
+    print(f"startup: title prompt {title * 1e3:6.1f}ms | first game prompt {intro * 1e3:6.1f}ms")
+
+    start = time.perf_counter()
+    os.system(f"clear > {os.devnull} 2>&1")
+    process = time.perf_counter() - start
+    buffer = io.StringIO()
+    start = time.perf_counter()
+    buffer.write("\033[H\033[2J\033[3J")
+    escapes = time.perf_counter() - start
+    print(f"startup: clear screen with a process {process * 1e3:6.2f}ms | with escapes {escapes * 1e6:6.2f}us")
+
+# ==============================================================
+#                       P R O F I L I N G
+# ==============================================================
+# Cost of the profiling hooks: the same scripted turns with metrics off
+# (one "is None" check per phase) and on, best of ROUNDS rounds
+# ==============================================================
+
+def bench_metrics(games: int = 2000):
+    params = Wumpus.DIFFICULTIES["N"]
+    scripts = []
+    for seed in range(games):
+        game = Wumpus.WumpusGame(**params, seed = seed)
+        game.setup()
+        solver = Wumpus.Solver(game)
+        script = []
+        while not game.is_over():
+            script.append(solver.hint())
+            game.step(*script[-1])
+        scripts.append(script)
+    turns = sum(map(len, scripts))
+
+    per_turn = {}
+    for name in ("off", "on"):
+        best = float("inf")
+        for _ in range(ROUNDS):
+            metrics = Wumpus.Metrics() if name == "on" else None
+            played = [Wumpus.WumpusGame(**params, seed = seed) for seed in range(games)]
+            for game in played:
+                game.setup()
+                game.metrics = metrics
+            start = time.perf_counter()
+            for game, script in zip(played, scripts):
+                for action, directions in script:
+                    game.step(action, directions)
+            best = min(best, time.perf_counter() - start)
+        per_turn[name] = best / turns
+        record(f"metrics/{name}", per_turn[name])
+    print(f"metrics: off {per_turn['off'] * 1e6:6.2f}us/turn | on {per_turn['on'] * 1e6:6.2f}us/turn | "
+          f"overhead {(per_turn['on'] / per_turn['off'] - 1) * 100:+.0f}% when enabled")
+
+# ==============================================================
+#                           M A I N
+# ==============================================================
+
+BENCHMARKS = {
+    "headless": bench_headless,
+    "phases": bench_phases,
+    "compact": bench_compact,
+    "cave": bench_cave,
+    "topology": bench_topology,
+    "chase": bench_chase,
+    "horde": bench_horde,
+    "turn": bench_turn,
+    "threads": bench_threads,
+    "animation": bench_animation,
+    "solver": bench_solver,
+    "arrows": bench_arrows,
+    "snapshot": bench_snapshot,
+    "pool": bench_pool,
+    "batch": bench_batch,
+    "env": bench_env,
+    "mcts": bench_mcts,
+    "replay": bench_replay,
+    "render": bench_render,
+    "startup": bench_startup,
+    "metrics": bench_metrics,
+}
+
+# ==============================================================
+#                          C H E C K S
+# ==============================================================
+# Correctness sweeps, not timed: python benchmarks.py --check
+# Each check returns a list of failures, the run exits with status 1 if any check fails
+# ==============================================================
+
+# Small procedural caves over many seeds, the smallest ones leave few ways to swap a bad tunnel away
+def check_small_caves(sizes: tuple = (5, 6, 7, 8, 12), seeds: int = 1000) -> list:
+    failures = []
+    for n in sizes:
+        for seed in range(seeds):
+            adjacency = Wumpus.procedural_cave(n, random.Random(seed))
+            try:
+                Wumpus.validate_cave(adjacency)
+            except ValueError as error:
+                failures.append(f"procedural_cave({n}, seed {seed}): {error}")
+                continue
+            for room in range(n):
+                nearby = adjacency[room * 4:room * 4 + 4]
+                if room in nearby or len(set(nearby)) < 4:
+                    failures.append(f"procedural_cave({n}, seed {seed}): room {room} has tunnels {list(nearby)}")
+                    break
+    return failures
+
+CHECKS = {
+    "small_caves": check_small_caves,
+}
+
+# Runs every check, returns the number of failures
+def run_checks(names: list) -> int:
+    failed = 0
+    for name in names:
+        failures = CHECKS[name]()
+        print(f"check {name}: {'ok' if not failures else f'{len(failures)} failures'}")
+        for failure in failures[:10]:
+            print(f"  {failure}")
+        failed += len(failures)
+    return failed
+
+# Prints every metric found in both runs, returns the names that got slower than threshold allows
+def compare(baseline: dict, results: dict, threshold: float) -> list:
+    regressions = []
+    for name in sorted(set(baseline) & set(results)):
+        ratio = results[name] / baseline[name] if baseline[name] > 0 else 1.0
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = "faster"
+        print(f"{name:<55} {baseline[name] * 1e6:14,.2f}us -> {results[name] * 1e6:14,.2f}us {ratio:6.2f}x {flag}")
+    return regressions
+
+def main(argv: list) -> int:
+    parser = argparse.ArgumentParser(description="Performance measurements for the Wumpus engine")
+    parser.add_argument("names", nargs="*", help="benchmarks to run, default all: " + ", ".join(BENCHMARKS))
+    parser.add_argument("--check", action="store_true",
+                        help="run the correctness checks instead of benchmarks: " + ", ".join(CHECKS))
+    parser.add_argument("--json", metavar="FILE", help="write the recorded results to FILE")
+    parser.add_argument("--compare", metavar="FILE", help="compare the recorded results with a baseline FILE")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown that counts as a regression (0.10 = 10%%)")
+    args = parser.parse_args(argv)
+    if args.check:
+        unknown = [name for name in args.names if name not in CHECKS]
+        if unknown:
+            parser.error(f"unknown checks: {', '.join(unknown)}")
+        return 1 if run_checks(args.names or list(CHECKS)) else 0
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    for name in args.names or list(BENCHMARKS):
+        BENCHMARKS[name]()
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": RESULTS}, file, indent=1)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(baseline, RESULTS, args.threshold)
+        print(f"{len(regressions)} regressions over {args.threshold:.0%} in {len(set(baseline) & set(RESULTS))} metrics")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
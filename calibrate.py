@@ -0,0 +1,172 @@
+'''
+calibrate.py
+--------
+Monte Carlo calibration of the EASY/NORMAL/HARD difficulties
+
+Plays many headless games per difficulty with a scripted player policy,
+sharded over a process pool, and reports win rate, mean turns and
+causes of death with 95% confidence intervals.
+
+Games are split into fixed-size shards and every shard derives its game
+seeds from (master seed, difficulty, shard index) only, so the results
+are the same for any number of workers.
+
+Usage: python calibrate.py --games 1000000 --policy random --seed 1 --workers 8
+Policies: a name from POLICIES or "module:function", where function(game, seed)
+returns an answer callable for ScriptedUI
+--------
+'''
+
+# --- STANDARD LIBRARY ---
+import argparse
+import importlib
+import math
+import os
+import random
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+# --- GAME ---
+import Wumpus
+
+# ==============================================================
+#                        P O L I C I E S
+# ==============================================================
+# Each policy is a factory(game, seed) returning a callable(kind) -> answer
+# ==============================================================
+
+def random_player(game, seed: int):
+    return Wumpus.random_policy(seed)
+
+def solver_player(game, seed: int):
+    return Wumpus.solver_policy(game)
+
+POLICIES = {
+    "random": random_player,
+    "solver": solver_player,
+}
+
+# Resolves a policy name or a "module:function" import path
+def load_policy(name: str):
+    if name in POLICIES:
+        return POLICIES[name]
+    module, _, function = name.partition(":")
+    return getattr(importlib.import_module(module), function)
+
+# ==============================================================
+#                        S I M U L A T I O N
+# ==============================================================
+
+SHARD_SIZE = 10_000
+
+# Plays one shard of games, returns integer totals so shards add up exactly
+def run_shard(job: tuple) -> tuple:
+    master_seed, difficulty, shard, games, policy_name, wumpuses = job
+    policy = load_policy(policy_name)
+    params = Wumpus.DIFFICULTIES[difficulty]
+    if wumpuses is not None:
+        params = dict(params, wumpuses = wumpuses)
+    seeds = random.Random(f"{master_seed}:{difficulty}:{shard}")
+
+    wins = 0
+    turns = 0
+    turns_squared = 0
+    causes = Counter()
+    for _ in range(games):
+        seed = seeds.getrandbits(64)
+        game = Wumpus.WumpusGame(**params, seed = seed)
+        game.setup()
+        ui = Wumpus.ScriptedUI(policy(game, seed))
+        while not game.is_over():
+            game.play_turn(ui)
+        if game.check_game_state() == "win":
+            wins += 1
+        turns += game.turns
+        turns_squared += game.turns * game.turns
+        causes[game.cause] += 1
+    return difficulty, games, wins, turns, turns_squared, causes
+
+# Splits games into shards of SHARD_SIZE, the last one may be smaller
+# wumpuses: optional horde size for every difficulty, the games keep their seeds
+def make_jobs(master_seed: int, difficulties: list, games: int, policy_name: str, wumpuses: int = None) -> list:
+    jobs = []
+    for difficulty in difficulties:
+        for shard, first in enumerate(range(0, games, SHARD_SIZE)):
+            jobs.append((master_seed, difficulty, shard, min(SHARD_SIZE, games - first), policy_name, wumpuses))
+    return jobs
+
+# Runs every job over a process pool and sums the shard totals per difficulty
+def calibrate(master_seed: int, difficulties: list, games: int, policy_name: str, workers: int,
+              wumpuses: int = None) -> dict:
+    totals = {d: {"games": 0, "wins": 0, "turns": 0, "turns_squared": 0, "causes": Counter()} for d in difficulties}
+    jobs = make_jobs(master_seed, difficulties, games, policy_name, wumpuses)
+    with Pool(workers) as pool:
+        for difficulty, n, wins, turns, turns_squared, causes in pool.imap_unordered(run_shard, jobs):
+            total = totals[difficulty]
+            total["games"] += n
+            total["wins"] += wins
+            total["turns"] += turns
+            total["turns_squared"] += turns_squared
+            total["causes"].update(causes)
+    return totals
+
+# ==============================================================
+#                        S T A T I S T I C S
+# ==============================================================
+
+Z95 = 1.959964
+
+# Wilson score interval for a proportion
+def wilson(successes: int, n: int) -> tuple:
+    if n == 0:
+        return 0.0, 0.0
+    p = successes / n
+    denominator = 1 + Z95 ** 2 / n
+    centre = (p + Z95 ** 2 / (2 * n)) / denominator
+    margin = Z95 * math.sqrt(p * (1 - p) / n + Z95 ** 2 / (4 * n * n)) / denominator
+    return centre - margin, centre + margin
+
+# Mean with a normal-approximation 95% interval half-width
+def mean_interval(total: int, total_squared: int, n: int) -> tuple:
+    mean = total / n
+    variance = max(0.0, total_squared / n - mean * mean) * n / max(1, n - 1)
+    return mean, Z95 * math.sqrt(variance / n)
+
+# Prints one block per difficulty
+def report(totals: dict):
+    names = {"E": "EASY", "N": "NORMAL", "H": "HARD"}
+    for difficulty, total in totals.items():
+        n = total["games"]
+        low, high = wilson(total["wins"], n)
+        mean, margin = mean_interval(total["turns"], total["turns_squared"], n)
+        print(f"{names.get(difficulty, difficulty)} ({n:,} games)")
+        print(f"  win rate    {total['wins'] / n:7.2%}  [{low:.2%}, {high:.2%}]")
+        print(f"  mean turns  {mean:7.2f}  ± {margin:.2f}")
+        for cause, count in total["causes"].most_common():
+            low, high = wilson(count, n)
+            print(f"  {cause:<13} {count / n:7.2%}  [{low:.2%}, {high:.2%}]")
+
+# ==============================================================
+#                           M A I N
+# ==============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte Carlo calibration of the Wumpus difficulties")
+    parser.add_argument("--games", type=int, default=100_000, help="games per difficulty")
+    parser.add_argument("--difficulty", nargs="+", default=list(Wumpus.DIFFICULTIES), choices=list(Wumpus.DIFFICULTIES))
+    parser.add_argument("--policy", default="random", help="policy name or module:function")
+    parser.add_argument("--seed", type=int, default=1, help="master seed")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--wumpuses", type=int, default=None, metavar="N", help="horde mode: N Wumpuses in every difficulty")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    totals = calibrate(args.seed, args.difficulty, args.games, args.policy, args.workers, args.wumpuses)
+    elapsed = time.perf_counter() - start
+    report(totals)
+    played = sum(total["games"] for total in totals.values())
+    print(f"\n{played:,} games in {elapsed:.1f}s on {args.workers} workers ({played / elapsed:,.0f} games/sec)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+'''
+loadtest.py
+--------
+Load test for the asyncio Wumpus server (python Wumpus.py --server)
+
+Opens many concurrent sessions that play random commands and measures
+turn latency: the time from sending a command to receiving the next prompt.
+Without --port, a server with animations disabled is started in-process.
+
+With --ui, plays the sessions one after another through the terminal
+TextUI instead (ScriptedTextUI, rich rendering included, output to a
+buffer) and measures the time from one action prompt to the next.
+
+Usage: python loadtest.py --sessions 10 100 1000 --turns 50
+       python loadtest.py --ui --sessions 1000
+--------
+'''
+
+# --- STANDARD LIBRARY ---
+import argparse
+import asyncio
+import io
+import random
+import time
+
+# --- GAME ---
+import Wumpus
+
+# Reads from the server until the next prompt (ends with ": "), returns the text
+async def read_prompt(reader) -> str:
+    data = b""
+    while not data.endswith(b": "):
+        chunk = await reader.read(65536)
+        if not chunk:
+            raise EOFError("server closed the session")
+        data += chunk
+    return data.decode(errors="replace")
+
+# Plays random commands for a number of turns, appends turn latencies (seconds)
+async def client(host: str, port: int, turns: int, seed: int, latencies: list):
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port, limit=1 << 20)
+    try:
+        prompt = await read_prompt(reader)
+        played = 0
+        while played < turns:
+            last_line = prompt.rsplit("\n", 1)[-1]
+            if "difficulty" in last_line:
+                answer = rng.choice("ENH")
+            elif "Play again" in last_line:
+                answer = "Y"
+            else:
+                answer = rng.choice(["M " + rng.choice("NESW"),
+                                     "S " + "".join(rng.choice("NESW") for _ in range(3))])
+            start = time.perf_counter()
+            writer.write(answer.encode() + b"\n")
+            await writer.drain()
+            prompt = await read_prompt(reader)
+            if answer[0] in "MS":
+                latencies.append(time.perf_counter() - start)
+                played += 1
+        writer.write(b"Q\n")
+        await writer.drain()
+    finally:
+        writer.close()
+
+# Value at quantile q (0-1) of sorted values
+def percentile(values: list, q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+# Prints throughput and latency percentiles of one load level
+def report(sessions: int, latencies: list, elapsed: float):
+    latencies.sort()
+    print(f"{sessions:>5} sessions: {len(latencies):,} turns in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:,.0f} turns/sec) | latency ms "
+          f"p50 {percentile(latencies, 0.50) * 1e3:.2f} | "
+          f"p90 {percentile(latencies, 0.90) * 1e3:.2f} | "
+          f"p99 {percentile(latencies, 0.99) * 1e3:.2f} | "
+          f"max {latencies[-1] * 1e3:.2f}")
+
+async def run(sessions_list: list, turns: int, host: str, port: int):
+    server = None
+    if port is None:
+        server = Wumpus.WumpusServer("127.0.0.1", 0, seed = 1, speed = 0)
+        await server.start()
+        host, port = server.host, server.port
+
+    for sessions in sessions_list:
+        latencies = []
+        start = time.perf_counter()
+        await asyncio.gather(*(client(host, port, turns, seed, latencies) for seed in range(sessions)))
+        report(sessions, latencies, time.perf_counter() - start)
+
+    if server is not None:
+        server.server.close()
+        await server.server.wait_closed()
+
+# Returns a ScriptedTextUI policy playing random commands for a number of turns, then declining another round
+# Appends the time from each action prompt to the next one in the same round (seconds)
+def ui_policy(seed: int, turns: int, latencies: list):
+    rng = random.Random(seed)
+    played = 0
+    last = None
+    def policy(kind: str) -> str:
+        nonlocal played, last
+        now = time.perf_counter()
+        if kind == "action":
+            if last is not None:
+                latencies.append(now - last)
+            last = now
+            played += 1
+            return rng.choice("MS")
+        if kind in ("move", "shoot"):
+            return rng.choice("NESW")
+        last = None
+        if kind == "welcome":
+            return "Y"
+        if kind == "difficulty":
+            return rng.choice("ENH")
+        return "Y" if played < turns else "N"
+    return policy
+
+# Plays the sessions through the full TextUI, one after another
+def run_ui(sessions_list: list, turns: int):
+    for sessions in sessions_list:
+        latencies = []
+        start = time.perf_counter()
+        for seed in range(sessions):
+            ui = Wumpus.ScriptedTextUI(ui_policy(seed, turns, latencies), io.StringIO())
+            Wumpus.play_session(ui, seed)
+        report(sessions, latencies, time.perf_counter() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the Wumpus server")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--turns", type=int, default=20, help="turns per session")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None, help="existing server port, default: start one in-process")
+    parser.add_argument("--ui", action="store_true", help="drive the terminal TextUI with scripted sessions instead of a server")
+    args = parser.parse_args()
+    if args.ui:
+        run_ui(args.sessions, args.turns)
+    else:
+        asyncio.run(run(args.sessions, args.turns, args.host, args.port))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+'''
+replay.py
+--------
+Records, shows and verifies Wumpus replay files (see R E P L A Y S in Wumpus.py)
+
+A replay is the game's seed, its difficulty parameters and one byte per turn,
+so any recorded game can be re-simulated exactly without a UI. Verifying a
+corpus of replays after an engine change shows every game that now ends
+differently.
+
+Usage: python replay.py record corpus.wrp --games 100000 --policy solver
+       python replay.py verify corpus.wrp --workers 8
+       python replay.py show corpus.wrp --first 5
+Play and record from the terminal: python Wumpus.py --record games.wrp
+--------
+'''
+
+# --- STANDARD LIBRARY ---
+import argparse
+import os
+import random
+import time
+from multiprocessing import Pool
+
+# --- GAME ---
+import Wumpus
+from calibrate import load_policy
+
+# ==============================================================
+#                         R E C O R D
+# ==============================================================
+
+# Plays games with a policy and appends their replays to path
+def record(path: str, games: int, difficulties: list, policy_name: str, master_seed: int):
+    policy = load_policy(policy_name)
+    seeds = random.Random(f"{master_seed}:replays")
+    with open(path, "ab") as file:
+        writer = Wumpus.ReplayWriter(file)
+        for i in range(games):
+            seed = seeds.getrandbits(64)
+            game = Wumpus.WumpusGame(**Wumpus.DIFFICULTIES[difficulties[i % len(difficulties)]], seed = seed)
+            game.recorder = writer
+            game.setup()
+            ui = Wumpus.ScriptedUI(policy(game, seed))
+            while not game.is_over():
+                game.play_turn(ui)
+
+# ==============================================================
+#                         V E R I F Y
+# ==============================================================
+
+CHUNK_SIZE = 10_000
+
+# Verifies one chunk of records, returns (first index, records verified, indices that failed)
+def verify_chunk(job: tuple) -> tuple:
+    first, records = job
+    failed = []
+    for i, (params, seed, actions, outcome) in enumerate(records):
+        try:
+            ok = Wumpus.verify_replay(params, seed, actions, outcome, Wumpus.CompactWumpusGame)
+        except Exception:
+            ok = False
+        if not ok:
+            failed.append(first + i)
+    return first, len(records), failed
+
+# Splits the file into chunks of CHUNK_SIZE records and verifies them over a process pool
+def verify(path: str, workers: int) -> tuple:
+    with open(path, "rb") as file:
+        data = file.read()
+    jobs = []
+    chunk = []
+    for record in Wumpus.read_replays(data):
+        chunk.append(record)
+        if len(chunk) == CHUNK_SIZE:
+            jobs.append((len(jobs) * CHUNK_SIZE, chunk))
+            chunk = []
+    if chunk:
+        jobs.append((len(jobs) * CHUNK_SIZE, chunk))
+
+    verified = 0
+    failed = []
+    with Pool(workers) as pool:
+        for first, n, bad in pool.imap_unordered(verify_chunk, jobs):
+            verified += n
+            failed.extend(bad)
+    return verified, sorted(failed)
+
+# ==============================================================
+#                           S H O W
+# ==============================================================
+
+# Prints records first to first + count as readable text
+def show(path: str, first: int, count: int):
+    with open(path, "rb") as file:
+        data = file.read()
+    for i, (params, seed, actions, outcome) in enumerate(Wumpus.read_replays(data)):
+        if i < first:
+            continue
+        if i >= first + count:
+            break
+        turns = " ".join(f"{action}{directions}" for action, directions in (Wumpus.REPLAY_ACTIONS[code] for code in actions))
+        result = "unfinished" if outcome is None else f"{outcome[0]} ({outcome[1]}) in room {outcome[2]}"
+        print(f"#{i} seed {seed} | {params} | {len(actions)} turns: {turns} | {result}")
+
+# ==============================================================
+#                           M A I N
+# ==============================================================
+
+def main():
+    parser = argparse.ArgumentParser(description="Record, show and verify Wumpus replays")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    recorder = commands.add_parser("record", help="play headless games and append their replays")
+    recorder.add_argument("file")
+    recorder.add_argument("--games", type=int, default=100_000)
+    recorder.add_argument("--difficulty", nargs="+", default=list(Wumpus.DIFFICULTIES), choices=list(Wumpus.DIFFICULTIES))
+    recorder.add_argument("--policy", default="random", help="policy name or module:function, see calibrate.py")
+    recorder.add_argument("--seed", type=int, default=1, help="master seed")
+
+    verifier = commands.add_parser("verify", help="re-simulate every replay and compare the outcome")
+    verifier.add_argument("file")
+    verifier.add_argument("--workers", type=int, default=os.cpu_count())
+
+    shower = commands.add_parser("show", help="print replays as text")
+    shower.add_argument("file")
+    shower.add_argument("--first", type=int, default=0)
+    shower.add_argument("--count", type=int, default=10)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "record":
+        record(args.file, args.games, args.difficulty, args.policy, args.seed)
+        elapsed = time.perf_counter() - start
+        print(f"{args.games:,} games recorded in {elapsed:.1f}s ({os.path.getsize(args.file):,} bytes in {args.file})")
+    elif args.command == "verify":
+        verified, failed = verify(args.file, args.workers)
+        elapsed = time.perf_counter() - start
+        print(f"{verified:,} replays verified in {elapsed:.1f}s on {args.workers} workers "
+              f"({verified / elapsed * 60:,.0f} per minute) | {len(failed)} mismatches")
+        if failed:
+            print("first mismatches:", ", ".join(f"#{i}" for i in failed[:20]))
+    else:
+        show(args.file, args.first, args.count)
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,18 @@
 import os
 import shutil
+import sys
 
+# Clears the terminal with escape codes (erase screen and scrollback, cursor home)
+# instead of starting a "clear" process, the old Windows console still needs "cls"
 def clear_screen():
-	if os.name == "nt":
+	if os.name == "nt" and "WT_SESSION" not in os.environ:
 		os.system("cls")
-	else:
-		os.system("clear")
+	elif sys.stdout.isatty():
+		sys.stdout.write("\033[H\033[2J\033[3J")
+		sys.stdout.flush()
 
-def main():
+# read: answers the "Press ENTER" prompt like input(), clear: clear the terminal first
+def main(read=input, clear=True):
 	# Title
 	title_lines = [
 		r" /$$      /$$ /$$   /$$ /$$      /$$ /$$$$$$$  /$$   /$$  /$$$$$$ ",
@@ -46,7 +51,8 @@ def main():
 	else:
 		top_padding = (term_height - total_lines) // 2
 
-	clear_screen()
+	if clear:
+		clear_screen()
 
 	# Print top padding
 	for _ in range(top_padding):
@@ -57,9 +63,8 @@ def main():
 		print(line)
 
 	print()
-	print(" " * ((term_width - 32) // 2) + "Press ENTER to start...", end="")
 	try:
-		input()
+		read(" " * ((term_width - 32) // 2) + "Press ENTER to start...")
 	except EOFError:
 		pass
 